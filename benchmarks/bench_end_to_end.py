@@ -0,0 +1,463 @@
+"""Load-test the /reel pipeline offline against a fake Bot API and a fake Instagram origin
+
+Usage: python benchmarks/bench_end_to_end.py [sample.mp4] [--requests N] [--batch N] [--concurrency N]
+                                             [--unique N] [--extractor fake|generic]
+                                             [--command reel|info|audio|inline]
+                                             [--upload-failures FRACTION] [--carousel N] [--origin-latency MS]
+                                             [--local-bot-api]
+
+Synthetic /reel (or /info, /audio) updates are fed to InstaReelBot.reel_command
+(info_command, audio_command).
+With ``--command inline`` every link is queried inline twice: the first
+round gets placeholders and queues background prefetches, the second is
+answered from the cached file_ids once the prefetches are done.
+``--upload-failures`` makes that fraction of media uploads fail with a 502
+or a 429 with retry_after, to exercise the upload retries. ``--carousel N``
+turns every link into an N-item post alternating videos and photos, and
+``--origin-latency`` delays every origin response like a distant CDN would
+(compare CAROUSEL_PARALLELISM=1 with the default). ``--local-bot-api``
+points BOT_API_BASE_URL at the fake server, which then accepts file://
+uploads the way a telegram-bot-api server in --local mode does (try it with
+a low TELEGRAM_UPLOAD_LIMIT_MB to see transcodes disappear). Its Bot talks
+to a local fake Bot API server that answers sendMessage/sendVideo/... with
+plausible messages (including file_ids, so the reel cache works), and media
+is served by a local HTTP origin. Extraction is replaced by an injected
+extractor that resolves reel URLs to the origin (``fake``), or by yt-dlp's
+generic extractor pointed at the origin (``generic``). No network access is
+needed, so this can run in CI.
+
+Reports throughput, end-to-end latency percentiles, peak RSS (this process
+and its ffmpeg children) and peak disk usage of TEMP_DIR.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.web  # noqa: E402
+from telegram import Bot, Update  # noqa: E402
+
+from metrics import REGISTRY  # noqa: E402
+from thumbnails import probe_duration  # noqa: E402
+
+TOKEN = '123456:BENCHMARK'
+CHAT = {'id': 1000, 'type': 'private', 'first_name': 'Bench'}
+
+
+def make_sample(path, duration=15):
+    # +faststart puts the moov atom first, like Instagram's progressive MP4s
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=duration={duration}:size=720x1280:rate=30',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart', path, '-y'
+    ], check=True)
+
+
+def make_photo():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (1080, 1350), (200, 120, 40)).save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class FakeBotApi(tornado.web.RequestHandler):
+    """Answers Bot API methods with the minimum PTB needs to build Message objects"""
+
+    message_ids = itertools.count(1)
+    file_ids = itertools.count(1)
+    calls = {}
+    bytes_received = 0
+    local_bytes = 0
+    failure_rate = 0.0
+
+    def message(self, **fields):
+        return dict(message_id=next(self.message_ids), date=int(time.time()), chat=CHAT, **fields)
+
+    def file(self, **fields):
+        n = next(self.file_ids)
+        return dict(file_id=f'file-{n}', file_unique_id=f'unique-{n}', **fields)
+
+    def local_files(self):
+        """Paths of file:// uploads, which a local-mode server reads from its own disk"""
+        values = [self.get_body_argument(name, '') for name in ('video', 'photo', 'audio')]
+        values += [item['media'] for item in json.loads(self.get_body_argument('media', '[]'))]
+        return [urllib.parse.unquote(urllib.parse.urlparse(value).path) for value in values
+                if isinstance(value, str) and value.startswith('file://')]
+
+    def post(self, method):
+        cls = type(self)
+        cls.calls[method] = cls.calls.get(method, 0) + 1
+        cls.bytes_received += len(self.request.body)
+        for path in self.local_files():
+            if not os.path.exists(path):
+                self.set_status(400)
+                self.write({'ok': False, 'error_code': 400, 'description': f'Bad Request: file {path} not found'})
+                return
+            cls.local_bytes += os.path.getsize(path)
+
+        if method in ('sendVideo', 'sendPhoto', 'sendAudio', 'sendMediaGroup') and random.random() < cls.failure_rate:
+            cls.calls['failed'] = cls.calls.get('failed', 0) + 1
+            if random.random() < 0.5:
+                self.set_status(502)
+                self.write({'ok': False, 'error_code': 502, 'description': 'Bad Gateway'})
+            else:
+                self.set_status(429)
+                self.write({'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                            'parameters': {'retry_after': 1}})
+            return
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method == 'sendVideo':
+            result = self.message(video=self.file(width=720, height=1280, duration=15))
+        elif method == 'sendPhoto':
+            result = self.message(photo=[self.file(width=720, height=1280)])
+        elif method == 'sendAudio':
+            result = self.message(audio=self.file(duration=15, performer=self.get_body_argument('performer', ''),
+                                                  title=self.get_body_argument('title', '')))
+        elif method == 'sendMediaGroup':
+            media = json.loads(self.get_body_argument('media', '[]'))
+            result = [
+                self.message(video=self.file(width=720, height=1280, duration=15)) if item['type'] == 'video'
+                else self.message(photo=[self.file(width=720, height=1280)])
+                for item in media
+            ]
+        elif method in ('deleteMessage', 'answerInlineQuery'):
+            result = True
+        else:
+            result = self.message(text=self.get_body_argument('text', ''))
+        self.write({'ok': True, 'result': result})
+
+    def get(self, method):
+        # The real Bot API accepts GET too; the local server probe uses it
+        self.post(method)
+
+
+class MediaOrigin(tornado.web.RequestHandler):
+    """Stands in for Instagram's CDN: .jpg paths serve a photo, every other path the sample video"""
+
+    sample = None
+    photo = None
+    latency = 0.0
+    bytes_served = 0
+
+    async def get(self, path):
+        await asyncio.sleep(self.latency)
+        body = self.photo if path.endswith('.jpg') else self.sample
+        self.set_header('Content-Type', 'image/jpeg' if path.endswith('.jpg') else 'video/mp4')
+        self.write(body)
+        type(self).bytes_served += len(body)
+
+
+class FakeExtractor:
+    """What download_reel needs from a YoutubeDL, resolving every reel to the origin"""
+
+    def __init__(self, origin, duration, carousel=0):
+        self.origin = origin
+        self.duration = duration
+        self.carousel = carousel
+        self.params = {}
+
+    def extract_info(self, url, download=False):
+        shortcode = url.rstrip('/').split('/')[-1]
+        if self.carousel:
+            # Shaped like yt-dlp's Instagram playlists: photo items have no formats, only thumbnails
+            entries = [
+                self.video(f'{shortcode}-{i}') if i % 2 else
+                {'id': f'{shortcode}-{i}', 'formats': [], 'thumbnail': f'{self.origin}/{shortcode}-{i}.jpg'}
+                for i in range(1, self.carousel + 1)
+            ]
+            return dict(self.video(shortcode), _type='playlist', entries=entries, url=None, duration=None)
+        return self.video(shortcode)
+
+    def video(self, shortcode):
+        return {
+            'id': shortcode,
+            'url': f'{self.origin}/{shortcode}.mp4',
+            'ext': 'mp4',
+            'protocol': 'http',
+            'duration': self.duration,
+            'description': f'Benchmark reel {shortcode}',
+            'like_count': 42,
+            'uploader': 'benchmark',
+            'webpage_url': f'https://www.instagram.com/p/{shortcode}/',
+        }
+
+
+class GenericExtractor:
+    """Real yt-dlp, generic extractor, with reel URLs rewritten to the origin"""
+
+    def __init__(self, origin, base_opts):
+        import yt_dlp
+        self.origin = origin
+        # The bot only loads the Instagram extractors (YTDLP_EXTRACTORS)
+        self.ydl = yt_dlp.YoutubeDL(dict(base_opts, allowed_extractors=['generic'], force_generic_extractor=True))
+
+    def extract_info(self, url, download=False):
+        shortcode = url.rstrip('/').split('/')[-1]
+        info = self.ydl.extract_info(f'{self.origin}/{shortcode}.mp4', download=download)
+        return dict(info, id=shortcode)
+
+    @property
+    def params(self):
+        return self.ydl.params
+
+    def process_info(self, info):
+        return self.ydl.process_info(info)
+
+    def prepare_filename(self, info):
+        return self.ydl.prepare_filename(info)
+
+
+class InjectedExtractors:
+    """Drop-in for ExtractorPool that hands out benchmark extractors"""
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    @contextmanager
+    def checkout(self, profile=None, cookies=None):
+        yield self.factory()
+
+    def warm_up(self, extractors=()):
+        pass
+
+    def invalidate(self, profile):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_update(update_id, bot, urls, command='reel'):
+    text = f'/{command} ' + ' '.join(urls)
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': CHAT,
+            'from': {'id': 2000 + update_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command) + 1}],
+        },
+    }, bot)
+
+
+def make_inline_update(update_id, bot, url):
+    return Update.de_json({
+        'update_id': update_id,
+        'inline_query': {
+            'id': str(update_id),
+            'from': {'id': 2000 + update_id, 'is_bot': False, 'first_name': 'Bench'},
+            'query': url,
+            'offset': '',
+        },
+    }, bot)
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed while walking
+    return total
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run(args, workdir, sample):
+    with open(sample, 'rb') as f:
+        MediaOrigin.sample = f.read()
+    MediaOrigin.photo = make_photo()
+    MediaOrigin.latency = args.origin_latency / 1000
+    try:
+        duration = probe_duration(sample) or args.duration
+    except FileNotFoundError:
+        duration = args.duration  # No ffprobe; the bot will skip thumbnails too
+
+    api = tornado.web.Application([(r'/bot[^/]+/(\w+)', FakeBotApi)]).listen(0, address='127.0.0.1')
+    origin = tornado.web.Application([(r'/(.*)', MediaOrigin)]).listen(0, address='127.0.0.1')
+    api_port = next(iter(api._sockets.values())).getsockname()[1]
+    origin_url = f'http://127.0.0.1:{next(iter(origin._sockets.values())).getsockname()[1]}'
+
+    # Imported after the environment is set up, so the bot picks it up
+    from main import InstaReelBot
+
+    if args.local_bot_api:
+        os.environ['BOT_API_BASE_URL'] = f'http://127.0.0.1:{api_port}'
+    bot_app = InstaReelBot(TOKEN)
+    if args.extractor == 'generic':
+        base_opts = bot_app.extractors.base_opts
+        bot_app.extractors = InjectedExtractors(lambda: GenericExtractor(origin_url, base_opts))
+    else:
+        bot_app.extractors = InjectedExtractors(lambda: FakeExtractor(origin_url, duration, args.carousel))
+
+    # The same request setup the bot gives its Application
+    if args.local_bot_api and await asyncio.to_thread(bot_app.configure_bot_api):
+        bot = Bot(TOKEN, request=bot_app.make_request(), **bot_app.bot_api_options())
+    else:
+        bot = Bot(TOKEN, base_url=f'http://127.0.0.1:{api_port}/bot', request=bot_app.make_request())
+    await bot.initialize()
+
+    peak_disk = 0
+    done = asyncio.Event()
+
+    async def sample_disk():
+        nonlocal peak_disk
+        while not done.is_set():
+            peak_disk = max(peak_disk, dir_size(workdir))
+            await asyncio.sleep(0.05)
+
+    latencies = []
+    slots = asyncio.Semaphore(args.concurrency)
+
+    if args.command == 'inline':
+        prefetchers = [asyncio.create_task(bot_app.prefetch_loop(bot)) for _ in range(bot_app.prefetch_workers)]
+
+        async def inline_round(offset):
+            async def query(i):
+                async with slots:
+                    url = f'https://www.instagram.com/reel/BENCH{i % args.unique:06d}/'
+                    update = make_inline_update(offset + i, bot, url)
+                    start = time.perf_counter()
+                    await bot_app.inline_query(update, type('Context', (), {'bot': bot})())
+                    return time.perf_counter() - start
+            return sorted(await asyncio.gather(*(query(i) for i in range(args.requests))))
+
+        start = time.perf_counter()
+        pending = await inline_round(0)
+        await bot_app.prefetch_queue.join()
+        prefetch_elapsed = time.perf_counter() - start
+        cached = await inline_round(args.requests)
+        for task in prefetchers:
+            task.cancel()
+        print(f"requests={args.requests} unique={args.unique} command=inline")
+        for label, values in (('placeholder', pending), ('cached', cached)):
+            print(f"{label:<12} p50={percentile(values, 0.50) * 1000:8.1f}ms p95={percentile(values, 0.95) * 1000:8.1f}ms "
+                  f"p99={percentile(values, 0.99) * 1000:8.1f}ms")
+        print(f"prefetch of {args.unique} reels finished in {prefetch_elapsed:.2f}s")
+        print(f"Bot API calls: {dict(sorted(FakeBotApi.calls.items()))}")
+        print(f"Cache: {bot_app.reel_cache.stats()}")
+        await bot.shutdown()
+        api.stop()
+        origin.stop()
+        bot_app.download_pool.shutdown()
+        bot_app.reel_cache.close()
+        bot_app.cookie_store.close()
+        return
+
+    async def one(i):
+        async with slots:
+            urls = [f'https://www.instagram.com/reel/BENCH{(i * args.batch + j) % args.unique:06d}/'
+                    for j in range(args.batch)]
+            update = make_update(i, bot, urls, args.command)
+            context = type('Context', (), {'bot': bot, 'args': update.message.text.split()[1:]})()
+            start = time.perf_counter()
+            handler = {'info': bot_app.info_command, 'audio': bot_app.audio_command}.get(args.command, bot_app.reel_command)
+            await handler(update, context)
+            latencies.append(time.perf_counter() - start)
+
+    sampler = asyncio.create_task(sample_disk())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampler
+
+    cache_stats = bot_app.reel_cache.stats()
+    await bot.shutdown()
+    api.stop()
+    origin.stop()
+    bot_app.download_pool.shutdown()
+    bot_app.reel_cache.close()
+    bot_app.cookie_store.close()
+
+    latencies.sort()
+    rss_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"requests={args.requests} batch={args.batch} concurrency={args.concurrency} unique={args.unique} "
+          f"extractor={args.extractor} command={args.command} carousel={args.carousel}")
+    print(f"throughput={args.requests / elapsed:8.2f} req/s  elapsed={elapsed:.2f}s")
+    print(f"latency p50={percentile(latencies, 0.50) * 1000:8.1f}ms p95={percentile(latencies, 0.95) * 1000:8.1f}ms "
+          f"p99={percentile(latencies, 0.99) * 1000:8.1f}ms")
+    # The children peak includes generating the sample clip; pass a sample to leave it out
+    print(f"peak RSS self={rss_self:.1f}MiB children={rss_children:.1f}MiB  peak disk={peak_disk / 1024 / 1024:.1f}MiB")
+    print(f"Bot API calls: {dict(sorted(FakeBotApi.calls.items()))}, uploaded {FakeBotApi.bytes_received / 1024 / 1024:.1f}MiB, "
+          f"handed over by path {FakeBotApi.local_bytes / 1024 / 1024:.1f}MiB, "
+          f"downloaded {MediaOrigin.bytes_served / 1024 / 1024:.1f}MiB")
+    print(f"Cache: {cache_stats}")
+    decisions = REGISTRY.get('reel_format_decisions')._values
+    if decisions:
+        print(f"Format decisions: {dict(sorted((key[0], count) for key, count in decisions.items()))}")
+    attempts = REGISTRY.get('telegram_upload_attempts')._values
+    outcomes = {}
+    for (kind, outcome), count in attempts.items():
+        outcomes[outcome] = outcomes.get(outcome, 0) + count
+    finished = outcomes.get('success', 0) + outcomes.get('failed', 0) + outcomes.get('deadline', 0)
+    if finished:
+        print(f"Uploads: {dict(sorted(outcomes.items()))}, success rate {outcomes.get('success', 0) / finished:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sample', nargs='?', help='MP4 to serve; a test clip is generated if omitted')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--unique', type=int, default=None, help='distinct reels (default: every request is new)')
+    parser.add_argument('--batch', type=int, default=1, help='reel links per /reel message')
+    parser.add_argument('--extractor', choices=('fake', 'generic'), default='fake')
+    parser.add_argument('--command', choices=('reel', 'info', 'audio', 'inline'), default='reel')
+    parser.add_argument('--upload-failures', type=float, default=0.0,
+                        help='fraction of media uploads the fake Bot API fails (502 or 429)')
+    parser.add_argument('--local-bot-api', action='store_true', help='upload by file path as with a local server')
+    parser.add_argument('--carousel', type=int, default=0, help='items per post (0 = single reels)')
+    parser.add_argument('--origin-latency', type=float, default=0, help='delay of every origin response in ms')
+    parser.add_argument('--duration', type=int, default=15, help='length of the generated clip in seconds')
+    parser.add_argument('--workers', type=int, default=4, help='MAX_CONCURRENT_DOWNLOADS')
+    args = parser.parse_args()
+    args.unique = args.unique or args.requests * args.batch
+    FakeBotApi.failure_rate = args.upload_failures
+
+    with tempfile.TemporaryDirectory() as workdir:
+        sample = args.sample
+        if not sample:
+            sample = os.path.join(workdir, 'sample.mp4')
+            make_sample(sample, args.duration)
+
+        scratch = os.path.join(workdir, 'bot')
+        os.makedirs(scratch)
+        os.environ.update({
+            'TEMP_DIR': scratch,
+            'METRICS_PORT': '0',
+            'MAX_CONCURRENT_DOWNLOADS': str(args.workers),
+            'MAX_DOWNLOADS_PER_USER': str(args.requests * args.batch),
+            'DOWNLOAD_QUEUE_SIZE': str(args.requests * args.batch),
+            'BATCH_MAX_URLS': str(args.batch),
+            'IG_RATE_PER_MINUTE': str(60 * 1000),
+            'IG_RATE_BURST': str(args.requests * args.batch),
+            'NO_PROXY': '127.0.0.1,localhost',
+            'CACHE_CHAT_ID': str(CHAT['id']),
+            'INLINE_PREFETCH_QUEUE_SIZE': str(args.requests),
+        })
+        asyncio.run(run(args, scratch, sample))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Measure per-request yt-dlp setup overhead with and without the extractor pool
+
+Usage: python benchmarks/bench_extractor_setup.py [--requests N] [--cookies N]
+
+Each simulated request gets a YoutubeDL ready to extract an Instagram URL:
+its Instagram extractor instantiated, its request handlers built and, for
+the cookie profile, N cookies loaded into its jar. The "fresh" path loads
+them from a cookies.txt file the way download_reel used to; the pooled path
+gets them pre-parsed from the cookie store. No network requests are made.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import yt_dlp  # noqa: E402
+
+from cookie_store import parse_netscape_cookies  # noqa: E402
+from extractor_pool import ANONYMOUS, ExtractorPool  # noqa: E402
+
+BASE_OPTS = {'format': 'best', 'quiet': True, 'no_warnings': True}
+
+
+def write_cookie_file(path, count):
+    with open(path, 'w') as f:
+        f.write('# Netscape HTTP Cookie File\n')
+        for i in range(count):
+            f.write(f".instagram.com\tTRUE\t/\tTRUE\t{int(time.time()) + 86400}\tcookie_{i}\tvalue_{i}\n")
+
+
+def prepare(ydl):
+    """The setup work a request pays before extract_info starts talking to Instagram"""
+    ydl.get_info_extractor('Instagram')
+    ydl._request_director  # Built lazily on first request
+    return ydl.cookiejar
+
+
+def fresh(cookiefile):
+    opts = dict(BASE_OPTS)
+    if cookiefile:
+        opts['cookiefile'] = cookiefile
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        prepare(ydl)
+
+
+def measure(label, func, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{label:<24} mean={statistics.mean(timings) * 1000:7.2f}ms "
+          f"p50={timings[len(timings) // 2] * 1000:7.2f}ms p99={timings[int(len(timings) * 0.99)] * 1000:7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--cookies', type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cookiefile = os.path.join(workdir, 'cookies.txt')
+        write_cookie_file(cookiefile, args.cookies)
+
+        pool = ExtractorPool(BASE_OPTS)
+
+        with open(cookiefile) as f:
+            cookies = parse_netscape_cookies(f.read())
+
+        def pooled(profile, jar):
+            with pool.checkout(profile, jar) as ydl:
+                prepare(ydl)
+
+        for profile, path, jar in ((ANONYMOUS, None, None), ('user:1', cookiefile, cookies)):
+            print(f"Profile {profile}:")
+            measure('  fresh YoutubeDL', lambda: fresh(path), args.requests)
+            measure('  pooled checkout', lambda: pooled(profile, jar), args.requests)
+
+        print(f"Pool stats: {pool.stats()}")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
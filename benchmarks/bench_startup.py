@@ -0,0 +1,174 @@
+"""Measure cold-start time to first response in webhook mode, with and without FAST_START
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--api-latency MS] [--modes standard,fast]
+
+Each run starts ``main.py`` in a fresh process in webhook mode, pointed at a
+local fake Bot API, and immediately starts delivering a /start update to its
+webhook the way Telegram does after a scale-to-zero host wakes up: retrying
+until the port accepts it. Reported per mode:
+
+- listen: process spawn until the webhook acknowledged the update
+- response: process spawn until the bot's reply (sendMessage) reached the Bot API
+- import: time to import main in the child, which includes no yt-dlp or numpy
+
+No network access is needed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.httpclient  # noqa: E402
+import tornado.web  # noqa: E402
+
+from bench_end_to_end import CHAT, TOKEN, FakeBotApi  # noqa: E402
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+
+# Runs main.py as __main__ with the Bot API base URL pointed at the fake server
+CHILD = """
+import os, runpy, sys, time
+started = time.perf_counter()
+sys.path.insert(0, os.path.dirname(os.environ['BENCH_MAIN']))
+import main
+print(f"import {(time.perf_counter() - started) * 1000:.1f}", file=sys.stderr, flush=True)
+from telegram.ext import ApplicationBuilder
+build = ApplicationBuilder.build
+ApplicationBuilder.build = lambda self: build(self.base_url(os.environ['BENCH_BOT_API']))
+runpy.run_path(os.environ['BENCH_MAIN'], run_name='__main__')
+"""
+
+START_UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1, 'date': 0, 'chat': CHAT, 'text': '/start',
+        'from': {'id': CHAT['id'], 'is_bot': False, 'first_name': 'Bench'},
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    },
+}
+
+
+class StartupBotApi(FakeBotApi):
+    """FakeBotApi plus the webhook methods and a round-trip delay, noting when the first reply arrives"""
+
+    replied = None
+    latency = 0.0
+
+    async def post(self, method):
+        cls = type(self)
+        await asyncio.sleep(cls.latency)
+        if method in ('setWebhook', 'deleteWebhook'):
+            self.write({'ok': True, 'result': True})
+        elif method == 'getWebhookInfo':
+            self.write({'ok': True, 'result': {'url': '', 'has_custom_certificate': False,
+                                               'pending_update_count': 0}})
+        else:
+            if method == 'sendMessage' and cls.replied is None:
+                cls.replied = time.perf_counter()
+            super().post(method)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def deliver(url, update, timeout):
+    """POST the update until the webhook accepts it, like Telegram retrying a sleeping host"""
+    client = tornado.httpclient.AsyncHTTPClient()
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.fetch(url, method='POST', body=json.dumps(update),
+                                          headers={'Content-Type': 'application/json'}, request_timeout=5)
+            if response.code == 200:
+                return time.perf_counter()
+        except (OSError, tornado.httpclient.HTTPClientError):
+            pass
+        await asyncio.sleep(0.005)
+    raise TimeoutError(f"Webhook at {url} never accepted the update")
+
+
+async def run_once(fast, api_port, workdir, timeout=30):
+    StartupBotApi.replied = None
+    port = free_port()
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        PORT=str(port),
+        WEBHOOK_URL=f'http://127.0.0.1:{port}',
+        FAST_START='1' if fast else '0',
+        TEMP_DIR=workdir,
+        METRICS_PORT='0',
+        BENCH_MAIN=MAIN,
+        BENCH_BOT_API=f'http://127.0.0.1:{api_port}/bot',
+    )
+    env.pop('RENDER_SERVICE_NAME', None)
+    started = time.perf_counter()
+    child = subprocess.Popen([sys.executable, '-c', CHILD], env=env, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, text=True)
+    try:
+        acknowledged = await deliver(f'http://127.0.0.1:{port}/webhook', START_UPDATE, timeout)
+        deadline = time.perf_counter() + timeout
+        while StartupBotApi.replied is None:
+            if time.perf_counter() > deadline:
+                raise TimeoutError("The bot never answered /start")
+            await asyncio.sleep(0.002)
+        replied = StartupBotApi.replied
+    finally:
+        child.send_signal(signal.SIGTERM)
+        try:
+            _, stderr = child.communicate(timeout=15)
+        except subprocess.TimeoutExpired:
+            child.kill()
+            _, stderr = child.communicate()
+
+    import_ms = next((float(line.split()[1]) for line in stderr.splitlines() if line.startswith('import ')), None)
+    return (acknowledged - started) * 1000, (replied - started) * 1000, import_ms
+
+
+async def run(args):
+    StartupBotApi.latency = args.api_latency / 1000
+    api = tornado.web.Application([(r'/bot[^/]+/(\w+)', StartupBotApi)]).listen(0, address='127.0.0.1')
+    api_port = next(iter(api._sockets.values())).getsockname()[1]
+
+    results = {}
+    for mode in args.modes:
+        samples = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory(prefix='bench-startup-') as workdir:
+                samples.append(await run_once(mode == 'fast', api_port, workdir))
+        results[mode] = samples
+    api.stop()
+
+    print(f"{args.runs} cold starts per mode, {args.api_latency:.0f} ms Bot API latency, "
+          f"time from process spawn (median, ms)")
+    print(f"{'mode':<10}{'import':>10}{'listen':>10}{'response':>10}")
+    for mode, samples in results.items():
+        listen, response, import_ms = zip(*samples)
+        imported = [value for value in import_ms if value is not None]
+        print(f"{mode:<10}{statistics.median(imported) if imported else float('nan'):>10.0f}"
+              f"{statistics.median(listen):>10.0f}{statistics.median(response):>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    # Round trip to api.telegram.org from the host; startup pays it for getMe and setWebhook
+    parser.add_argument('--api-latency', type=float, default=100, help='Fake Bot API response delay in ms')
+    parser.add_argument('--modes', type=lambda value: value.split(','), default=['standard', 'fast'])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Compare the legacy per-frame thumbnail path with the keyframe selector
+
+Usage: python benchmarks/bench_thumbnails.py [sample.mp4] [--runs N]
+
+Without a sample video a 30s 720x1280 test clip is generated with ffmpeg.
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from thumbnails import extract_thumbnails, probe_duration  # noqa: E402
+
+
+def make_sample(path, duration=30):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=duration={duration}:size=720x1280:rate=30',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', path, '-y'
+    ], check=True)
+
+
+def legacy_thumbnails(video_file, workdir):
+    """The pre-engine path: tool checks, ffprobe, then one ffmpeg -ss per thumbnail written to disk"""
+    subprocess.run(['ffmpeg', '-version'], capture_output=True, timeout=5, text=True)
+    subprocess.run(['ffprobe', '-version'], capture_output=True, timeout=5, text=True)
+    duration = probe_duration(video_file)
+    timestamps = sorted(random.sample(range(1, int(duration)), min(5, int(duration) - 1)))
+
+    thumbnails = []
+    for i, timestamp in enumerate(timestamps, 1):
+        thumbnail_file = os.path.join(workdir, f"bench_thumb_{i}.jpg")
+        subprocess.run([
+            'ffmpeg', '-ss', str(timestamp), '-i', video_file,
+            '-vframes', '1', '-q:v', '2', thumbnail_file, '-y'
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+        with open(thumbnail_file, 'rb') as f:
+            thumbnails.append(f.read())
+        os.remove(thumbnail_file)
+    return thumbnails
+
+
+def engine_thumbnails(video_file, duration):
+    """The single-pass path: keyframe/scene candidates piped back, deduplicated, only picks encoded"""
+    return extract_thumbnails(video_file, duration)
+
+
+def measure(label, func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        frames = func()
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<10} frames={len(frames)} bytes={sum(len(frame) for frame in frames):>8} mean={statistics.mean(timings) * 1000:8.1f}ms "
+          f"min={min(timings) * 1000:8.1f}ms max={max(timings) * 1000:8.1f}ms")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('video', nargs='?', help='Local sample video (generated if omitted)')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        video_file = args.video
+        if not video_file:
+            video_file = os.path.join(workdir, 'sample.mp4')
+            make_sample(video_file)
+
+        duration = probe_duration(video_file)
+        print(f"Sample: {video_file} ({duration:.1f}s), {args.runs} runs each")
+
+        legacy = measure('legacy', lambda: legacy_thumbnails(video_file, workdir), args.runs)
+        engine = measure('engine', lambda: engine_thumbnails(video_file, duration), args.runs)
+        print(f"speedup   {legacy / engine:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Measure Instagram URL parse throughput on a generated corpus
+
+Usage: python benchmarks/bench_url_parser.py [--size N] [--seed S]
+
+The corpus is generated from random shortcodes/usernames in every supported
+link shape plus malformed variants. Before timing, every generated link is
+checked against the properties the parser promises (shortcode and username
+round-trip, canonical URLs re-parse to the same result, foreign hosts and
+reserved pages are rejected).
+"""
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from instagram_url import parse_instagram_url  # noqa: E402
+
+SHORTCODE_CHARS = string.ascii_letters + string.digits + '_-'
+USERNAME_CHARS = string.ascii_lowercase + string.digits + '._'
+QUERIES = ['', '?igsh=MXRk', '?utm_source=ig_web_copy_link', '?igsh=abc&utm_source=share', '#comments']
+
+
+def random_shortcode(rng):
+    return ''.join(rng.choice(SHORTCODE_CHARS) for _ in range(rng.choice([11, 11, 11, 39])))
+
+
+def random_username(rng):
+    name = ''.join(rng.choice(USERNAME_CHARS) for _ in range(rng.randint(3, 20)))
+    return 'u' + name  # Never collides with reserved segments like 'p' or 'tv'
+
+
+def generate_valid(rng):
+    """Return (url, shortcode, username) for a random supported link shape"""
+    code = random_shortcode(rng)
+    user = random_username(rng)
+    scheme = rng.choice(['https://', 'http://', ''])
+    host = rng.choice(['www.instagram.com', 'instagram.com', 'm.instagram.com', 'instagr.am'])
+    kind = rng.choice(['reel', 'reels', 'p', 'tv'])
+    trailing = rng.choice(['/', ''])
+    query = rng.choice(QUERIES)
+
+    shape = rng.randrange(3)
+    if shape == 0:
+        return f"{scheme}{host}/{kind}/{code}{trailing}{query}", code, None
+    if shape == 1:
+        return f"{scheme}{host}/{user}/{kind}/{code}{trailing}{query}", code, user
+    return f"{scheme}{host}/{kind}/{code}/?taken-by={user}", code, user
+
+
+def generate_invalid(rng):
+    code = random_shortcode(rng)
+    return rng.choice([
+        f"https://example.com/reel/{code}/",
+        f"https://www.instagram.com.evil.net/reel/{code}/",
+        f"https://www.instagram.com/stories/{random_username(rng)}/{rng.randint(10**9, 10**10)}/",
+        f"https://www.instagram.com/{random_username(rng)}/",
+        f"https://www.instagram.com/reels/audio/{rng.randint(10**9, 10**10)}/",
+        f"https://www.instagram.com/{random_username(rng)}/reel/explore/",
+        "https://www.instagram.com/reel/",
+        "https://www.instagram.com/reel/ab/",
+        "not a url at all",
+        "",
+    ])
+
+
+def check_properties(corpus):
+    for url, code, user in corpus:
+        parsed = parse_instagram_url(url)
+        if code is None:
+            assert parsed is None, f"accepted invalid link {url!r}: {parsed}"
+            continue
+        assert parsed is not None, f"rejected valid link {url!r}"
+        assert parsed.shortcode == code, f"{url!r}: shortcode {parsed.shortcode!r} != {code!r}"
+        assert parsed.username == user, f"{url!r}: username {parsed.username!r} != {user!r}"
+        assert parse_instagram_url(parsed.url) == parsed, f"{url!r}: canonical URL does not round-trip"
+
+
+def legacy_parse(url):
+    """The pre-parser checks: substring test, then a regex compiled on every call"""
+    if 'instagram.com' not in url:
+        return None
+    url_pattern = r'instagram\.com/(?:([^/]+)/(?:reel|p)/[^/]+|reel/[^/?]+.*[\?&]taken-by=([^&]+))'
+    return re.search(url_pattern, url)
+
+
+def measure(label, func, urls, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for url in urls:
+            func(url)
+    elapsed = time.perf_counter() - start
+    total = len(urls) * rounds
+    print(f"{label:<8} {total / elapsed:12,.0f} urls/s  {elapsed / total * 1e6:6.2f} us/url")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [generate_valid(rng) if rng.random() < 0.8 else (generate_invalid(rng), None, None)
+              for _ in range(args.size)]
+    check_properties(corpus)
+    print(f"Corpus: {len(corpus)} links, all properties hold")
+
+    urls = [url for url, _, _ in corpus]
+    measure('legacy', legacy_parse, urls, args.rounds)
+    measure('parser', parse_instagram_url, urls, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Measure how sharded mode's throughput scales with WORKER_PROCESSES
+
+Usage: python benchmarks/bench_workers.py [sample.mp4] [--jobs N] [--workers 1,2,4] [--duration SECONDS]
+
+For each worker count, N /reel jobs for distinct reels are put on a fresh
+WorkQueue and that many worker processes run InstaReelBot.work against the
+fake Bot API and Instagram origin of bench_end_to_end, so every job is a
+real download, thumbnail render and upload. Reports jobs/s per worker count
+and the speedup over one worker. The speedup can't exceed the number of
+cores, which is printed alongside.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.web  # noqa: E402
+from telegram import Update  # noqa: E402
+
+from bench_end_to_end import (  # noqa: E402
+    CHAT, TOKEN, FakeBotApi, FakeExtractor, InjectedExtractors, MediaOrigin, make_photo, make_sample
+)
+from thumbnails import probe_duration  # noqa: E402
+
+
+def run_worker(name, api_url, origin_url, duration, temp_dir):
+    os.environ['TEMP_DIR'] = temp_dir
+    from main import InstaReelBot
+    bot = InstaReelBot(TOKEN)
+    bot.extractors = InjectedExtractors(lambda: FakeExtractor(origin_url, duration))
+    bot.bot_api_options = lambda: {'base_url': f'{api_url}/bot'}
+    try:
+        asyncio.run(bot.work(name))
+    except KeyboardInterrupt:
+        pass
+
+
+def make_job(update_id, shortcode):
+    text = f'/reel https://www.instagram.com/reel/{shortcode}/'
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': CHAT,
+            'from': {'id': 2000 + update_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        },
+    }, None).to_dict()
+
+
+def unfinished(queue_path):
+    with sqlite3.connect(queue_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+
+async def run_round(args, workers, api_url, origin_url, duration, round_id, workdir):
+    temp_dir = os.path.join(workdir, f'round-{round_id}')
+    os.makedirs(temp_dir)
+    from work_queue import WorkQueue
+    queue_path = os.path.join(temp_dir, 'jobs.db')
+    queue = WorkQueue(queue_path)
+    for i in range(args.jobs):
+        queue.enqueue(i, 'reel', make_job(i, f'W{round_id}J{i:05d}'))
+    queue.close()
+
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_worker, args=(f'worker-{i}', api_url, origin_url, duration, temp_dir), daemon=True)
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    while unfinished(queue_path):
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+    return elapsed
+
+
+async def run(args, workdir, sample):
+    with open(sample, 'rb') as f:
+        MediaOrigin.sample = f.read()
+    MediaOrigin.photo = make_photo()
+    try:
+        duration = probe_duration(sample) or args.duration
+    except FileNotFoundError:
+        duration = args.duration
+
+    api = tornado.web.Application([(r'/bot[^/]+/(\w+)', FakeBotApi)]).listen(0, address='127.0.0.1')
+    origin = tornado.web.Application([(r'/(.*)', MediaOrigin)]).listen(0, address='127.0.0.1')
+    api_url = f'http://127.0.0.1:{next(iter(api._sockets.values())).getsockname()[1]}'
+    origin_url = f'http://127.0.0.1:{next(iter(origin._sockets.values())).getsockname()[1]}'
+
+    print(f"jobs={args.jobs} cores={os.cpu_count()}")
+    baseline = None
+    for round_id, workers in enumerate(args.workers):
+        # Includes each worker's start-up, as a cold deployment would
+        elapsed = await run_round(args, workers, api_url, origin_url, duration, round_id, workdir)
+        throughput = args.jobs / elapsed
+        baseline = baseline or throughput
+        print(f"workers={workers:<3} throughput={throughput:6.2f} jobs/s  elapsed={elapsed:6.2f}s  "
+              f"speedup={throughput / baseline:4.2f}x")
+    api.stop()
+    origin.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sample', nargs='?', help='MP4 to serve; a test clip is generated if omitted')
+    parser.add_argument('--jobs', type=int, default=40)
+    parser.add_argument('--workers', type=lambda value: [int(n) for n in value.split(',')], default=[1, 2, 4])
+    parser.add_argument('--duration', type=int, default=15, help='length of the generated clip in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        sample = args.sample
+        if not sample:
+            sample = os.path.join(workdir, 'sample.mp4')
+            make_sample(sample, args.duration)
+        os.environ.update({
+            'METRICS_PORT': '0',
+            'WORKER_PROCESSES': str(max(args.workers)),  # Workers only open the job queue in sharded mode
+            'IG_RATE_PER_MINUTE': str(60 * 1000),
+            'IG_RATE_BURST': str(args.jobs),
+            'NO_PROXY': '127.0.0.1,localhost',
+        })
+        asyncio.run(run(args, workdir, sample))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def is_carousel(info):
+    """True for multi-item posts, and for photo posts, which yt-dlp returns without video formats"""
+    return info.get('_type') == 'playlist' or (not info.get('formats') and not info.get('url'))
+
+
+def album_chunks(items, size=10):
+    """Split items into albums of at most ``size``, balanced so that none has a single item
+
+    Telegram albums need 2-10 items: 11 items go out as 6 + 5, not 10 + 1.
+    """
+    if not items:
+        return []
+    albums = -(-len(items) // size)
+    per_album = -(-len(items) // albums)
+    return [items[start:start + per_album] for start in range(0, len(items), per_album)]
+
+
+def sent_file_id(message):
+    """The file_id of the photo or video in a sent message, or None"""
+    if message.photo:
+        return message.photo[-1].file_id
+    media = message.video or message.animation or message.document
+    return media.file_id if media else None
+
+
+def close_item(item):
+    """Close the buffer or delete the file behind a downloaded carousel item"""
+    try:
+        for key in ('photo', 'video'):
+            if item.get(key) is not None and hasattr(item[key], 'close'):
+                item[key].close()
+        if item.get('video_file') and os.path.exists(item['video_file']):
+            os.remove(item['video_file'])
+    except Exception as e:
+        logger.error(f"Cleanup error: {str(e)}")
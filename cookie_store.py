@@ -0,0 +1,197 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from http.cookiejar import Cookie
+
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+# Cookie that carries the Instagram login; when it expires the upload is useless
+SESSION_COOKIE = 'sessionid'
+
+# Session-only cookie files have no expiration column to go by
+DEFAULT_MAX_AGE = 30 * 86400
+
+
+def parse_netscape_cookies(cookies_content):
+    """Parse a Netscape cookies.txt into http.cookiejar.Cookie objects"""
+    cookies = []
+    for line in cookies_content.strip().split('\n'):
+        line = line.strip()
+        # Exporters mark HttpOnly cookies (like sessionid) with a comment-style prefix
+        http_only = line.startswith('#HttpOnly_')
+        if http_only:
+            line = line[len('#HttpOnly_'):]
+        if not line or line.startswith('#'):
+            continue
+
+        # Netscape cookies format: domain, flag, path, secure, expiration, name, value
+        parts = line.split('\t')
+        if len(parts) < 7:
+            continue
+        domain, include_subdomains, path, secure, expiration, name, value = parts[:7]
+        try:
+            expires = int(expiration) or None
+        except ValueError:
+            expires = None
+
+        cookies.append(Cookie(
+            version=0, name=name, value=value,
+            port=None, port_specified=False,
+            domain=domain, domain_specified=include_subdomains.upper() == 'TRUE',
+            domain_initial_dot=domain.startswith('.'),
+            path=path, path_specified=True,
+            secure=secure.upper() == 'TRUE',
+            expires=expires, discard=expires is None,
+            comment=None, comment_url=None,
+            rest={'HttpOnly': None} if http_only else {},
+        ))
+    return cookies
+
+
+def cookies_expire_at(cookies, uploaded_at):
+    """When a cookie upload stops being useful, based on its expiration columns"""
+    instagram = [c for c in cookies if 'instagram.com' in c.domain]
+    session = [c.expires for c in instagram if c.name == SESSION_COOKIE and c.expires]
+    if session:
+        return min(session)
+    expiries = [c.expires for c in instagram if c.expires]
+    if expiries:
+        return max(expiries)
+    return uploaded_at + DEFAULT_MAX_AGE
+
+
+class CookieStore:
+    """Per-user Instagram cookies, encrypted at rest in SQLite
+
+    Uploaded cookies.txt contents are stored encrypted with Fernet. Parsed
+    cookie lists are kept in an in-memory LRU so lookups on the download path
+    don't touch the database, and purge_expired() drops uploads whose
+    Instagram session has expired according to the Netscape expiration column.
+    """
+
+    def __init__(self, path, key=None, cache_size=256):
+        self.path = path
+        self.cache_size = cache_size
+        self._fernet = Fernet(key or self._load_or_create_key(path + '.key'))
+        self._parsed = OrderedDict()  # user_id -> [Cookie], most recently used last
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cookies (
+                user_id INTEGER PRIMARY KEY,
+                payload BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        # user_id -> expires_at, so membership checks never hit the database
+        self._users = {}
+        self._synced_at = 0
+        self.sync()
+        logger.info(f"Loaded cookies for {len(self._users)} users")
+
+    @staticmethod
+    def _load_or_create_key(key_file):
+        if os.path.exists(key_file):
+            with open(key_file, 'rb') as f:
+                return f.read().strip()
+
+        logger.warning(f"COOKIE_ENCRYPTION_KEY not set - generating a key in {key_file}. "
+                       "Set the variable to keep the key outside the data volume.")
+        key = Fernet.generate_key()
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        return key
+
+    def sync(self):
+        """Pick up uploads written by other processes since the last sync, returning their user ids"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id, expires_at, updated_at FROM cookies WHERE updated_at > ?',
+                (self._synced_at,)
+            ).fetchall()
+            for user_id, expires_at, updated_at in rows:
+                self._users[user_id] = expires_at
+                self._parsed.pop(user_id, None)
+                self._synced_at = max(self._synced_at, updated_at)
+        return [row[0] for row in rows]
+
+    def has(self, user_id):
+        expires_at = self._users.get(user_id)
+        return expires_at is not None and expires_at > time.time()
+
+    def save(self, user_id, cookies_content):
+        """Encrypt and store a user's cookies.txt, replacing any previous upload"""
+        now = time.time()
+        cookies = parse_netscape_cookies(cookies_content)
+        expires_at = cookies_expire_at(cookies, now)
+        payload = self._fernet.encrypt(cookies_content.encode('utf-8'))
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cookies (user_id, payload, expires_at, updated_at) VALUES (?, ?, ?, ?)',
+                (user_id, payload, expires_at, now)
+            )
+            self._conn.commit()
+            self._users[user_id] = expires_at
+            self._remember(user_id, cookies)
+        return expires_at
+
+    def get(self, user_id):
+        """Return the user's parsed cookies, or None if they have none (or they expired)"""
+        if not self.has(user_id):
+            return None
+
+        with self._lock:
+            cookies = self._parsed.get(user_id)
+            if cookies is not None:
+                self._parsed.move_to_end(user_id)
+                return cookies
+
+            row = self._conn.execute('SELECT payload FROM cookies WHERE user_id = ?', (user_id,)).fetchone()
+            if not row:
+                return None
+            try:
+                cookies = parse_netscape_cookies(self._fernet.decrypt(row[0]).decode('utf-8'))
+            except InvalidToken:
+                logger.error(f"Cannot decrypt cookies for user {user_id} - was the encryption key changed?")
+                return None
+            self._remember(user_id, cookies)
+            return cookies
+
+    def _remember(self, user_id, cookies):
+        self._parsed[user_id] = cookies
+        self._parsed.move_to_end(user_id)
+        while len(self._parsed) > self.cache_size:
+            self._parsed.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._conn.execute('DELETE FROM cookies WHERE user_id = ?', (user_id,))
+            self._conn.commit()
+            self._users.pop(user_id, None)
+            self._parsed.pop(user_id, None)
+
+    def purge_expired(self):
+        """Delete uploads whose Instagram session has expired and return their user ids"""
+        now = time.time()
+        with self._lock:
+            expired = [user_id for user_id, expires_at in self._users.items() if expires_at <= now]
+            if expired:
+                self._conn.execute('DELETE FROM cookies WHERE expires_at <= ?', (now,))
+                self._conn.commit()
+            for user_id in expired:
+                self._users.pop(user_id, None)
+                self._parsed.pop(user_id, None)
+        return expired
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,63 @@
+import asyncio
+import functools
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when every worker is busy and the admission queue is full"""
+
+
+class UserLimitError(Exception):
+    """Raised when a user already has the maximum number of jobs admitted"""
+
+
+class DownloadPool:
+    """Bounded worker pool that keeps blocking yt-dlp/ffmpeg work off the event loop"""
+
+    def __init__(self, max_workers=4, per_user=2, queue_size=20):
+        self.max_workers = max(1, max_workers)
+        self.per_user = max(1, per_user)
+        self.queue_size = max(0, queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='download')
+        self.pending = 0  # Admitted jobs, running + waiting
+        self.user_jobs = defaultdict(int)
+        self._slots = None  # Created lazily so it binds to the running event loop
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.queue_size
+
+    def admit(self, user_id):
+        """Reserve a job slot for the user and return its position in line (0 = starts now)"""
+        if self.user_jobs[user_id] >= self.per_user:
+            raise UserLimitError(f"User {user_id} already has {self.per_user} jobs in progress")
+        if self.pending >= self.capacity:
+            raise QueueFullError(f"Download queue is full ({self.capacity} jobs)")
+
+        self.pending += 1
+        self.user_jobs[user_id] += 1
+        return max(0, self.pending - self.max_workers)
+
+    def release(self, user_id):
+        """Give back a slot reserved with admit()"""
+        self.pending = max(0, self.pending - 1)
+        self.user_jobs[user_id] -= 1
+        if self.user_jobs[user_id] <= 0:
+            del self.user_jobs[user_id]
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on a worker thread once a global slot frees up"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        """Stop accepting work and wait for running jobs to finish"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
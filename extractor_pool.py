@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS = 'anonymous'
+
+
+class ExtractorPool:
+    """Long-lived YoutubeDL instances keyed by cookie profile
+
+    Building a YoutubeDL re-creates its extractors and HTTP handlers and
+    reloads cookies, and throws away keep-alive connections to Instagram's
+    CDN. Instances are checked out exclusively (YoutubeDL is not thread-safe),
+    returned after use and closed once idle for ``idle_timeout`` seconds.
+    yt-dlp itself is only imported by the first checkout (or warm_up), so
+    importing this module costs nothing at startup.
+    """
+
+    def __init__(self, base_opts, idle_timeout=300, max_idle_per_profile=4):
+        self.base_opts = base_opts
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_profile = max_idle_per_profile
+        self.created = 0
+        self.reused = 0
+        self._idle = defaultdict(list)  # (profile, generation) -> [(last_used, ydl)]
+        self._generations = defaultdict(int)  # Bumped when a profile's cookies change
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, profile=ANONYMOUS, cookies=None):
+        """Borrow a YoutubeDL for the profile, creating one with the given cookies if none are idle"""
+        ydl = None
+        with self._lock:
+            key = (profile, self._generations[profile])
+            if self._idle[key]:
+                _, ydl = self._idle[key].pop()
+                self.reused += 1
+
+        if ydl is None:
+            ydl = self._create()
+            # Cookies come pre-parsed from the cookie store, not from a file on disk
+            for cookie in cookies or ():
+                ydl.cookiejar.set_cookie(cookie)
+            self.created += 1
+            logger.info(f"Created extractor for profile {profile}")
+
+        try:
+            yield ydl
+        finally:
+            self._checkin(key, ydl)
+
+    def _create(self):
+        import yt_dlp
+        return yt_dlp.YoutubeDL(dict(self.base_opts))
+
+    def warm_up(self, extractors=('Instagram',)):
+        """Import yt-dlp and the given extractors and park an anonymous instance, off the request path"""
+        started = time.perf_counter()
+        with self.checkout() as ydl:
+            for name in extractors:
+                ydl.get_info_extractor(name)
+        logger.info(f"Extractor warm-up took {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _checkin(self, key, ydl):
+        with self._lock:
+            idle = self._idle[key]
+            # Instances built from cookies that were replaced meanwhile are not returned
+            current = key[1] == self._generations[key[0]]
+            if current and len(idle) < self.max_idle_per_profile:
+                idle.append((time.monotonic(), ydl))
+                ydl = None
+        if ydl is not None:
+            self._close(ydl)
+        self.evict_idle()
+
+    def evict_idle(self):
+        """Close instances that have not been used for idle_timeout seconds"""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for key in list(self._idle):
+                fresh = [(used, ydl) for used, ydl in self._idle[key] if used >= cutoff]
+                expired.extend(ydl for used, ydl in self._idle[key] if used < cutoff)
+                if fresh:
+                    self._idle[key] = fresh
+                else:
+                    del self._idle[key]
+        for ydl in expired:
+            self._close(ydl)
+        return len(expired)
+
+    def invalidate(self, profile):
+        """Drop idle instances for a profile, e.g. after the user uploads new cookies"""
+        with self._lock:
+            self._generations[profile] += 1
+            keys = [key for key in self._idle if key[0] == profile]
+            dropped = [ydl for key in keys for _, ydl in self._idle.pop(key)]
+        for ydl in dropped:
+            self._close(ydl)
+
+    def close(self):
+        with self._lock:
+            dropped = [ydl for idle in self._idle.values() for _, ydl in idle]
+            self._idle.clear()
+        for ydl in dropped:
+            self._close(ydl)
+
+    @staticmethod
+    def _close(ydl):
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.error(f"Error closing extractor: {e}")
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(instances) for instances in self._idle.values())
+        return {'created': self.created, 'reused': self.reused, 'idle': idle}
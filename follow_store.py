@@ -0,0 +1,147 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FollowLimitError(Exception):
+    """Raised when a user already follows the maximum number of accounts"""
+
+
+class FollowStore:
+    """Accounts users follow for prefetching, with poll bookkeeping and prefetch hit tracking
+
+    Each followed account is polled at most every ``interval`` seconds,
+    doubling after consecutive failures. Reels prefetched for an account are
+    recorded, and marked once a user asks for them, which gives the prefetch
+    hit rate: the share of prefetched reels that were actually requested.
+    """
+
+    def __init__(self, path, max_per_user=10, interval=900, max_backoff=6 * 3600):
+        self.path = path
+        self.max_per_user = max_per_user
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS follows (
+                user_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (user_id, username)
+            );
+            CREATE INDEX IF NOT EXISTS follows_username ON follows (username);
+            CREATE TABLE IF NOT EXISTS accounts (
+                username TEXT PRIMARY KEY,
+                last_polled REAL NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS prefetched (
+                shortcode TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                prefetched_at REAL NOT NULL,
+                hit_at REAL
+            );
+        """)
+        self._conn.commit()
+
+    def follow(self, user_id, username):
+        """Follow an account; returns False if the user already follows it"""
+        username = username.lower()
+        with self._lock:
+            if self._conn.execute('SELECT 1 FROM follows WHERE user_id = ? AND username = ?',
+                                  (user_id, username)).fetchone():
+                return False
+            count = self._conn.execute('SELECT COUNT(*) FROM follows WHERE user_id = ?', (user_id,)).fetchone()[0]
+            if count >= self.max_per_user:
+                raise FollowLimitError(f"User {user_id} already follows {count} accounts")
+            self._conn.execute('INSERT INTO follows (user_id, username, created_at) VALUES (?, ?, ?)',
+                               (user_id, username, time.time()))
+            self._conn.execute('INSERT OR IGNORE INTO accounts (username) VALUES (?)', (username,))
+            self._conn.commit()
+        return True
+
+    def unfollow(self, user_id, username):
+        """Stop following an account; returns False if the user didn't follow it"""
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM follows WHERE user_id = ? AND username = ?',
+                                        (user_id, username.lower()))
+            # Accounts nobody follows any more are no longer polled
+            self._conn.execute('DELETE FROM accounts WHERE username NOT IN (SELECT username FROM follows)')
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def following(self, user_id):
+        with self._lock:
+            rows = self._conn.execute('SELECT username FROM follows WHERE user_id = ? ORDER BY created_at',
+                                      (user_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def due(self, limit=None):
+        """Accounts whose next poll is due, oldest first, as (username, user_id of their first follower)"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT a.username, a.last_polled, a.failures,
+                       (SELECT user_id FROM follows f WHERE f.username = a.username ORDER BY created_at LIMIT 1)
+                FROM accounts a ORDER BY a.last_polled
+            """).fetchall()
+        due = []
+        for username, last_polled, failures, user_id in rows:
+            wait = min(self.max_backoff, self.interval * 2 ** failures)
+            if user_id is not None and now - last_polled >= wait:
+                due.append((username, user_id))
+        return due[:limit] if limit else due
+
+    def mark_polled(self, username, ok=True):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE accounts SET last_polled = ?, failures = CASE WHEN ? THEN 0 ELSE failures + 1 END '
+                'WHERE username = ?',
+                (time.time(), ok, username)
+            )
+            self._conn.commit()
+
+    def record_prefetch(self, shortcode, username):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO prefetched (shortcode, username, prefetched_at) VALUES (?, ?, ?)',
+                (shortcode, username, time.time())
+            )
+            self._conn.commit()
+
+    def record_hit(self, shortcode):
+        """Mark a prefetched reel as requested; returns True the first time"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE prefetched SET hit_at = ? WHERE shortcode = ? AND hit_at IS NULL', (time.time(), shortcode)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def purge(self, older_than):
+        """Forget prefetch records older than ``older_than`` seconds (they stop counting towards the hit rate)"""
+        with self._lock:
+            self._conn.execute('DELETE FROM prefetched WHERE prefetched_at < ?', (time.time() - older_than,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            accounts = self._conn.execute('SELECT COUNT(*) FROM accounts').fetchone()[0]
+            prefetched, hits = self._conn.execute(
+                'SELECT COUNT(*), COUNT(hit_at) FROM prefetched'
+            ).fetchone()
+        return {
+            'accounts': accounts,
+            'prefetched': prefetched,
+            'hits': hits,
+            'hit_rate': hits / prefetched if prefetched else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,211 @@
+import logging
+import subprocess
+
+from metrics import FFMPEG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Bot API limit for uploads by a bot through api.telegram.org
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+# ...and through a self-hosted telegram-bot-api server in --local mode
+LOCAL_BOT_API_UPLOAD_LIMIT = 2000 * 1024 * 1024
+
+# Transcodes aim a little below the limit; the bitrate is only an average
+TRANSCODE_HEADROOM = 0.9
+TRANSCODE_AUDIO_BITRATE = 96_000
+MIN_VIDEO_BITRATE = 150_000
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg cannot bring a video under the size limit in time"""
+
+
+class NoAudioError(TranscodeError):
+    """Raised when a video has no audio track to extract"""
+
+
+def short_side(fmt):
+    """Resolution as the shorter dimension, so 720x1280 reels and 1280x720 videos compare equally"""
+    sides = [side for side in (fmt.get('width'), fmt.get('height')) if side]
+    return min(sides) if sides else None
+
+
+def estimate_size(fmt, duration):
+    """Bytes a format will take, from yt-dlp's size fields or its bitrate; None if unknown"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def is_http(fmt):
+    return fmt.get('url') and fmt.get('protocol', 'https') in ('http', 'https')
+
+
+def candidate_formats(info, allow_merge=True):
+    """Progressive formats, plus video-only formats paired with the best audio when merging is possible"""
+    formats = [fmt for fmt in info.get('formats') or () if is_http(fmt)]
+    duration = info.get('duration')
+
+    candidates = []
+    for fmt in formats:
+        if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none':
+            candidates.append(([fmt], estimate_size(fmt, duration), fmt))
+
+    audio = [fmt for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+    if allow_merge and audio:
+        best_audio = max(audio, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0)
+        audio_size = estimate_size(best_audio, duration)
+        for fmt in formats:
+            if fmt.get('acodec') == 'none' and fmt.get('vcodec') not in (None, 'none'):
+                video_size = estimate_size(fmt, duration)
+                size = video_size + audio_size if video_size and audio_size else None
+                candidates.append(([fmt, best_audio], size, fmt))
+    return candidates
+
+
+def select_format(info, target_resolution=720, max_bitrate_kbps=0, max_bytes=TELEGRAM_UPLOAD_LIMIT,
+                  allow_merge=True):
+    """Pick the smallest format that meets the resolution target and fits the upload limit
+
+    Formats above ``max_bitrate_kbps`` (0 = no cap) or estimated above
+    ``max_bytes`` are skipped. Among the rest the smallest one at or above
+    ``target_resolution`` (shorter side, in pixels) wins; if none reaches the
+    target, the sharpest one does. Returns the list of formats to download
+    (one progressive format, or video + audio to merge), or None when nothing
+    is known to fit and the caller should fall back to transcoding.
+    """
+    eligible = []
+    for formats, size, video in candidate_formats(info, allow_merge):
+        if size is not None and size > max_bytes:
+            continue
+        if max_bitrate_kbps and sum(fmt.get('tbr') or 0 for fmt in formats) > max_bitrate_kbps:
+            continue
+        eligible.append((formats, size, video))
+    if not eligible:
+        return None
+
+    def sharpness(candidate):
+        return short_side(candidate[2]) or 0
+
+    def cost(candidate):
+        # Single files can be streamed and beat merges; then known sizes beat unknown ones
+        size = candidate[1]
+        return (sharpness(candidate), len(candidate[0]), size is None, size or 0)
+
+    meeting = [candidate for candidate in eligible if sharpness(candidate) >= target_resolution]
+    if meeting:
+        return min(meeting, key=cost)[0]
+    return max(eligible, key=lambda candidate: (sharpness(candidate), -(candidate[1] or 0)))[0]
+
+
+def select_audio_format(info, max_bytes=TELEGRAM_UPLOAD_LIMIT):
+    """Pick the format to take a reel's soundtrack from, returning (format, audio_only)
+
+    An audio-only format wins: the best bitrate among those not estimated
+    above ``max_bytes``. Without one, the smallest progressive format is
+    returned so its audio track can be demuxed; every variant carries the
+    same soundtrack. Returns (None, False) if no HTTP format has audio.
+    """
+    formats = [fmt for fmt in info.get('formats') or () if is_http(fmt)]
+    duration = info.get('duration')
+
+    audio = [fmt for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+    fitting = [fmt for fmt in audio if (estimate_size(fmt, duration) or 0) <= max_bytes]
+    if fitting:
+        return max(fitting, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0), True
+
+    progressive = [fmt for fmt in formats if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none']
+    if progressive:
+        # Unknown sizes sort last
+        return min(progressive, key=lambda fmt: (estimate_size(fmt, duration) is None,
+                                                 estimate_size(fmt, duration) or 0)), False
+    if not formats and info.get('url') and info.get('acodec') != 'none':
+        return info, info.get('vcodec') == 'none'  # Already resolved to a single format
+    return None, False
+
+
+def apply_format(info, formats):
+    """Return a copy of the info dict set up to download the chosen formats, like yt-dlp's own selection"""
+    selected = dict(info)
+    selected.pop('requested_formats', None)
+    if len(formats) == 1:
+        selected.update(formats[0])
+        return selected
+
+    video, audio = formats
+    for key in ('width', 'height', 'fps', 'vcodec', 'dynamic_range'):
+        selected[key] = video.get(key)
+    selected.update(
+        format_id=f"{video['format_id']}+{audio['format_id']}",
+        requested_formats=[video, audio],
+        acodec=audio.get('acodec'),
+        ext='mp4',
+        protocol=f"{video.get('protocol', 'https')}+{audio.get('protocol', 'https')}",
+    )
+    selected.pop('url', None)
+    return selected
+
+
+def fit_video(src, dst, max_bytes, duration, max_resolution=720, timeout=120):
+    """Re-encode a video so it fits max_bytes, within a time budget
+
+    Uses software x264 at a bitrate computed from the duration, scales the
+    shorter side down to ``max_resolution`` and puts the moov atom first.
+    Raises TranscodeError if ffmpeg fails, runs out of time or still
+    overshoots.
+    """
+    if not duration:
+        raise TranscodeError("Unknown duration, cannot pick a bitrate")
+
+    video_bitrate = int(max_bytes * 8 * TRANSCODE_HEADROOM / duration) - TRANSCODE_AUDIO_BITRATE
+    if video_bitrate < MIN_VIDEO_BITRATE:
+        raise TranscodeError(f"{duration:.0f}s is too long to fit {max_bytes / 1024 / 1024:.0f} MB")
+
+    scale = (f"scale='if(lt(iw,ih),min({max_resolution},iw),-2)':"
+             f"'if(lt(iw,ih),-2,min({max_resolution},ih))'")
+    command = [
+        'ffmpeg', '-v', 'error', '-y', '-i', src,
+        '-vf', scale, '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-b:v', str(video_bitrate), '-maxrate', str(video_bitrate), '-bufsize', str(video_bitrate * 2),
+        '-c:a', 'aac', '-b:a', str(TRANSCODE_AUDIO_BITRATE),
+        '-movflags', '+faststart', dst
+    ]
+    try:
+        with FFMPEG_SECONDS.time(operation='transcode'):
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise TranscodeError(f"Transcode did not finish within {timeout}s")
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.decode(errors='replace').strip()[-500:])
+    return dst
+
+
+def remux_video(src, dst, timeout=30):
+    """Copy the streams into an MP4 with faststart, for containers Telegram can't stream"""
+    with FFMPEG_SECONDS.time(operation='remux'):
+        result = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-i', src, '-c', 'copy', '-movflags', '+faststart', dst],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout
+        )
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.decode(errors='replace').strip()[-500:])
+    return dst
+
+
+def extract_audio(src, dst, timeout=30):
+    """Copy the audio stream of a video (or audio file) into an M4A, without re-encoding"""
+    with FFMPEG_SECONDS.time(operation='extract_audio'):
+        result = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-i', src, '-vn', '-map', '0:a:0', '-c:a', 'copy',
+             '-movflags', '+faststart', dst],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout
+        )
+    if result.returncode != 0:
+        error = result.stderr.decode(errors='replace').strip()[-500:]
+        if 'matches no streams' in error:
+            raise NoAudioError(error)
+        raise TranscodeError(error)
+    return dst
@@ -0,0 +1,120 @@
+import re
+from collections import namedtuple
+from urllib.parse import parse_qs
+
+ParsedUrl = namedtuple('ParsedUrl', ['shortcode', 'username', 'kind', 'url'])
+
+INSTAGRAM_HOSTS = frozenset({
+    'instagram.com', 'www.instagram.com', 'm.instagram.com',
+    'instagr.am', 'www.instagr.am',
+})
+
+# Path segment that introduces a shortcode, mapped to the canonical segment
+MEDIA_KINDS = {'reel': 'reel', 'reels': 'reel', 'p': 'p', 'tv': 'tv'}
+
+# First path segments that are Instagram pages rather than usernames
+RESERVED_SEGMENTS = frozenset(MEDIA_KINDS) | {
+    'share', 'stories', 'explore', 'accounts', 'direct', 'about', 'legal', 'developer', 'web',
+}
+
+# Pages that sit where a shortcode would (e.g. /reels/audio/<id>/) and are not media
+RESERVED_CODES = frozenset({'audio', 'explore', 'effect', 'tags', 'locations', 'stories', 'share', 'create'})
+
+URL_PATTERN = re.compile(r'^(?:https?://)?(?P<host>[^/?#\s]+)(?P<path>/[^?#\s]*)?(?:\?(?P<query>[^#\s]*))?', re.IGNORECASE)
+USERNAME_PATTERN = re.compile(r'^[A-Za-z0-9._]{1,30}$')
+
+# How links are separated and wrapped in free-form messages
+LINK_SEPARATORS = re.compile(r'[\s,]+')
+LINK_PUNCTUATION = '()[]<>{}"\'.;!'
+
+# Each route is a sequence of path segments:
+#   'kind'  - one of MEDIA_KINDS
+#   'code'  - the shortcode
+#   'user'  - a username (anything valid that is not a reserved segment)
+#   other   - a literal segment
+# Anything after the matched segments (e.g. /liked_by/) is ignored.
+ROUTES = (
+    ('kind', 'code'),
+    ('user', 'kind', 'code'),
+    # Share links carry an opaque id that only resolves through a redirect
+    ('share', 'kind', 'code'),
+    ('share', 'code'),
+)
+
+SEGMENT_PATTERNS = {
+    'kind': r'(?P<kind>%s)' % '|'.join(sorted(MEDIA_KINDS, key=len, reverse=True)),
+    'code': r'(?P<code>[A-Za-z0-9_-]{5,64})',
+    'user': r'(?P<user>[A-Za-z0-9._]{1,30})',
+}
+
+
+def _compile_route(route):
+    segments = [SEGMENT_PATTERNS.get(segment, re.escape(segment)) for segment in route]
+    return re.compile(r'^/+' + '/+'.join(segments) + r'(?:/|$)', re.IGNORECASE)
+
+
+COMPILED_ROUTES = tuple((route, _compile_route(route)) for route in ROUTES)
+
+
+def parse_instagram_url(url):
+    """Parse an Instagram reel/post link without touching the network
+
+    Returns a ParsedUrl with the canonical shortcode, the username when the
+    link contains one, and a canonical URL to hand to yt-dlp - or None if the
+    text is not a supported Instagram media link. Share links are accepted but
+    have no shortcode, since their id only resolves through Instagram.
+    """
+    match = URL_PATTERN.match(url.strip())
+    if not match or match.group('host').lower() not in INSTAGRAM_HOSTS:
+        return None
+
+    path = match.group('path') or ''
+    for route, pattern in COMPILED_ROUTES:
+        matched = pattern.match(path)
+        if not matched:
+            continue
+
+        groups = matched.groupdict()
+        username = groups.get('user')
+        if username and username.lower() in RESERVED_SEGMENTS:
+            continue
+
+        if route[0] == 'share':
+            return ParsedUrl(None, None, 'share', f"https://www.instagram.com{matched.group(0).rstrip('/')}/")
+
+        kind = MEDIA_KINDS[groups['kind'].lower()]
+        code = groups['code']
+        if code.lower() in RESERVED_CODES:
+            continue
+        if not username and match.group('query'):
+            # Old style links: /reel/ABC123/?taken-by=username
+            taken_by = parse_qs(match.group('query')).get('taken-by')
+            if taken_by and USERNAME_PATTERN.match(taken_by[0]):
+                username = taken_by[0]
+
+        user_prefix = f"{username}/" if username else ''
+        return ParsedUrl(code, username, kind, f"https://www.instagram.com/{user_prefix}{kind}/{code}/")
+
+    return None
+
+
+def find_instagram_urls(text, limit=None):
+    """Parse every supported Instagram link in a message, in order and without duplicates
+
+    Links may be separated by whitespace or commas and wrapped in brackets or
+    quotes, as they are when users paste collections.
+    """
+    found = []
+    seen = set()
+    for token in LINK_SEPARATORS.split(text):
+        parsed = parse_instagram_url(token.strip(LINK_PUNCTUATION)) if token else None
+        if not parsed:
+            continue
+        key = parsed.shortcode or parsed.url
+        if key in seen:
+            continue
+        seen.add(key)
+        found.append(parsed)
+        if limit and len(found) >= limit:
+            break
+    return found
@@ -1,15 +1,52 @@
 import os
+import asyncio
 from dotenv import load_dotenv
-import random
 import subprocess
 import logging
 import json
 import tempfile
 import re
 import time
-from telegram import Update, InputMediaPhoto, Document
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-import yt_dlp
+import shutil
+import functools
+import contextvars
+from contextlib import ExitStack
+import threading
+import signal
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from types import SimpleNamespace
+from telegram import (
+    InlineQueryResultCachedPhoto,
+    Bot, Update, InputMediaPhoto, InputMediaVideo, Document,
+    InlineQueryResultArticle, InlineQueryResultCachedVideo, InlineQueryResultsButton, InputTextMessageContent
+)
+from telegram.ext import Application, CommandHandler, InlineQueryHandler, MessageHandler, filters, ContextTypes
+
+from instagram_url import USERNAME_PATTERN, find_instagram_urls, parse_instagram_url
+from download_pool import DownloadPool, QueueFullError, UserLimitError
+from extractor_pool import ANONYMOUS, ExtractorPool
+from cookie_store import CookieStore
+from reel_cache import ReelCache
+from singleflight import SingleFlight
+from work_queue import WorkQueue
+from rate_limit import RateLimiter, RateLimitedError, classify_error
+from media_stream import can_stream, stream_media, upload_file, upload_size
+from thumbnails import FrameTee, extract_thumbnails, extract_thumbnails_async, probe_duration_async
+from media_process import MediaProcessRunner
+from scratch_space import DiskBudgetError, ScratchSpace
+from uploads import Uploader, UploadDeadlineError, make_bot_request, probe_local_bot_api
+from carousel import album_chunks, close_item, is_carousel, sent_file_id
+from follow_store import FollowLimitError, FollowStore
+from formats import (
+    LOCAL_BOT_API_UPLOAD_LIMIT, TELEGRAM_UPLOAD_LIMIT, NoAudioError, TranscodeError, apply_format, estimate_size,
+    extract_audio, fit_video, is_http, remux_video, select_audio_format, select_format
+)
+from metrics import (
+    REGISTRY, STAGE_SECONDS, REQUESTS, ERRORS, BYTES_DOWNLOADED, BYTES_UPLOADED, MEDIA_SIZE,
+    FORMAT_DECISIONS, FORMAT_BYTES_SAVED, MetricsServer
+)
 
 load_dotenv()
 
@@ -21,121 +58,854 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Username fallbacks for links that don't carry one, compiled once instead of per download
+INFO_URL_USERNAME_PATTERN = re.compile(r'instagram\.com/([^/]+)/')
+INVALID_USERNAME_CHARS = re.compile(r'[^a-zA-Z0-9._]')
+
+# Telegram albums hold 2-10 items
+ALBUM_SIZE = 10
+# Minimum seconds between edits of a batch's status message
+BATCH_STATUS_INTERVAL = 3
+# How long Telegram may reuse an inline answer; placeholders must not be reused
+INLINE_CACHE_SECONDS = 300
+# update_id of the queued job a worker process is running, None outside of jobs
+current_job = contextvars.ContextVar('current_job', default=None)
+
 class InstaReelBot:
     def __init__(self, bot_token):
         self.bot_token = bot_token
-        self.user_cookies = {}  # Store cookies per user ID
+        # Databases, spilled buffers and scratch directories all live under TEMP_DIR by default
+        self.temp_dir = os.getenv('TEMP_DIR', tempfile.gettempdir())
+        os.makedirs(self.temp_dir, exist_ok=True)
+        # Encrypted per-user cookies that survive restarts
+        self.cookie_store = CookieStore(
+            os.getenv('COOKIE_DB_PATH', os.path.join(self.temp_dir, 'cookies.db')),
+            key=os.getenv('COOKIE_ENCRYPTION_KEY')
+        )
+        self.cookie_expiry_interval = int(os.getenv('COOKIE_EXPIRY_INTERVAL_SECONDS', '3600'))
+        self.background_tasks = []
         
-    def cleanup_old_cookies(self):
-        """Clean up temporary cookie files"""
-        try:
-            for user_id, cookie_file in list(self.user_cookies.items()):
-                if os.path.exists(cookie_file):
-                    # Check if file is older than 24 hours
-                    file_age = os.path.getmtime(cookie_file)
-                    if (time.time() - file_age) > 86400:  # 24 hours
-                        os.remove(cookie_file)
-                        del self.user_cookies[user_id]
-                        logger.info(f"Cleaned up old cookies for user {user_id}")
-        except Exception as e:
-            logger.error(f"Error cleaning up cookies: {str(e)}")
+        # Per-identity token buckets and backoff for Instagram extraction
+        self.rate_limiter = RateLimiter(
+            rate_per_minute=int(os.getenv('IG_RATE_PER_MINUTE', '30')),
+            burst=int(os.getenv('IG_RATE_BURST', '10')),
+            base_backoff=int(os.getenv('IG_BACKOFF_BASE_SECONDS', '30')),
+            max_backoff=int(os.getenv('IG_BACKOFF_MAX_SECONDS', '900')),
+            login_wall_threshold=int(os.getenv('IG_LOGIN_WALL_THRESHOLD', '3')),
+            login_wall_window=int(os.getenv('IG_LOGIN_WALL_WINDOW_SECONDS', '300'))
+        )
+        self.rate_limit_max_wait = int(os.getenv('IG_RATE_MAX_WAIT_SECONDS', '10'))
+        # Users whose cookies may serve anonymous traffic while it is throttled (opt-in, e.g. the bot owner)
+        self.spillover_users = [int(uid) for uid in os.getenv('SPILLOVER_USER_IDS', '').split(',') if uid.strip()]
         
-    def download_reel(self, url, user_id=None):
-        """Download Instagram reel using yt-dlp with user cookies"""
-        try:
-            ydl_opts = {
+        # Sharded mode: this process only enqueues jobs, WORKER_PROCESSES workers run them
+        self.worker_processes = int(os.getenv('WORKER_PROCESSES', '0'))
+        self.workers = {}  # worker name -> multiprocessing.Process
+        self.work_queue = None
+        if self.worker_processes > 0:
+            self.work_queue = WorkQueue(
+                os.getenv('JOB_QUEUE_PATH', os.path.join(self.temp_dir, 'jobs.db')),
+                lease_seconds=int(os.getenv('JOB_LEASE_SECONDS', '300')),
+                max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+            )
+        self.ffmpeg_available = None  # Probed once, not per reel
+        # ffmpeg/ffprobe run from handlers go through asyncio subprocesses, one per core at a time
+        self.media_processes = MediaProcessRunner(int(os.getenv('MAX_FFMPEG_PROCESSES', '0')) or None)
+        self.thumbnail_timeout = int(os.getenv('THUMBNAIL_TIMEOUT_SECONDS', '30'))
+        
+        # Each download works in its own directory under SCRATCH_DIR (point it at a tmpfs to keep media off disk)
+        self.scratch = ScratchSpace(
+            os.getenv('SCRATCH_DIR', os.path.join(self.temp_dir, 'scratch')),
+            budget=int(os.getenv('SCRATCH_BUDGET_MB', '2048')) * 1024 * 1024,
+            job_reserve=int(os.getenv('SCRATCH_JOB_RESERVE_MB', '100')) * 1024 * 1024,
+            min_free=int(os.getenv('SCRATCH_MIN_FREE_MB', '256')) * 1024 * 1024,
+            orphan_age=int(os.getenv('SCRATCH_ORPHAN_SECONDS', '3600'))
+        )
+        self.scratch_sweep_interval = int(os.getenv('SCRATCH_SWEEP_INTERVAL_SECONDS', '300'))
+        
+        # Stream media into a bounded in-memory buffer instead of writing it to disk
+        self.stream_downloads = os.getenv('STREAM_DOWNLOADS', '1') == '1'
+        self.spool_max_memory = int(os.getenv('SPOOL_MAX_MEMORY_MB', '20')) * 1024 * 1024
+        
+        # Format policy: smallest variant at the target resolution that Telegram will accept
+        self.target_resolution = int(os.getenv('TARGET_RESOLUTION', '720'))
+        self.max_video_bitrate = int(os.getenv('MAX_VIDEO_BITRATE_KBPS', '0'))
+        self.upload_limit = int(os.getenv('TELEGRAM_UPLOAD_LIMIT_MB', str(TELEGRAM_UPLOAD_LIMIT // 1024 // 1024))) * 1024 * 1024
+        self.transcode_timeout = int(os.getenv('TRANSCODE_TIMEOUT_SECONDS', '120'))
+        
+        # Self-hosted telegram-bot-api server in --local mode: uploads are handed over as file paths
+        # in the scratch directory (which the server must see at the same path), up to 2000 MB
+        self.bot_api_base_url = os.getenv('BOT_API_BASE_URL', '').rstrip('/')
+        self.local_upload_limit = int(os.getenv(
+            'LOCAL_BOT_API_UPLOAD_LIMIT_MB', str(LOCAL_BOT_API_UPLOAD_LIMIT // 1024 // 1024)
+        )) * 1024 * 1024
+        self.local_bot_api = False  # Set by configure_bot_api() once the server has answered
+        
+        # Blocking downloads run on a bounded worker pool instead of the event loop
+        self.download_pool = DownloadPool(
+            max_workers=int(os.getenv('MAX_CONCURRENT_DOWNLOADS', '4')),
+            per_user=int(os.getenv('MAX_DOWNLOADS_PER_USER', '2')),
+            queue_size=int(os.getenv('DOWNLOAD_QUEUE_SIZE', '20'))
+        )
+        # Only downloads holding a worker reserve scratch space, so the budget must fit one per worker
+        if self.scratch.budget < (self.download_pool.max_workers + 1) * self.scratch.job_reserve:
+            logger.warning(f"SCRATCH_BUDGET_MB fits fewer than {self.download_pool.max_workers + 1} reservations "
+                           f"of SCRATCH_JOB_RESERVE_MB; downloads will be refused while workers are idle")
+        
+        # Metadata and Telegram file_ids of reels we already uploaded
+        self.reel_cache = ReelCache(
+            os.getenv('CACHE_DB_PATH', os.path.join(self.temp_dir, 'reel_cache.db')),
+            ttl=int(os.getenv('CACHE_TTL_SECONDS', str(7 * 86400))),
+            max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+        )
+        self.reel_flights = SingleFlight()
+        
+        # Messages with several links are processed as one pipelined batch
+        self.batch_max_urls = int(os.getenv('BATCH_MAX_URLS', '20'))
+        self.batch_parallelism = min(int(os.getenv('BATCH_PARALLELISM', '2')), self.download_pool.per_user)
+        # Items of one carousel post downloaded at once, inside the post's download slot
+        self.carousel_parallelism = int(os.getenv('CAROUSEL_PARALLELISM', '4'))
+        
+        # Upload stage: retries reuse the downloaded bytes; all uploads of a job share one deadline
+        self.uploader = Uploader(
+            max_attempts=int(os.getenv('UPLOAD_MAX_ATTEMPTS', '4')),
+            deadline=int(os.getenv('UPLOAD_DEADLINE_SECONDS', '300'))
+        )
+        self.bot_api_connect_timeout = int(os.getenv('BOT_API_CONNECT_TIMEOUT', '10'))
+        self.bot_api_read_timeout = int(os.getenv('BOT_API_READ_TIMEOUT', '60'))
+        self.bot_api_write_timeout = int(os.getenv('BOT_API_WRITE_TIMEOUT', '120'))
+        
+        # Inline mode: reels nobody has fetched yet are downloaded in the background and uploaded
+        # to CACHE_CHAT_ID (a private channel or group the bot can post in) to get a reusable file_id
+        self.cache_chat_id = os.getenv('CACHE_CHAT_ID')
+        self.prefetch_workers = int(os.getenv('INLINE_PREFETCH_WORKERS', '2'))
+        self.prefetch_queue = asyncio.Queue(maxsize=int(os.getenv('INLINE_PREFETCH_QUEUE_SIZE', '50')))
+        self.prefetching = set()  # Shortcodes queued or being prefetched
+        
+        # /follow: recent reels of followed accounts are prefetched on a schedule, using only
+        # rate-limit tokens above FOLLOW_RESERVE_TOKENS so users' own requests keep priority
+        self.follow_store = FollowStore(
+            os.getenv('FOLLOW_DB_PATH', os.path.join(self.temp_dir, 'follows.db')),
+            max_per_user=int(os.getenv('FOLLOW_MAX_PER_USER', '10')),
+            interval=int(os.getenv('FOLLOW_POLL_INTERVAL_SECONDS', '900'))
+        )
+        self.follow_recent_reels = int(os.getenv('FOLLOW_RECENT_REELS', '6'))
+        self.follow_concurrency = int(os.getenv('FOLLOW_CONCURRENCY', '2'))
+        self.follow_reserve_tokens = float(os.getenv('FOLLOW_RESERVE_TOKENS', str(max(1, self.rate_limiter.burst // 2))))
+        
+        # Every admitted job and prefetch may hold a Bot API connection, plus a few for quick replies
+        self.bot_api_pool_size = int(os.getenv('BOT_API_POOL_SIZE', '0')) or (
+            self.download_pool.capacity + self.prefetch_workers + 8
+        )
+        
+        # Warm yt-dlp instances per cookie profile
+        self.extractors = ExtractorPool(
+            {
                 'format': 'best',
+                # Relative to the job's scratch directory, set as paths.home on every checkout
                 'outtmpl': '%(id)s.%(ext)s',
                 'quiet': True,
                 'no_warnings': True,
                 'extract_flat': False,
-            }
-            
-            # Add cookies if user has provided them
-            if user_id and user_id in self.user_cookies:
-                cookies_file = self.user_cookies[user_id]
-                if os.path.exists(cookies_file):
-                    ydl_opts['cookiefile'] = cookies_file
-                    logger.info(f"Using cookies for user {user_id}")
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+                # Photo items of carousels have no video formats; download_carousel fetches them itself
+                'ignore_no_formats_error': True,
+                # Only these extractors are loaded and matched against URLs (yt-dlp's --use-extractors)
+                'allowed_extractors': [name.strip() for name in os.getenv('YTDLP_EXTRACTORS', 'instagram.*').split(',')],
+            },
+            idle_timeout=int(os.getenv('EXTRACTOR_IDLE_SECONDS', '300'))
+        )
+        
+        # Prometheus /metrics and /healthz (0 disables); worker processes use the ports after it
+        self.metrics_port = int(os.getenv('METRICS_PORT', '9090'))
+        # Scale-to-zero hosting: bind the webhook port before anything else, see serve_webhook()
+        self.fast_start = os.getenv('FAST_START', '0') == '1'
+        self.metrics_server = None
+        self.register_metrics()
+        
+    def make_request(self):
+        """HTTPX request for Bot API calls, used in webhook, polling and worker mode alike"""
+        return make_bot_request(
+            self.bot_api_pool_size,
+            connect_timeout=self.bot_api_connect_timeout,
+            read_timeout=self.bot_api_read_timeout,
+            write_timeout=self.bot_api_write_timeout
+        )
+    
+    def configure_bot_api(self):
+        """Switch to the local Bot API server if one is configured and answers; returns whether it did"""
+        if not self.bot_api_base_url:
+            return False
+        if probe_local_bot_api(self.bot_api_base_url, self.bot_token):
+            self.local_bot_api = True
+            self.upload_limit = self.local_upload_limit
+            logger.info(f"Using the local Bot API server at {self.bot_api_base_url} "
+                        f"({self.upload_limit // 1024 // 1024} MB uploads by file path)")
+        else:
+            logger.warning(f"Falling back to the public Bot API ({self.upload_limit // 1024 // 1024} MB uploads)")
+        return self.local_bot_api
+    
+    def bot_api_options(self):
+        """Bot() keyword arguments for the Bot API server in use"""
+        if not self.local_bot_api:
+            return {}
+        return {
+            'base_url': f"{self.bot_api_base_url}/bot",
+            'base_file_url': f"{self.bot_api_base_url}/file/bot",
+            'local_mode': True,
+        }
+    
+    def register_metrics(self):
+        """Expose state that already lives in the pools, caches and limiter as scrape-time metrics"""
+        REGISTRY.gauge('download_pool_pending', 'Admitted downloads, running or waiting',
+                       function=lambda: {(): self.download_pool.pending})
+        REGISTRY.gauge('download_pool_workers', 'Download worker threads',
+                       function=lambda: {(): self.download_pool.max_workers})
+        REGISTRY.counter('reel_cache_lookups', 'Reel cache lookups by result', ['result'],
+                         function=lambda: {('hit',): self.reel_cache.hits, ('miss',): self.reel_cache.misses})
+        REGISTRY.gauge('reel_cache_entries', 'Reels in the file_id cache',
+                       function=lambda: {(): self.reel_cache.stats()['entries']})
+        REGISTRY.counter('singleflight_calls', 'Reel downloads by whether they were coalesced', ['result'],
+                         function=lambda: {('executed',): self.reel_flights.executions,
+                                           ('coalesced',): self.reel_flights.coalesced})
+        REGISTRY.counter('extractor_checkouts', 'YoutubeDL checkouts by whether an instance was reused', ['result'],
+                         function=lambda: {('created',): self.extractors.created, ('reused',): self.extractors.reused})
+        REGISTRY.gauge('rate_limit_tokens', 'Tokens left per extraction identity', ['identity'],
+                       function=lambda: {(identity,): state['tokens']
+                                         for identity, state in self.rate_limiter.snapshot().items()})
+        REGISTRY.gauge('rate_limit_backoff_seconds', 'Remaining backoff per extraction identity', ['identity'],
+                       function=lambda: {(identity,): state['backoff_seconds']
+                                         for identity, state in self.rate_limiter.snapshot().items()})
+        REGISTRY.counter('instagram_errors', 'Extraction errors per identity and class', ['identity', 'error_class'],
+                         function=lambda: {(identity, error_class): count
+                                           for identity, state in self.rate_limiter.snapshot().items()
+                                           for error_class, count in state['errors'].items()})
+        REGISTRY.gauge('scratch_used_bytes', 'Bytes used under the scratch root',
+                       function=lambda: {(): self.scratch.usage()})
+        REGISTRY.gauge('scratch_jobs', 'Jobs holding a scratch directory in this process',
+                       function=lambda: {(): self.scratch.jobs})
+        REGISTRY.counter('scratch_rejections', 'Jobs refused because of the disk budget',
+                         function=lambda: {(): self.scratch.rejected})
+        REGISTRY.counter('scratch_reclaimed_bytes', 'Bytes of orphaned scratch removed by the janitor',
+                         function=lambda: {(): self.scratch.reclaimed_bytes})
+        REGISTRY.gauge('inline_prefetch_queue', 'Inline reels waiting for a background download',
+                       function=lambda: {(): self.prefetch_queue.qsize()})
+        REGISTRY.gauge('follow_accounts', 'Accounts polled for /follow prefetching',
+                       function=lambda: {(): self.follow_store.stats()['accounts']})
+        REGISTRY.gauge('follow_prefetch_reels', 'Reels prefetched for followed accounts, by whether a user asked for them',
+                       ['requested'],
+                       function=lambda: (lambda stats: {('yes',): stats['hits'],
+                                                        ('no',): stats['prefetched'] - stats['hits']})(
+                           self.follow_store.stats()))
+        REGISTRY.gauge('media_processes', 'FFmpeg/ffprobe children started from handlers', ['state'],
+                       function=lambda: {('running',): self.media_processes.running,
+                                         ('waiting',): self.media_processes.waiting})
+        if self.work_queue:
+            REGISTRY.gauge('job_queue_depth', 'Jobs waiting for a worker process',
+                           function=lambda: {(): self.work_queue.depth()})
+    
+    def start_metrics_server(self, port):
+        if not port:
+            return
+        try:
+            self.metrics_server = MetricsServer(REGISTRY, port=port)
+            self.metrics_server.start()
+        except Exception as e:
+            logger.error(f"Could not start metrics server on port {port}: {e}")
+            self.metrics_server = None
+    
+    def cleanup_old_cookies(self):
+        """Remove cookies whose Instagram session has expired"""
+        try:
+            for user_id in self.cookie_store.purge_expired():
+                self.extractors.invalidate(f"user:{user_id}")
+                logger.info(f"Cleaned up expired cookies for user {user_id}")
+        except Exception as e:
+            logger.error(f"Error cleaning up cookies: {str(e)}")
+    
+    async def cookie_expiry_loop(self):
+        """Expire cookies at startup and then periodically while the bot is running"""
+        while True:
+            await asyncio.to_thread(self.cleanup_old_cookies)
+            await asyncio.sleep(self.cookie_expiry_interval)
+    
+    async def scratch_janitor_loop(self):
+        """Reclaim scratch directories left behind by crashed jobs, at startup and then periodically"""
+        while True:
+            try:
+                await asyncio.to_thread(self.scratch.sweep)
+            except Exception as e:
+                logger.error(f"Error sweeping scratch space: {str(e)}")
+            await asyncio.sleep(self.scratch_sweep_interval)
+    
+    async def post_init(self, application: Application):
+        """Start background jobs once the application is initialised"""
+        self.background_tasks.append(asyncio.create_task(self.cookie_expiry_loop()))
+        self.background_tasks.append(asyncio.create_task(self.scratch_janitor_loop()))
+        if self.cache_chat_id:
+            for _ in range(self.prefetch_workers):
+                self.background_tasks.append(asyncio.create_task(self.prefetch_loop(application.bot)))
+        self.background_tasks.append(asyncio.create_task(self.follow_loop(application.bot)))
+        self.start_metrics_server(self.metrics_port)
+        self.background_tasks.append(asyncio.create_task(self.startup_checks()))
+        if self.work_queue:
+            self.background_tasks.append(asyncio.create_task(self.supervise_workers()))
+    
+    async def startup_checks(self):
+        """Probe FFmpeg and warm up yt-dlp in the background, so they don't delay the first update"""
+        # Checked once; downloads and thumbnails reuse the result (and await it if they come first)
+        if await self.ensure_ffmpeg_checked():
+            logger.info("FFmpeg found - thumbnails will be available")
+        else:
+            logger.warning("FFmpeg not found - thumbnails will be disabled")
+        try:
+            await asyncio.to_thread(self.extractors.warm_up)
+        except Exception as e:
+            logger.error(f"Extractor warm-up failed: {e}")
+    
+    async def post_shutdown(self, application: Application):
+        """Stop background jobs and release resources"""
+        for task in self.background_tasks:
+            task.cancel()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.stop_workers()
+        self.extractors.close()
+        self.cookie_store.close()
+        self.reel_cache.close()
+        self.follow_store.close()
+        if self.work_queue:
+            self.work_queue.close()
+    
+    def job_handlers(self):
+        """Handlers worker processes can run, keyed by job kind"""
+        return {
+            'reel': self.reel_command,
+            'audio': self.audio_command,
+            'text': self.text_message,
+        }
+    
+    async def enqueue_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Queue a media command for the worker processes instead of running it here"""
+        text = update.message.text
+        kind = text.split()[0].lstrip('/').split('@')[0].lower() if text.startswith('/') else 'text'
+        
+        # Usage errors and messages without links are answered right away
+        if not find_instagram_urls(text, limit=1):
+            await self.job_handlers()[kind](update, context)
+            return
+        
+        # Keyed on update_id, so Telegram redelivering an update doesn't queue it twice
+        if self.work_queue.enqueue(update.update_id, kind, update.to_dict()):
+            logger.info(f"Queued update {update.update_id} ({kind}), {self.work_queue.depth()} jobs waiting")
+        else:
+            logger.info(f"Update {update.update_id} is already queued - ignoring redelivery")
+    
+    def start_worker(self, name, metrics_port=0):
+        """Spawn one worker process consuming the shared job queue"""
+        process = multiprocessing.get_context('spawn').Process(
+            target=run_worker_process, args=(self.bot_token, name, metrics_port), name=name, daemon=True
+        )
+        process.start()
+        self.workers[name] = process
+        logger.info(f"Started {name} (pid {process.pid})")
+    
+    async def supervise_workers(self):
+        """Keep WORKER_PROCESSES workers alive, restarting any that die"""
+        # Each worker has its own registry, scraped on the ports after METRICS_PORT
+        metrics_ports = {}
+        for i in range(self.worker_processes):
+            metrics_ports[f"worker-{i}"] = self.metrics_port + 1 + i if self.metrics_port else 0
+            self.start_worker(f"worker-{i}", metrics_ports[f"worker-{i}"])
+        
+        while True:
+            await asyncio.sleep(5)
+            for name, process in list(self.workers.items()):
+                if not process.is_alive():
+                    logger.error(f"{name} exited with code {process.exitcode} - restarting")
+                    self.start_worker(name, metrics_ports[name])
+            self.work_queue.purge()
+    
+    def stop_workers(self):
+        for process in self.workers.values():
+            process.terminate()
+        for process in self.workers.values():
+            process.join(timeout=10)
+        self.workers.clear()
+    
+    async def work(self, worker_name, metrics_port=0):
+        """Claim and run queued jobs until cancelled (the main loop of a worker process)"""
+        self.start_metrics_server(metrics_port)
+        self.background_tasks.append(asyncio.create_task(self.startup_checks()))
+        self.background_tasks.append(asyncio.create_task(self.scratch_janitor_loop()))
+        handlers = self.job_handlers()
+        slots = asyncio.Semaphore(self.download_pool.max_workers)
+        running = set()
+        last_sync = 0
+        
+        await asyncio.to_thread(self.configure_bot_api)
+        async with Bot(self.bot_token, request=self.make_request(), **self.bot_api_options()) as bot:
+            logger.info(f"{worker_name} ready")
+            while True:
+                # Cookies are uploaded through the update process
+                if time.monotonic() - last_sync > 5:
+                    for user_id in self.cookie_store.sync():
+                        self.extractors.invalidate(f"user:{user_id}")
+                    last_sync = time.monotonic()
                 
-                # Try to extract username from URL first (most reliable)
-                username = 'Unknown'
+                await slots.acquire()
+                job = await asyncio.to_thread(self.work_queue.claim, worker_name)
+                if not job:
+                    slots.release()
+                    await asyncio.sleep(0.5)
+                    continue
                 
-                # Method 1: Extract from URL
+                task = asyncio.create_task(self.run_job(bot, handlers, job, slots))
+                running.add(task)
+                task.add_done_callback(running.discard)
+    
+    async def run_job(self, bot, handlers, job, slots):
+        """Rebuild the queued update and run its handler as if it had just arrived
+
+        Handlers raise unexpected errors inside jobs instead of answering them,
+        so the job is retried; the user hears about it once it runs out of attempts.
+        """
+        update_id, kind, payload = job
+        current_job.set(update_id)
+        update = None
+        try:
+            update = Update.de_json(payload, bot)
+            context = SimpleNamespace(bot=bot, args=update.message.text.split()[1:])
+            # Past its lease the job may be claimed again; cancelling kills any ffmpeg it started
+            await asyncio.wait_for(handlers[kind](update, context), self.work_queue.lease_seconds)
+            self.work_queue.ack(update_id)
+        except Exception as e:
+            logger.error(f"Job {update_id} ({kind}) failed: {e!r}")
+            if self.work_queue.fail(update_id, e):
+                logger.info(f"Job {update_id} will be retried")
+            elif update is not None:
                 try:
-                    # Extract username from Instagram URL patterns
-                    # URLs like: https://www.instagram.com/reel/ABC123/ or https://www.instagram.com/p/ABC123/
-                    # or https://www.instagram.com/username/reel/ABC123/
-                    url_pattern = r'instagram\.com/(?:([^/]+)/(?:reel|p)/[^/]+|reel/[^/?]+.*[\?&]taken-by=([^&]+))'
-                    match = re.search(url_pattern, url)
-                    if match:
-                        extracted_username = match.group(1) or match.group(2)
-                        if extracted_username and not extracted_username in ['reel', 'p', 'tv']:
-                            username = extracted_username
-                            logger.info(f"Username extracted from URL: {username}")
-                except Exception as e:
-                    logger.error(f"Error extracting username from URL: {e}")
-                
-                # Method 2: Try yt-dlp fields if URL extraction failed
-                if username == 'Unknown':
-                    # Check webpage_url or original_url for username
-                    for url_field in ['webpage_url', 'original_url', 'url']:
-                        if info.get(url_field):
-                            try:
-                                match = re.search(r'instagram\.com/([^/]+)/', info[url_field])
-                                if match and match.group(1) not in ['reel', 'p', 'tv']:
-                                    username = match.group(1)
-                                    logger.info(f"Username found in {url_field}: {username}")
-                                    break
-                            except:
-                                continue
-                
-                # Method 3: Try yt-dlp metadata fields (avoid numeric IDs)
-                if username == 'Unknown':
-                    for field in ['uploader', 'channel', 'creator', 'uploader_id']:
-                        field_value = info.get(field)
-                        if field_value and not field_value.isdigit() and len(field_value) > 2:
-                            username = field_value
-                            logger.info(f"Username from {field}: {username}")
+                    await update.message.reply_text(" Error: Something went wrong. Please try again or check if the reel is public.")
+                except Exception:
+                    pass
+        finally:
+            slots.release()
+    
+    def job_sent(self, key):
+        """Whether an earlier attempt at the running job already delivered key (a link, or audio:<link>)"""
+        update_id = current_job.get()
+        return update_id is not None and self.work_queue.was_sent(update_id, key)
+    
+    def mark_job_sent(self, key):
+        """Record a delivery of the running job, so that a retry after its lease ran out skips it"""
+        update_id = current_job.get()
+        if update_id is not None:
+            self.work_queue.mark_sent(update_id, key)
+        
+    def resolve_username(self, url, info):
+        """Work out the account username from the URL or yt-dlp metadata"""
+        # Try to extract username from URL first (most reliable)
+        username = 'Unknown'
+        
+        # Method 1: Extract from URL (/username/reel/ABC123/ or ?taken-by=username)
+        parsed = parse_instagram_url(url)
+        if parsed and parsed.username:
+            username = parsed.username
+            logger.info(f"Username extracted from URL: {username}")
+        
+        # Method 2: Try yt-dlp fields if URL extraction failed
+        if username == 'Unknown':
+            # Check webpage_url or original_url for username
+            for url_field in ['webpage_url', 'original_url', 'url']:
+                if info.get(url_field):
+                    try:
+                        match = INFO_URL_USERNAME_PATTERN.search(info[url_field])
+                        if match and match.group(1) not in ['reel', 'p', 'tv']:
+                            username = match.group(1)
+                            logger.info(f"Username found in {url_field}: {username}")
                             break
+                    except:
+                        continue
+        
+        # Method 3: Try yt-dlp metadata fields (avoid numeric IDs)
+        if username == 'Unknown':
+            for field in ['uploader', 'channel', 'creator', 'uploader_id']:
+                field_value = info.get(field)
+                if field_value and not field_value.isdigit() and len(field_value) > 2:
+                    username = field_value
+                    logger.info(f"Username from {field}: {username}")
+                    break
+        
+        # Clean up username
+        if username != 'Unknown':
+            # Remove @ if it already exists
+            username = username.lstrip('@')
+            # Replace spaces with underscores
+            username = username.replace(' ', '_')
+            # Remove invalid characters but keep letters, numbers, dots, underscores
+            username = INVALID_USERNAME_CHARS.sub('', username)
+            # Make sure it's not empty after cleaning
+            if not username:
+                username = 'Unknown'
+        
+        logger.info(f"Final username: {username}")
+        return username
+    
+    def stream_reel(self, info, workdir, thumbnails=True):
+        """Stream the resolved media URL into a spooled buffer, extracting thumbnails on the way"""
+        duration = info.get('duration')
+        tee = None
+        # Clips under 2s don't get thumbnails
+        if thumbnails and self.ffmpeg_available and duration and duration >= 2:
+            try:
+                tee = FrameTee(duration)
+            except OSError as e:
+                logger.error(f"Could not start streamed thumbnail extraction: {e}")
+        
+        # The local Bot API server reads uploads from disk, so the media goes straight to a named file
+        path = None
+        if self.local_bot_api and workdir:
+            path = os.path.join(workdir, f"{info['id']}.{info.get('ext') or 'mp4'}")
+        
+        try:
+            video = stream_media(
+                info['url'],
+                headers=info.get('http_headers'),
+                max_memory=self.spool_max_memory,
+                spool_dir=workdir,
+                tee=tee,
+                path=path
+            )
+        except Exception:
+            if tee:
+                tee.abort()
+            raise
+        
+        try:
+            frames = tee.finish() if tee else []
+            if frames is None:
+                # Not decodable from a pipe (moov atom at the end) - extract from a real file instead
+                frames = []
+                with tempfile.NamedTemporaryFile(suffix=f".{info.get('ext', 'mp4')}", dir=workdir) as video_copy:
+                    shutil.copyfileobj(video, video_copy)
+                    video_copy.flush()
+                    frames = extract_thumbnails(video_copy.name, duration)
+        except Exception as e:
+            # The video is fine; Instagram must not be blamed for a broken decoder, so send it without thumbnails
+            logger.error(f"Thumbnail extraction for {info.get('id')} failed: {e}")
+            frames = []
+        
+        try:
+            video.seek(0)
+        except Exception:
+            video.close()
+            raise
+        return video, frames
+    
+    def extraction_identity(self, user_id=None, reserve=None):
+        """Pick the cookie profile for a request and take a rate-limit token for it
+
+        Background work passes the tokens it must leave for users as ``reserve``
+        and never borrows other accounts' cookies.
+        """
+        # Add cookies if user has provided them
+        profile = ANONYMOUS
+        cookies = self.cookie_store.get(user_id) if user_id else None
+        if cookies:
+            profile = f"user:{user_id}"
+            logger.info(f"Using cookies for user {user_id}")
+        
+        # Throttled anonymous traffic may borrow the cookies of accounts that opted in
+        fallbacks = []
+        if profile == ANONYMOUS and reserve is None:
+            fallbacks = [f"user:{uid}" for uid in self.spillover_users if self.cookie_store.has(uid)]
+        selected, _ = self.rate_limiter.select(profile, fallbacks)
+        if selected != profile:
+            profile = selected
+            cookies = self.cookie_store.get(int(selected.split(':', 1)[1]))
+        
+        # Raises RateLimitedError if the identity is backing off for longer than we can wait
+        self.rate_limiter.acquire(profile, max_wait=self.rate_limit_max_wait, reserve=reserve or 0)
+        return profile, cookies
+    
+    def choose_format(self, info):
+        """Switch yt-dlp's 'best' pick to the smallest format that meets the target and fits Telegram"""
+        formats = select_format(
+            info,
+            target_resolution=self.target_resolution,
+            max_bitrate_kbps=self.max_video_bitrate,
+            max_bytes=self.upload_limit,
+            allow_merge=bool(self.ffmpeg_available)
+        )
+        if not formats:
+            FORMAT_DECISIONS.inc(outcome='default')
+            return info
+        
+        selected = apply_format(info, formats)
+        FORMAT_DECISIONS.inc(outcome='selected')
+        best_size = estimate_size(info, info.get('duration'))
+        selected_size = sum(estimate_size(fmt, info.get('duration')) or 0 for fmt in formats)
+        if best_size and selected_size and best_size > selected_size:
+            FORMAT_BYTES_SAVED.inc(best_size - selected_size)
+        logger.info(f"Format {selected.get('format_id')} ({selected.get('width')}x{selected.get('height')}) "
+                    f"instead of {info.get('format_id')} ({info.get('width')}x{info.get('height')})")
+        return selected
+    
+    def fit_upload_limit(self, video, video_file, info, workdir):
+        """Transcode downloads larger than Telegram accepts and remux non-MP4 ones, returning (video, video_file)"""
+        if video is not None:
+            video.seek(0, os.SEEK_END)
+            size = video.tell()
+            video.seek(0)
+        else:
+            size = os.path.getsize(video_file)
+        fits = size <= self.upload_limit
+        if fits and (info.get('ext') == 'mp4' or not self.ffmpeg_available):
+            return video, video_file
+        if not fits and not self.ffmpeg_available:
+            FORMAT_DECISIONS.inc(outcome='too_large')
+            raise TranscodeError(f"{size / 1024 / 1024:.0f} MB is over the upload limit and FFmpeg is not installed")
+        
+        source = video_file
+        if video is not None:
+            with tempfile.NamedTemporaryFile(suffix=f".{info.get('ext') or 'mp4'}", dir=workdir, delete=False) as copy:
+                shutil.copyfileobj(video, copy)
+                source = copy.name
+            video.seek(0)
+        fitted = os.path.join(workdir, f"{info['id']}.fitted.mp4")
+        
+        try:
+            if fits:
+                # Telegram only streams MP4; copying the streams over is cheap
+                remux_video(source, fitted)
+            else:
+                logger.info(f"{info['id']} is {size / 1024 / 1024:.1f} MB, transcoding to fit {self.upload_limit / 1024 / 1024:.0f} MB")
+                fit_video(source, fitted, self.upload_limit, info.get('duration'),
+                          max_resolution=self.target_resolution, timeout=self.transcode_timeout)
+                if os.path.getsize(fitted) > self.upload_limit:
+                    raise TranscodeError("Transcoded video is still over the upload limit")
+        except Exception as e:
+            if os.path.exists(fitted):
+                os.remove(fitted)
+            if video is not None:
+                os.remove(source)
+            if fits:
+                # Sending the original container is still better than nothing
+                logger.error(f"Remux failed, sending {info.get('ext')} as is: {e}")
+                return video, video_file
+            FORMAT_DECISIONS.inc(outcome='too_large')
+            raise
+        
+        os.remove(source)
+        if video is not None:
+            video.close()
+        FORMAT_DECISIONS.inc(outcome='remuxed' if fits else 'transcoded')
+        info['ext'] = 'mp4'
+        return None, fitted
+    
+    def in_scratch(self, func, url, workdir, *args):
+        """Run a download (on a pool worker) while holding its scratch reservation"""
+        with self.scratch.reserve(workdir):
+            return func(url, workdir, *args)
+    
+    def download_reel(self, url, workdir=None, user_id=None, with_thumbnails=True, mode='media', reserve=None):
+        """Download Instagram reel using yt-dlp with user cookies into the job's scratch directory
+
+        With ``mode='info'`` only the metadata is extracted: no media is fetched,
+        nothing is written to ``workdir`` and the result has no video.
+        ``reserve`` is passed on to extraction_identity() for background work.
+        """
+        profile, cookies = self.extraction_identity(user_id, reserve)
+        video = None
+        video_file = None
+        try:
+            # Reuse a warm YoutubeDL (extractors, HTTP connections, parsed cookies) for this profile
+            with self.extractors.checkout(profile, cookies) as ydl:
+                # Pooled instances are shared between jobs, so point this one at the job's directory
+                ydl.params['paths'] = {'home': workdir or self.temp_dir}
+                # Resolve metadata and the media URL first, then decide how to fetch the bytes
+                info = ydl.extract_info(url, download=False)
+                username = self.resolve_username(url, info)
+                if mode == 'info':
+                    self.rate_limiter.record_success(profile)
+                    return self.reel_metadata(info, username)
+                if is_carousel(info):
+                    items = self.download_carousel(ydl, info, workdir, with_thumbnails)
+                    self.rate_limiter.record_success(profile)
+                    return dict(self.reel_metadata(info, username), items=items, workdir=workdir)
+                info = self.choose_format(info)
                 
-                # Clean up username
-                if username != 'Unknown':
-                    # Remove @ if it already exists
-                    username = username.lstrip('@')
-                    # Replace spaces with underscores
-                    username = username.replace(' ', '_')
-                    # Remove invalid characters but keep letters, numbers, dots, underscores
-                    username = re.sub(r'[^a-zA-Z0-9._]', '', username)
-                    # Make sure it's not empty after cleaning
-                    if not username:
-                        username = 'Unknown'
-                
-                logger.info(f"Final username: {username}")
+                thumbnails = None  # None = not generated yet
+                if self.stream_downloads and can_stream(info):
+                    video, thumbnails = self.stream_reel(info, workdir, with_thumbnails)
+                else:
+                    # Separate audio/video formats need yt-dlp to download and merge them
+                    ydl.process_info(info)
+                    video_file = info.get('filepath') or ydl.prepare_filename(info)
+                    if os.path.exists(video_file):
+                        BYTES_DOWNLOADED.inc(os.path.getsize(video_file))
+                        MEDIA_SIZE.observe(os.path.getsize(video_file))
+                    if not with_thumbnails:
+                        thumbnails = []
                 
-                return {
-                    'video_file': f"{info['id']}.{info['ext']}",
-                    'username': username,
-                    'caption': info.get('description', 'No caption'),
-                    'likes': info.get('like_count', 0),
-                    'shortcode': info['id']
-                }
+                self.rate_limiter.record_success(profile)
         except Exception as e:
-            logger.error(f"Download error: {str(e)}")
+            error_class = classify_error(e)
+            self.rate_limiter.record_failure(profile, error_class, url)
+            ERRORS.inc(error_class=error_class)
+            logger.error(f"Download error ({error_class}): {str(e)}")
             return None
+        
+        # Oversized videos are not Instagram's fault, so this sits outside the limiter bookkeeping
+        try:
+            video, video_file = self.fit_upload_limit(video, video_file, info, workdir)
+        except Exception:
+            ERRORS.inc(error_class='too_large')
+            if video is not None:
+                video.close()
+            if video_file and os.path.exists(video_file):
+                os.remove(video_file)
+            raise
+        
+        return dict(
+            self.reel_metadata(info, username),
+            video_file=video_file,
+            video=video,
+            thumbnails=thumbnails,
+            ext=info.get('ext'),
+            workdir=workdir
+        )
     
-    def check_ffmpeg_installed(self):
+    def download_carousel(self, ydl, info, workdir, with_thumbnails=True):
+        """Download every item of a carousel (or photo) post, up to carousel_parallelism at a time
+
+        Returns the items in post order: photos as {'type': 'photo', 'photo'}
+        and videos as {'type': 'video', 'video', 'video_file', 'thumbnails', ...}.
+        Thumbnails are only extracted for videos. If any item fails, the
+        others are closed and the error is raised.
+        """
+        entries = list(info.get('entries') or [info])
+        ydl_lock = threading.Lock()  # YoutubeDL is not thread-safe; only merged formats need it
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(self.carousel_parallelism, len(entries)))) as executor:
+            futures = [executor.submit(self.download_item, ydl, ydl_lock, entry, workdir, with_thumbnails)
+                       for entry in entries]
+            wait(futures)
+        
+        errors = [future.exception() for future in futures if future.exception()]
+        items = [future.result() for future in futures if not future.exception()]
+        if errors:
+            for item in items:
+                close_item(item)
+            raise errors[0]
+        logger.info(f"Downloaded {len(items)} items of {info['id']}")
+        return items
+    
+    def download_item(self, ydl, ydl_lock, entry, workdir, with_thumbnails):
+        """Download one carousel item (runs on download_carousel's threads)"""
+        if not entry.get('formats') and not entry.get('url'):
+            # Photos come without formats; the largest thumbnail is the photo itself
+            photo_url = entry.get('thumbnail') or (entry.get('thumbnails') or [{}])[-1].get('url')
+            if not photo_url:
+                raise ValueError(f"Carousel item {entry.get('id')} has no media")
+            photo = stream_media(photo_url, headers=entry.get('http_headers'),
+                                 max_memory=self.spool_max_memory, spool_dir=workdir)
+            return {'type': 'photo', 'photo': photo, 'id': entry.get('id')}
+        
+        entry = self.choose_format(entry)
+        video = None
+        video_file = None
+        thumbnails = None
+        if self.stream_downloads and can_stream(entry):
+            video, thumbnails = self.stream_reel(entry, workdir, with_thumbnails)
+        else:
+            with ydl_lock:
+                ydl.process_info(entry)
+            video_file = entry.get('filepath') or ydl.prepare_filename(entry)
+            if not with_thumbnails:
+                thumbnails = []
+        video, video_file = self.fit_upload_limit(video, video_file, entry, workdir)
+        return {
+            'type': 'video',
+            'id': entry.get('id'),
+            'video': video,
+            'video_file': video_file,
+            'thumbnails': thumbnails,
+            'ext': entry.get('ext'),
+            'duration': entry.get('duration'),
+        }
+    
+    def download_audio(self, url, workdir, user_id=None):
+        """Download a reel's soundtrack into the job's scratch directory as an M4A, without re-encoding
+
+        Fetches an audio-only format when Instagram offers one, otherwise the
+        smallest video variant, and copies the audio stream out with ffmpeg.
+        The result has ``audio_file=None`` when the reel has no audio, and
+        like download_reel it is None when Instagram fails.
+        """
+        profile, cookies = self.extraction_identity(user_id)
+        try:
+            with self.extractors.checkout(profile, cookies) as ydl:
+                info = ydl.extract_info(url, download=False)
+                username = self.resolve_username(url, info)
+                metadata = self.reel_metadata(info, username)
+                if is_carousel(info):
+                    # The first video of a post carries its soundtrack
+                    info = next((entry for entry in info.get('entries') or [info]
+                                 if entry.get('formats') or entry.get('url')), None)
+                fmt, audio_only = select_audio_format(info, self.upload_limit) if info else (None, False)
+                source = None
+                if fmt and is_http(fmt):
+                    source = os.path.join(workdir, f"{info['id']}.source.{fmt.get('ext') or 'mp4'}")
+                    stream_media(fmt['url'], headers=fmt.get('http_headers') or info.get('http_headers'),
+                                 spool_dir=workdir, path=source).close()
+                self.rate_limiter.record_success(profile)
+        except Exception as e:
+            error_class = classify_error(e)
+            self.rate_limiter.record_failure(profile, error_class, url)
+            ERRORS.inc(error_class=error_class)
+            logger.error(f"Download error ({error_class}): {str(e)}")
+            return None
+        
+        if not source:
+            return dict(metadata, audio_file=None, workdir=workdir)
+        logger.info(f"Audio of {info['id']} from {'audio-only' if audio_only else 'video'} format {fmt.get('format_id')}")
+        
+        if not self.ffmpeg_available:
+            if not (audio_only and fmt.get('ext') == 'm4a'):
+                raise TranscodeError("FFmpeg is needed to extract the audio")
+            audio_file = source
+        else:
+            audio_file = os.path.join(workdir, f"{info['id']}.m4a")
+            try:
+                extract_audio(source, audio_file, timeout=self.transcode_timeout)
+            except NoAudioError:
+                return dict(metadata, audio_file=None, workdir=workdir)
+            finally:
+                os.remove(source)
+        
+        if os.path.getsize(audio_file) > self.upload_limit:
+            raise TranscodeError("Audio is over the upload limit")
+        return dict(metadata, audio_file=audio_file, workdir=workdir)
+    
+    def reel_metadata(self, info, username):
+        """The fields of a download_reel result that the cache keeps and /info shows"""
+        return {
+            'username': username,
+            'caption': info.get('description', 'No caption'),
+            'likes': info.get('like_count', 0),
+            'duration': info.get('duration'),
+            'shortcode': info['id'],
+        }
+    
+    async def check_ffmpeg_installed(self):
         """Check if FFmpeg is available"""
         try:
             # Check FFmpeg
-            result = subprocess.run(['ffmpeg', '-version'], capture_output=True, timeout=5, text=True)
+            result = await self.media_processes.run(['ffmpeg', '-version'], timeout=5)
             if result.returncode == 0:
                 logger.info("FFmpeg check successful")
                 # Also check ffprobe
-                probe_result = subprocess.run(['ffprobe', '-version'], capture_output=True, timeout=5, text=True)
+                probe_result = await self.media_processes.run(['ffprobe', '-version'], timeout=5)
                 if probe_result.returncode == 0:
                     logger.info("FFprobe check successful")
                     return True
@@ -144,7 +914,7 @@ class InstaReelBot:
                     return False
             else:
                 logger.error(f"FFmpeg check failed with return code: {result.returncode}")
-                logger.error(f"FFmpeg stderr: {result.stderr}")
+                logger.error(f"FFmpeg stderr: {result.stderr.decode(errors='replace')}")
                 return False
         except FileNotFoundError as e:
             logger.error(f"FFmpeg not found in PATH: {e}")
@@ -162,53 +932,36 @@ class InstaReelBot:
             logger.error(f"Unexpected error checking FFmpeg: {e}")
             return False
     
-    def generate_thumbnails(self, video_file, shortcode):
-        """Generate 5 random thumbnails from video"""
-        thumbnails = []
-        
-        # Check if FFmpeg is available
-        if not self.check_ffmpeg_installed():
+    async def ensure_ffmpeg_checked(self):
+        """Probe FFmpeg on first use; download threads read ffmpeg_available without probing"""
+        if self.ffmpeg_available is None:
+            self.ffmpeg_available = await self.check_ffmpeg_installed()
+        return self.ffmpeg_available
+    
+    async def generate_thumbnails(self, video_file, shortcode, duration=None):
+        """Pick up to 5 distinct keyframe thumbnails from the video as in-memory JPEG bytes"""
+        if not await self.ensure_ffmpeg_checked():
             logger.warning("FFmpeg not found - skipping thumbnail generation")
             return []
         
         try:
-            # Get video duration
-            result = subprocess.run(
-                ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', 
-                 '-of', 'default=noprint_wrappers=1:nokey=1', video_file],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode != 0:
-                logger.error("FFprobe failed - video duration check failed")
-                return []
-                
-            duration = float(result.stdout.strip())
+            # yt-dlp already knows the duration; only probe files without metadata
+            if not duration:
+                duration = await probe_duration_async(self.media_processes, video_file)
+                if duration is None:
+                    logger.error("FFprobe failed - video duration check failed")
+                    return []
             
             if duration < 2:
                 logger.info("Video too short for thumbnails")
                 return []
             
-            # Generate 5 random timestamps
-            num_thumbs = min(5, int(duration) - 1)
-            if num_thumbs < 1:
-                return []
-                
-            timestamps = sorted(random.sample(range(1, int(duration)), num_thumbs))
-            
-            for i, timestamp in enumerate(timestamps, 1):
-                thumbnail_file = f"{shortcode}_thumb_{i}.jpg"
-                
-                result = subprocess.run([
-                    'ffmpeg', '-ss', str(timestamp), '-i', video_file,
-                    '-vframes', '1', '-q:v', '2', thumbnail_file, '-y'
-                ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
-                
-                if result.returncode == 0 and os.path.exists(thumbnail_file):
-                    thumbnails.append(thumbnail_file)
-                    logger.info(f"Generated thumbnail {i}/{num_thumbs}")
+            # Candidates come out of a single ffmpeg pass; only the distinct picks are encoded
+            thumbnails = await extract_thumbnails_async(
+                self.media_processes, video_file, duration, timeout=self.thumbnail_timeout
+            )
+            logger.info(f"Generated {len(thumbnails)} thumbnails for {shortcode}")
+            return thumbnails
             
         except FileNotFoundError:
             logger.error("FFmpeg not found in system PATH - install FFmpeg to enable thumbnails")
@@ -217,7 +970,7 @@ class InstaReelBot:
         except Exception as e:
             logger.error(f"Thumbnail generation error: {str(e)}")
         
-        return thumbnails
+        return []
     
     def validate_cookies(self, cookies_content):
         """Validate cookies.txt format"""
@@ -245,22 +998,19 @@ class InstaReelBot:
             return False
     
     def save_user_cookies(self, user_id, cookies_content):
-        """Save cookies to a temporary file for the user"""
+        """Save cookies to the encrypted cookie store for the user"""
         try:
-            # Create a temporary file for this user's cookies
-            temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=f'_cookies_{user_id}.txt')
-            temp_file.write(cookies_content)
-            temp_file.close()
+            expires_at = self.cookie_store.save(user_id, cookies_content)
             
-            # Store the file path
-            self.user_cookies[user_id] = temp_file.name
-            logger.info(f"Saved cookies for user {user_id}")
+            # Pooled extractors still hold the previous cookies
+            self.extractors.invalidate(f"user:{user_id}")
+            logger.info(f"Saved cookies for user {user_id} (valid until {time.strftime('%Y-%m-%d', time.gmtime(expires_at))})")
             
-            return temp_file.name
+            return True
             
         except Exception as e:
             logger.error(f"Error saving cookies: {str(e)}")
-            return None
+            return False
     
     async def cookies_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /cookies command"""
@@ -314,9 +1064,7 @@ To bypass Instagram rate limits, you need to provide your browser cookies:
                 # Validate cookies
                 if self.validate_cookies(cookies_text):
                     # Save cookies for this user
-                    cookies_file = self.save_user_cookies(user_id, cookies_text)
-                    
-                    if cookies_file:
+                    if self.save_user_cookies(user_id, cookies_text):
                         await processing_msg.edit_text(
                             "**Cookies successfully uploaded and validated!**\n\n"
                             " Your Instagram downloads should now work without rate limits!\n"
@@ -351,7 +1099,7 @@ To bypass Instagram rate limits, you need to provide your browser cookies:
         """Check cookie status for user"""
         user_id = update.message.from_user.id
         
-        if user_id in self.user_cookies and os.path.exists(self.user_cookies[user_id]):
+        if self.cookie_store.has(user_id):
             await update.message.reply_text(
                 "**Cookies Active**\n\n"
                 "Your authentication cookies are loaded and working.\n"
@@ -380,13 +1128,17 @@ Send me an Instagram Reel link:
 • Account username  
 • Full caption
 • High quality video
-• 5 random thumbnails
+• Up to 5 distinct thumbnails
 
 **Important for unlimited downloads:**
 Use `/cookies` to setup authentication and avoid rate limits!
 
+You can also paste several links in one message.
+
 **Commands:**
 • `/reel [url]` - Download Instagram reel
+• `/info [url]` - Username, likes and caption only (fast)
+• `/follow [username]` - Fetch an account's new reels ahead of time
 • `/cookies` - Setup authentication cookies
 • `/help` - Show detailed help
 
@@ -394,35 +1146,724 @@ Use `/cookies` to setup authentication and avoid rate limits!
 """
         await update.message.reply_text(welcome_message, parse_mode='Markdown')
     
+    def format_info_message(self, result, footer="⬇️ Sending video..."):
+        """Build the reel info message shown before the video"""
+        caption = result['caption'] or ''
+        return f"""
+**Reel Found!**
+
+👤 **Account:** @{result['username']}
+❤️ **Likes:** {result['likes'] or 0:,}
+
+📝 **Caption:**
+{caption[:800]}{"..." if len(caption) > 800 else ""}
+
+{footer}
+"""
+    
+    def format_video_caption(self, result):
+        """Build the caption attached to the uploaded video"""
+        caption = result['caption'] or ''
+        return f"🎥 **@{result['username']}**\n\n{caption[:200]}{'...' if len(caption) > 200 else ''}"
+    
+    async def send_cached_reel(self, update: Update, entry):
+        """Answer a /reel request from cached Telegram file_ids without downloading anything"""
+        if entry.get('items'):
+            await update.message.reply_text(
+                self.format_info_message(entry, f"⬇️ Sending {len(entry['items'])} items..."), parse_mode='Markdown'
+            )
+            await self.upload_carousel(update.message, entry)
+        else:
+            await update.message.reply_text(self.format_info_message(entry), parse_mode='Markdown')
+            await update.message.reply_video(
+                video=entry['video_file_id'],
+                caption=self.format_video_caption(entry),
+                parse_mode='Markdown',
+                supports_streaming=True
+            )
+        
+        if entry['thumbnail_file_ids']:
+            await self.send_thumbnails(update, entry['thumbnail_file_ids'])
+        
+        await update.message.reply_text("Done! Enjoy your reel! ")
+    
+    async def send_thumbnails(self, update: Update, thumbnails, deadline=None):
+        """Send thumbnails (JPEG bytes or file_ids) as an album, or a single photo since albums need two"""
+        if len(thumbnails) == 1:
+            return [await self.uploader.send(
+                lambda: update.message.reply_photo(photo=thumbnails[0], caption="📸 Thumbnail"),
+                kind='thumbnail', deadline=deadline
+            )]
+        media = [
+            InputMediaPhoto(media=thumb, caption=f"📸 Thumbnail {i}/{len(thumbnails)}" if i == 1 else "")
+            for i, thumb in enumerate(thumbnails, 1)
+        ]
+        return await self.uploader.send(
+            lambda: update.message.reply_media_group(media=media), kind='thumbnail', deadline=deadline
+        )
+    
+    def video_input(self, result, filename, stack, attach=False):
+        """What to upload for a download: its path for a local Bot API server, otherwise a stream of it
+
+        Nothing is read into memory: the spooled buffer, or the file opened on
+        ``stack``, is streamed to the Bot API and rewound before every
+        attempt, so upload retries resend it without downloading it again.
+        """
+        if self.local_bot_api:
+            path = result.get('video_file')
+            if result.get('video') is not None:
+                path = getattr(result['video'], 'name', None)  # Only named files have a str name
+            if isinstance(path, str) and os.path.exists(path):
+                # PTB hands Paths to a local-mode server as file:// URIs; nothing is read or sent here
+                return Path(path).absolute()
+        handle = result.get('video')
+        if handle is None:
+            handle = stack.enter_context(open(result['video_file'], 'rb'))
+        return upload_file(handle, filename, attach=attach)
+    
+    async def upload_video(self, send, result, deadline=None, **kwargs):
+        """Upload a download_reel result with send (reply_video/send_video) and return the message"""
+        with ExitStack() as stack:
+            video = self.video_input(result, f"{result['shortcode']}.{result.get('ext') or 'mp4'}", stack)
+            message = await self.uploader.send(lambda: send(
+                video=video,
+                caption=self.format_video_caption(result),
+                parse_mode='Markdown',
+                supports_streaming=True,
+                **kwargs
+            ), kind='video', deadline=deadline)
+            BYTES_UPLOADED.inc(upload_size(video), kind='video')
+        return message
+    
+    def audio_title(self, result):
+        """Track title for a reel's audio: the first line of its caption, or its shortcode"""
+        lines = [line.strip() for line in (result.get('caption') or '').splitlines() if line.strip()]
+        title = lines[0] if lines and result.get('caption') != 'No caption' else f"Reel {result['shortcode']}"
+        return title[:64] + ('...' if len(title) > 64 else '')
+    
+    async def upload_audio(self, send, result, deadline=None):
+        """Upload a download_audio result with send (reply_audio) and return the message"""
+        audio_file = result['audio_file']
+        with ExitStack() as stack:
+            if self.local_bot_api:
+                audio = Path(audio_file).absolute()
+            else:
+                audio = upload_file(stack.enter_context(open(audio_file, 'rb')),
+                                    f"{result['shortcode']}{os.path.splitext(audio_file)[1]}")
+            message = await self.uploader.send(lambda: send(
+                audio=audio,
+                performer=f"@{result['username']}",
+                title=self.audio_title(result),
+                duration=int(result['duration']) if result.get('duration') else None
+            ), kind='audio', deadline=deadline)
+            BYTES_UPLOADED.inc(upload_size(audio), kind='audio')
+        return message
+    
+    async def send_cached_audio(self, update: Update, entry):
+        """Answer /audio from a cached file_id: no download, no ffmpeg, no upload"""
+        await update.message.reply_audio(
+            audio=entry['audio_file_id'],
+            performer=f"@{entry['username']}",
+            title=self.audio_title(entry)
+        )
+    
+    def carousel_media(self, item, stack, caption=None, attach=True):
+        """InputMedia for a downloaded or cached carousel item, streaming downloaded ones (see video_input)
+
+        ``attach`` is for albums; a lone item goes out with reply_photo/reply_video,
+        which take the file itself rather than an attach:// reference.
+        """
+        if item['type'] == 'photo':
+            media = item.get('file_id') or upload_file(item['photo'], f"{item.get('id')}.jpg", attach=attach)
+            return InputMediaPhoto(media=media, caption=caption, parse_mode='Markdown')
+        return InputMediaVideo(
+            media=item.get('file_id') or self.video_input(item, f"{item.get('id')}.{item.get('ext') or 'mp4'}",
+                                                          stack, attach=attach),
+            caption=caption,
+            parse_mode='Markdown',
+            supports_streaming=True
+        )
+    
+    async def upload_carousel(self, target, result, deadline=None):
+        """Send a carousel's items as albums through target (a Message, or send functions bound to a chat)
+
+        Returns the items' file_ids in post order (None where Telegram sent
+        back something unexpected). Items are streamed from their buffers or
+        files, so upload retries reuse the download.
+        """
+        items = result['items']
+        caption = self.format_video_caption(result)
+        file_ids = []
+        uploaded = 0
+        for album in album_chunks(items, ALBUM_SIZE):
+            with ExitStack() as stack:
+                media = [self.carousel_media(item, stack, caption if item is items[0] else None, attach=len(album) > 1)
+                         for item in album]
+                uploaded += sum(upload_size(item.media) for item in media)
+                if len(media) == 1:
+                    # Albums need two items; a photo post goes out on its own
+                    single = media[0]
+                    if isinstance(single, InputMediaPhoto):
+                        send = lambda: target.reply_photo(photo=single.media, caption=single.caption,
+                                                          parse_mode='Markdown')
+                    else:
+                        send = lambda: target.reply_video(video=single.media, caption=single.caption,
+                                                          parse_mode='Markdown', supports_streaming=True)
+                    messages = [await self.uploader.send(send, kind='album', deadline=deadline)]
+                else:
+                    messages = await self.uploader.send(
+                        lambda: target.reply_media_group(media=media), kind='album', deadline=deadline
+                    )
+            file_ids.extend(sent_file_id(message) for message in messages)
+        BYTES_UPLOADED.inc(uploaded, kind='video')
+        return file_ids
+    
+    def carousel_entry(self, result, file_ids, thumbnail_file_ids):
+        """The cache entry for an uploaded carousel: its items become (type, file_id) pairs"""
+        items = [{'type': item['type'], 'file_id': file_id} for item, file_id in zip(result['items'], file_ids)]
+        # video_file_id marks the entry as sendable, like a reel's
+        return dict(result, items=items, video_file_id=file_ids[0], thumbnail_file_ids=thumbnail_file_ids)
+    
+    def cache_chat_target(self, bot):
+        """upload_video/upload_carousel target that posts to CACHE_CHAT_ID without notifying anyone"""
+        return SimpleNamespace(**{
+            name: functools.partial(method, chat_id=self.cache_chat_id, disable_notification=True)
+            for name, method in (('reply_video', bot.send_video), ('reply_photo', bot.send_photo),
+                                 ('reply_media_group', bot.send_media_group))
+        })
+    
     async def reel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /reel command with URL"""
-        video_file = None
-        thumbnails = []
+        """Handle /reel command with one or more URLs"""
+        if not context.args:
+            await update.message.reply_text(
+                " Please provide an Instagram Reel URL!\n\n"
+                "Usage: `/reel https://www.instagram.com/reel/xxxxx/`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        # Reject anything that isn't a reel/post link before any network I/O
+        links = find_instagram_urls(' '.join(context.args))
+        if not links:
+            await update.message.reply_text(" Please provide a valid Instagram URL.")
+            return
+        await self.handle_links(update, links)
+    
+    async def info_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /info: username, likes and caption without downloading the video"""
+        links = find_instagram_urls(' '.join(context.args or ()), limit=1)
+        if not links:
+            await update.message.reply_text(
+                " Please provide an Instagram Reel URL!\n\n"
+                "Usage: `/info https://www.instagram.com/reel/xxxxx/`",
+                parse_mode='Markdown'
+            )
+            return
+        parsed = links[0]
+        user_id = update.message.from_user.id
+        footer = "Use /reel with the same link to get the video."
         
         try:
-            if not context.args:
-                await update.message.reply_text(
-                    " Please provide an Instagram Reel URL!\n\n"
-                    "Usage: `/reel https://www.instagram.com/reel/xxxxx/`",
+            entry = self.reel_cache.get(parsed.shortcode) if parsed.shortcode else None
+            if entry:
+                REQUESTS.inc(source='info_cache')
+                await update.message.reply_text(self.format_info_message(entry, footer), parse_mode='Markdown')
+                return
+            
+            # Metadata is one small API call, so it doesn't queue behind downloads on the pool
+            REQUESTS.inc(source='info')
+            with STAGE_SECONDS.time(stage='info'):
+                metadata, _ = await self.reel_flights.do(
+                    f"info:{parsed.shortcode or parsed.url}",
+                    lambda: asyncio.to_thread(self.download_reel, parsed.url, None, user_id, False, 'info')
+                )
+        except RateLimitedError as e:
+            ERRORS.inc(error_class='rate_limited')
+            await update.message.reply_text(
+                f" Instagram is limiting our requests right now. Please try again in {max(1, round(e.retry_after / 60))} min."
+            )
+            return
+        
+        if not metadata:
+            await update.message.reply_text(" Could not fetch this reel. It might be private or the link is invalid.")
+            return
+        # A later /reel for the same shortcode can show this right away
+        self.reel_cache.put(metadata['shortcode'], metadata)
+        await update.message.reply_text(self.format_info_message(metadata, footer), parse_mode='Markdown')
+    
+    async def audio_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /audio: just the soundtrack of a reel, as an M4A"""
+        links = find_instagram_urls(' '.join(context.args or ()), limit=1)
+        if not links:
+            await update.message.reply_text(
+                " Please provide an Instagram Reel URL!\n\n"
+                "Usage: `/audio https://www.instagram.com/reel/xxxxx/`",
+                parse_mode='Markdown'
+            )
+            return
+        parsed = links[0]
+        user_id = update.message.from_user.id
+        if self.job_sent(f"audio:{parsed.url}"):
+            return
+        
+        try:
+            # Repeat requests are answered from Telegram's servers
+            entry = self.reel_cache.get(parsed.shortcode, needs='audio_file_id') if parsed.shortcode else None
+            if entry and entry.get('audio_file_id'):
+                REQUESTS.inc(source='audio_cache')
+                await self.send_cached_audio(update, entry)
+                self.mark_job_sent(f"audio:{parsed.url}")
+                return
+            
+            await self.ensure_ffmpeg_checked()
+            entry, shared = await self.reel_flights.do(
+                f"audio:{parsed.shortcode or parsed.url}", lambda: self.process_audio(update, parsed.url, user_id)
+            )
+            if shared:
+                if entry:
+                    REQUESTS.inc(source='coalesced')
+                    await self.send_cached_audio(update, entry)
+                    self.mark_job_sent(f"audio:{parsed.url}")
+                else:
+                    # The first request failed, possibly for lack of cookies - try with this user's own
+                    await self.process_audio(update, parsed.url, user_id)
+        except Exception as e:
+            logger.error(f"Error in audio_command: {str(e)}")
+            if current_job.get() is not None:
+                raise  # Retried by the job queue
+            try:
+                await update.message.reply_text(" Error: Something went wrong. Please try again later.")
+            except Exception:
+                pass
+    
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer `@bot <link>` from cached file_ids, queueing unseen reels for a background prefetch
+
+        Telegram drops inline answers that take more than a few seconds, so
+        nothing here waits for Instagram: known reels are answered from the
+        cache, unknown ones get a placeholder and are fetched for the next try.
+        """
+        query = update.inline_query
+        links = find_instagram_urls(query.query, limit=1)
+        open_chat = InlineQueryResultsButton(text="Open the bot to download reels", start_parameter="inline")
+        if not links or not links[0].shortcode:
+            # Share links only resolve through Instagram, which is too slow for an inline answer
+            await query.answer([], cache_time=INLINE_CACHE_SECONDS, button=open_chat)
+            return
+        parsed = links[0]
+        
+        entry = self.reel_cache.peek(parsed.shortcode, needs='video_file_id')
+        if entry and entry.get('items'):
+            REQUESTS.inc(source='inline_cache')
+            # One result per item; the user picks which one to send
+            caption = entry['caption'] or ''
+            results = []
+            for i, item in enumerate(entry['items'], 1):
+                fields = dict(
+                    id=f"{parsed.shortcode}-{i}",
+                    title=f"@{entry['username']} ({i}/{len(entry['items'])})",
+                    description=caption[:100],
+                    caption=self.format_video_caption(entry),
                     parse_mode='Markdown'
                 )
+                if item['type'] == 'photo':
+                    results.append(InlineQueryResultCachedPhoto(photo_file_id=item['file_id'], **fields))
+                else:
+                    results.append(InlineQueryResultCachedVideo(video_file_id=item['file_id'], **fields))
+            await query.answer(results, cache_time=INLINE_CACHE_SECONDS)
+            return
+        if entry and entry['video_file_id']:
+            REQUESTS.inc(source='inline_cache')
+            caption = entry['caption'] or ''
+            await query.answer([InlineQueryResultCachedVideo(
+                id=parsed.shortcode,
+                video_file_id=entry['video_file_id'],
+                title=f"@{entry['username']}",
+                description=caption[:100],
+                caption=self.format_video_caption(entry),
+                parse_mode='Markdown'
+            )], cache_time=INLINE_CACHE_SECONDS)
+            return
+        
+        REQUESTS.inc(source='inline_pending')
+        queued = self.cache_chat_id and self.queue_prefetch(parsed, query.from_user.id)
+        title = "⏳ Preparing this reel - try again in a few seconds" if queued else "Send this link to the bot to download it"
+        await query.answer([InlineQueryResultArticle(
+            id=f"pending-{parsed.shortcode}",
+            title=title,
+            description=parsed.url,
+            input_message_content=InputTextMessageContent(parsed.url)
+        )], cache_time=0, is_personal=True, button=open_chat)
+    
+    def queue_prefetch(self, parsed, user_id):
+        """Queue a reel for background download, returning False if the queue is full"""
+        if parsed.shortcode in self.prefetching:
+            return True
+        try:
+            self.prefetch_queue.put_nowait((parsed, user_id))
+        except asyncio.QueueFull:
+            logger.warning(f"Prefetch queue full - not prefetching {parsed.shortcode}")
+            return False
+        self.prefetching.add(parsed.shortcode)
+        return True
+    
+    async def prefetch_loop(self, bot):
+        """Work through queued inline prefetches until cancelled"""
+        while True:
+            parsed, user_id = await self.prefetch_queue.get()
+            try:
+                # A /reel for the same shortcode running meanwhile shares the work
+                await self.reel_flights.do(parsed.shortcode, lambda: self.prefetch_reel(bot, parsed, user_id))
+            except Exception as e:
+                logger.error(f"Prefetch of {parsed.shortcode} failed: {e}")
+            finally:
+                self.prefetching.discard(parsed.shortcode)
+                self.prefetch_queue.task_done()
+    
+    async def prefetch_reel(self, bot, parsed, user_id, source='inline'):
+        """Download a reel and upload it to CACHE_CHAT_ID, returning its cache entry or None
+
+        Follow prefetches only spend the follower's own rate budget above FOLLOW_RESERVE_TOKENS.
+        """
+        entry = self.reel_cache.get(parsed.shortcode, needs='video_file_id')
+        if entry and entry['video_file_id']:
+            return entry
+        
+        # Prefetches count against the user who asked, like their /reel requests
+        try:
+            self.download_pool.admit(user_id)
+        except (UserLimitError, QueueFullError) as e:
+            logger.info(f"Not prefetching {parsed.shortcode}: {e}")
+            return None
+        workdir = None
+        result = None
+        try:
+            workdir = await asyncio.to_thread(self.scratch.acquire)
+            with STAGE_SECONDS.time(stage='prefetch'):
+                reserve = self.follow_reserve_tokens if source == 'follow' else None
+                result = await self.download_pool.run(self.in_scratch, self.download_reel, parsed.url, workdir,
+                                                      user_id, False, 'media', reserve)
+        except (DiskBudgetError, RateLimitedError, TranscodeError) as e:
+            logger.info(f"Not prefetching {parsed.shortcode}: {e}")
+        except Exception as e:
+            # Background work: log it and leave the reel to a later /reel instead of failing the caller
+            logger.error(f"Prefetch download of {parsed.shortcode} failed: {e}")
+            ERRORS.inc(error_class='pipeline')
+        finally:
+            self.download_pool.release(user_id)
+            # A download that got this far is released by discard_download() after its upload
+            if not result:
+                self.scratch.release(workdir)
+        if not result:
+            return None
+        
+        target = self.cache_chat_target(bot)
+        entry = None
+        try:
+            if result.get('items'):
+                file_ids = await self.upload_carousel(target, result)
+                if all(file_ids):
+                    entry = self.carousel_entry(result, file_ids, [])
+            else:
+                file_id = sent_file_id(await self.upload_video(target.reply_video, result))
+                if file_id:
+                    entry = dict(result, video_file_id=file_id, thumbnail_file_ids=[])
+        except Exception as e:
+            logger.error(f"Prefetch upload of {parsed.shortcode} failed: {e}")
+            ERRORS.inc(error_class='pipeline')
+        finally:
+            self.discard_download(result)
+        
+        if not entry:
+            return None
+        # Remembered with the entry so a later request can be counted as a prefetch hit
+        self.reel_cache.put(result['shortcode'], dict(entry, prefetched=source), entry['video_file_id'])
+        logger.info(f"Prefetched {result['shortcode']} ({source})")
+        return entry
+    
+    async def follow_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /follow <username>: prefetch the account's new reels so they arrive instantly"""
+        user_id = update.message.from_user.id
+        if not context.args:
+            following = self.follow_store.following(user_id)
+            listing = "\n".join(f"• @{username}" for username in following) if following else "• nobody yet"
+            await update.message.reply_text(
+                f"**Followed accounts:**\n{listing}\n\n"
+                "Usage: `/follow username` - new reels from these accounts are fetched ahead of time, "
+                "so `/reel` answers instantly. `/unfollow username` stops it.",
+                parse_mode='Markdown'
+            )
+            return
+        
+        username = context.args[0].lstrip('@').rstrip('/').rsplit('/', 1)[-1]
+        if not USERNAME_PATTERN.match(username):
+            await update.message.reply_text(" That doesn't look like an Instagram username.")
+            return
+        try:
+            added = self.follow_store.follow(user_id, username)
+        except FollowLimitError:
+            await update.message.reply_text(
+                f" You can follow up to {self.follow_store.max_per_user} accounts. Use /unfollow to make room."
+            )
+            return
+        if added:
+            await update.message.reply_text(f"✅ Following @{username}. New reels will be ready before you ask for them.")
+        else:
+            await update.message.reply_text(f"You already follow @{username}.")
+    
+    async def unfollow_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unfollow <username>"""
+        if not context.args:
+            await update.message.reply_text("Usage: `/unfollow username`", parse_mode='Markdown')
+            return
+        username = context.args[0].lstrip('@')
+        if self.follow_store.unfollow(update.message.from_user.id, username):
+            await update.message.reply_text(f"Stopped following @{username}.")
+        else:
+            await update.message.reply_text(f"You don't follow @{username}.")
+    
+    def note_prefetch_hit(self, entry, shortcode):
+        if entry.get('prefetched') == 'follow' and self.follow_store.record_hit(shortcode):
+            stats = self.follow_store.stats()
+            logger.info(f"Prefetch hit for {shortcode} ({stats['hits']}/{stats['prefetched']} prefetched reels requested)")
+    
+    def follow_identity(self, user_id):
+        """The identity extraction_identity() will use for a follower's background work (no spillover)"""
+        return f"user:{user_id}" if self.cookie_store.has(user_id) else ANONYMOUS
+    
+    def recent_reels(self, username, user_id):
+        """Links to an account's latest posts via yt-dlp's flat playlist extraction (blocking)"""
+        profile, cookies = self.extraction_identity(user_id, self.follow_reserve_tokens)
+        try:
+            with self.extractors.checkout(profile, cookies) as ydl:
+                # Only list the entries; each reel is extracted when it is prefetched
+                saved = {key: ydl.params.get(key) for key in ('extract_flat', 'playlistend')}
+                ydl.params.update(extract_flat='in_playlist', playlistend=self.follow_recent_reels)
+                try:
+                    info = ydl.extract_info(f"https://www.instagram.com/{username}/", download=False)
+                finally:
+                    ydl.params.update(saved)
+            self.rate_limiter.record_success(profile)
+        except Exception as e:
+            error_class = classify_error(e)
+            self.rate_limiter.record_failure(profile, error_class, f"https://www.instagram.com/{username}/")
+            ERRORS.inc(error_class=error_class)
+            logger.error(f"Could not list reels of @{username} ({error_class}): {e}")
+            return None
+        
+        links = []
+        for entry in list(info.get('entries') or ())[:self.follow_recent_reels]:
+            parsed = parse_instagram_url(entry.get('url') or entry.get('webpage_url') or '')
+            if not parsed and entry.get('id'):
+                parsed = parse_instagram_url(f"https://www.instagram.com/p/{entry['id']}/")
+            if parsed and parsed.shortcode:
+                links.append(parsed)
+        return links
+    
+    async def follow_loop(self, bot):
+        """Poll followed accounts that are due, a few at a time, until cancelled"""
+        slots = asyncio.Semaphore(self.follow_concurrency)
+        
+        async def poll(username, user_id):
+            async with slots:
+                try:
+                    await self.poll_account(bot, username, user_id)
+                except Exception as e:
+                    logger.error(f"Error polling @{username}: {e}")
+        
+        while True:
+            try:
+                due = await asyncio.to_thread(self.follow_store.due)
+                await asyncio.gather(*(poll(username, user_id) for username, user_id in due))
+                self.follow_store.purge(self.reel_cache.ttl)
+            except Exception as e:
+                logger.error(f"Error in follow scheduler: {e}")
+            await asyncio.sleep(min(60, self.follow_store.interval))
+    
+    async def poll_account(self, bot, username, user_id):
+        """List an account's recent reels and prefetch the ones not cached yet"""
+        identity = self.follow_identity(user_id)
+        if self.rate_limiter.headroom(identity) < self.follow_reserve_tokens + 1:
+            return  # Not marked as polled, so it is retried on the next tick
+        
+        # Listing counts against the follower like their own requests, and waits its turn on the pool
+        try:
+            self.download_pool.admit(user_id)
+        except (UserLimitError, QueueFullError) as e:
+            logger.info(f"Not polling @{username} yet: {e}")
+            return
+        try:
+            links = await self.download_pool.run(self.recent_reels, username, user_id)
+        except RateLimitedError:
+            return
+        finally:
+            self.download_pool.release(user_id)
+        self.follow_store.mark_polled(username, ok=links is not None)
+        
+        for parsed in links or ():
+            if self.reel_cache.has_video(parsed.shortcode):
+                continue
+            if self.rate_limiter.headroom(identity) < self.follow_reserve_tokens + 1:
+                logger.info(f"Rate budget spent, leaving the rest of @{username}'s reels for the next poll")
+                return
+            
+            if self.cache_chat_id:
+                entry, _ = await self.reel_flights.do(
+                    parsed.shortcode, lambda: self.prefetch_reel(bot, parsed, user_id, source='follow')
+                )
+            elif not self.reel_cache.has(parsed.shortcode):
+                # Without a cache chat there is nowhere to upload to; warm the metadata instead
+                try:
+                    entry = await asyncio.to_thread(self.download_reel, parsed.url, None, user_id, False, 'info',
+                                                    self.follow_reserve_tokens)
+                except RateLimitedError:
+                    return
+                if entry:
+                    self.reel_cache.put(entry['shortcode'], dict(entry, prefetched='follow'))
+            else:
+                continue
+            if entry:
+                self.follow_store.record_prefetch(parsed.shortcode, username)
+    
+    async def text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Treat plain messages that contain Instagram links like /reel"""
+        links = find_instagram_urls(update.message.text or '')
+        if links:
+            await self.handle_links(update, links)
+    
+    async def handle_links(self, update: Update, links):
+        """Send one reel, or pipeline several as a batch"""
+        # A retried job skips what an earlier attempt already sent
+        links = [link for link in links if not self.job_sent(link.url)]
+        if not links:
+            return
+        try:
+            user_id = update.message.from_user.id
+            # Download threads only read the result, so probe before handing work to them
+            await self.ensure_ffmpeg_checked()
+            if len(links) > 1:
+                if len(links) > self.batch_max_urls:
+                    await update.message.reply_text(
+                        f" Only the first {self.batch_max_urls} of your {len(links)} links will be downloaded."
+                    )
+                await self.process_batch(update, links[:self.batch_max_urls], user_id)
                 return
             
-            url = context.args[0]
+            parsed = links[0]
+            url = parsed.url
             
-            if 'instagram.com' not in url:
-                await update.message.reply_text(" Please provide a valid Instagram URL.")
+            if not parsed.shortcode:
+                # Share links only resolve to a shortcode through Instagram
+                await self.process_reel(update, url, user_id)
                 return
+            shortcode = parsed.shortcode
             
-            processing_msg = await update.message.reply_text("⏳ Processing your reel... This may take a moment.")
+            # Serve repeat requests straight from Telegram's servers
+            entry = self.reel_cache.get(shortcode, needs='video_file_id')
+            if entry:
+                self.note_prefetch_hit(entry, shortcode)
+            if entry and entry['video_file_id']:
+                logger.info(f"Cache hit for {shortcode} ({self.reel_cache.stats()['hit_ratio']:.0%} hit ratio)")
+                REQUESTS.inc(source='cache')
+                await self.send_cached_reel(update, entry)
+                self.mark_job_sent(url)
+                return
             
-            # Download reel
-            user_id = update.message.from_user.id
-            result = self.download_reel(url, user_id)
+            # Concurrent requests for the same reel share one download and upload;
+            # metadata cached by /info lets the user read the caption while the video downloads
+            metadata = entry
+            entry, shared = await self.reel_flights.do(shortcode, lambda: self.process_reel(update, url, user_id, metadata))
+            if shared:
+                if entry:
+                    REQUESTS.inc(source='coalesced')
+                    await self.send_cached_reel(update, entry)
+                    self.mark_job_sent(url)
+                else:
+                    # The first request failed, possibly for lack of cookies - try with this user's own
+                    await self.process_reel(update, url, user_id)
+            
+        except Exception as e:
+            logger.error(f"Error in handle_links: {str(e)}")
+            if current_job.get() is not None:
+                raise  # Retried by the job queue
+            error_message = " Error: Something went wrong. Please try again or check if the reel is public."
+            try:
+                await update.message.reply_text(error_message)
+            except:
+                pass
+    
+    async def process_reel(self, update: Update, url, user_id, metadata=None):
+        """Download, upload and cache a reel, returning the cache entry or None on failure"""
+        video_file = None
+        video = None
+        admitted_user = None
+        workdir = None
+        result = None
+        started = time.perf_counter()
+        
+        try:
+            # Reserve a slot in the download pool before doing any work
+            try:
+                position = self.download_pool.admit(user_id)
+            except UserLimitError:
+                await update.message.reply_text(
+                    f" You already have {self.download_pool.per_user} downloads in progress. "
+                    "Please wait for them to finish."
+                )
+                ERRORS.inc(error_class='user_limit')
+                return None
+            except QueueFullError:
+                await update.message.reply_text(" The bot is busy right now. Please try again in a minute.")
+                ERRORS.inc(error_class='queue_full')
+                return None
+            admitted_user = user_id
+            
+            # Refuse work up front rather than fill the volume halfway through a download
+            try:
+                workdir = await asyncio.to_thread(self.scratch.acquire)
+            except DiskBudgetError as e:
+                logger.warning(f"Rejecting {url}: {e}")
+                ERRORS.inc(error_class='disk_budget')
+                await update.message.reply_text(" The bot is busy right now. Please try again in a minute.")
+                return None
+            REQUESTS.inc(source='download')
+            
+            if position:
+                processing_msg = await update.message.reply_text(f"⏳ You're #{position} in line. Your reel will start shortly...")
+            elif metadata:
+                processing_msg = await update.message.reply_text(
+                    self.format_info_message(metadata, "⏳ Downloading video..."), parse_mode='Markdown'
+                )
+            else:
+                processing_msg = await update.message.reply_text("⏳ Processing your reel... This may take a moment.")
+            
+            # Download reel on the worker pool so other updates keep being served
+            try:
+                # Includes time spent waiting for a pool slot, which is what users experience
+                with STAGE_SECONDS.time(stage='download'):
+                    result = await self.download_pool.run(self.in_scratch, self.download_reel, url, workdir, user_id)
+            except DiskBudgetError as e:
+                logger.warning(f"Rejecting {url}: {e}")
+                ERRORS.inc(error_class='disk_budget')
+                await processing_msg.edit_text(" The bot is busy right now. Please try again in a minute.")
+                return None
+            except TranscodeError as e:
+                logger.error(f"Could not fit {url} under the upload limit: {e}")
+                await processing_msg.edit_text(
+                    f" This video is larger than Telegram allows bots to send ({self.upload_limit // 1024 // 1024} MB)."
+                )
+                return None
+            except RateLimitedError as e:
+                ERRORS.inc(error_class='rate_limited')
+                await processing_msg.edit_text(
+                    f" Instagram is limiting our requests right now. Please try again in {max(1, round(e.retry_after / 60))} min.\n\n"
+                    "Uploading your own cookies with /cookies avoids the shared limit."
+                )
+                return None
             
             if not result:
                 # Check if user has cookies
-                if user_id not in self.user_cookies:
+                if not self.cookie_store.has(user_id):
                     await processing_msg.edit_text(
                         " **Download Failed - Authentication Required**\n\n"
                         "Instagram requires login cookies to download content.\n\n"
@@ -433,81 +1874,444 @@ Use `/cookies` to setup authentication and avoid rate limits!
                     )
                 else:
                     await processing_msg.edit_text(" Failed to download. The reel might be private or the link is invalid.")
-                return
+                return None
+            
+            if result.get('items'):
+                return await self.send_carousel(update, processing_msg, result, url)
             
             video_file = result['video_file']
-            username = result['username']
-            caption = result['caption']
-            likes = result['likes']
+            video = result['video']
             shortcode = result['shortcode']
+            video_file_id = None
+            thumbnail_file_ids = []
             
             # Send info
-            info_message = f"""
-**Reel Found!**
-
-👤 **Account:** @{username}
-❤️ **Likes:** {likes:,}
-
-📝 **Caption:**
-{caption[:800]}{"..." if len(caption) > 800 else ""}
-
-⬇️ Sending video...
-"""
-            await processing_msg.edit_text(info_message, parse_mode='Markdown')
-            
-            # Send video
-            if os.path.exists(video_file):
-                with open(video_file, 'rb') as video:
-                    await update.message.reply_video(
-                        video=video,
-                        caption=f"🎥 **@{username}**\n\n{caption[:200]}{'...' if len(caption) > 200 else ''}",
-                        parse_mode='Markdown',
-                        supports_streaming=True
-                    )
+            with STAGE_SECONDS.time(stage='info_message'):
+                await processing_msg.edit_text(self.format_info_message(result), parse_mode='Markdown')
+            
+            # Send video straight from the streamed buffer, or from disk for merged formats
+            video_msg = None
+            upload_deadline = self.uploader.deadline_from_now()
+            with STAGE_SECONDS.time(stage='video_upload'):
+                if video is not None or os.path.exists(video_file):
+                    video_msg = await self.upload_video(update.message.reply_video, result, upload_deadline)
+            if video_msg:
+                self.mark_job_sent(url)
+                # Telegram may store short clips as animations or documents
+                media = video_msg.video or video_msg.animation or video_msg.document
+                if media:
+                    video_file_id = media.file_id
             
-            # Generate thumbnails
-            thumbnail_msg = await update.message.reply_text("🖼️ Generating thumbnails...")
-            thumbnails = self.generate_thumbnails(video_file, shortcode)
+            # Streamed downloads already extracted their thumbnails on the way in
+            thumbnails = result['thumbnails']
+            thumbnail_msg = None
+            if thumbnails is None:
+                thumbnail_msg = await update.message.reply_text("🖼️ Generating thumbnails...")
+                # Rendered by asyncio subprocesses, so other updates keep being served meanwhile
+                with STAGE_SECONDS.time(stage='thumbnails'):
+                    thumbnails = await self.generate_thumbnails(video_file, shortcode, result.get('duration'))
             
             if thumbnails:
-                media_group = []
-                for i, thumb in enumerate(thumbnails[:5], 1):
-                    with open(thumb, 'rb') as photo:
-                        media_group.append(InputMediaPhoto(
-                            media=photo.read(),
-                            caption=f"📸 Thumbnail {i}/{len(thumbnails)}" if i == 1 else ""
-                        ))
-                
-                await thumbnail_msg.delete()  # Remove the "generating" message
-                await update.message.reply_media_group(media=media_group)
-            else:
-                await thumbnail_msg.edit_text(
+                if thumbnail_msg:
+                    await thumbnail_msg.delete()  # Remove the "generating" message
+                with STAGE_SECONDS.time(stage='thumbnail_upload'):
+                    photo_msgs = await self.send_thumbnails(update, thumbnails[:5], upload_deadline)
+                BYTES_UPLOADED.inc(sum(len(thumb) for thumb in thumbnails[:5]), kind='thumbnail')
+                thumbnail_file_ids = [msg.photo[-1].file_id for msg in photo_msgs if msg.photo]
+            elif not self.ffmpeg_available:
+                notice = (
                     "⚠️ **Thumbnails not available**\n\n"
                     "FFmpeg is not installed on the server.\n"
                     "Video downloaded successfully! \n\n"
                     "ℹ️ *Thumbnails require FFmpeg for video processing*"
                 )
+                if thumbnail_msg:
+                    await thumbnail_msg.edit_text(notice)
+                else:
+                    await update.message.reply_text(notice)
+            elif thumbnail_msg:
+                await thumbnail_msg.delete()
+            
+            if video_file_id:
+                self.reel_cache.put(shortcode, result, video_file_id, thumbnail_file_ids)
             
             await update.message.reply_text("Done! Enjoy your reel! ")
             
+            if not video_file_id:
+                return None
+            return dict(result, video_file_id=video_file_id, thumbnail_file_ids=thumbnail_file_ids)
+            
+        except UploadDeadlineError as e:
+            logger.error(f"Giving up on uploading {url}: {e}")
+            ERRORS.inc(error_class='upload_deadline')
+            try:
+                await update.message.reply_text(" Telegram is taking too long to accept the upload. Please try again later.")
+            except Exception:
+                pass
+            return None
+        
         except Exception as e:
-            logger.error(f"Error in reel_command: {str(e)}")
+            logger.error(f"Error processing reel: {str(e)}")
+            ERRORS.inc(error_class='pipeline')
+            if current_job.get() is not None:
+                raise  # Retried by the job queue
             error_message = f" Error: Something went wrong. Please try again or check if the reel is public."
             try:
                 await update.message.reply_text(error_message)
             except:
                 pass
+            return None
         
         finally:
+            if admitted_user is not None:
+                self.download_pool.release(admitted_user)
+            
             # Cleanup files
+            with STAGE_SECONDS.time(stage='cleanup'):
+                try:
+                    if video is not None:
+                        video.close()
+                    if video_file and os.path.exists(video_file):
+                        os.remove(video_file)
+                except Exception as e:
+                    logger.error(f"Cleanup error: {str(e)}")
+                for item in (result or {}).get('items') or ():
+                    close_item(item)
+                self.scratch.release(workdir)
+            if admitted_user is not None:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='total')
+    
+    async def process_audio(self, update: Update, url, user_id):
+        """Download, extract, upload and cache a reel's audio, returning the cache entry or None on failure"""
+        admitted_user = None
+        workdir = None
+        started = time.perf_counter()
+        
+        try:
             try:
-                if video_file and os.path.exists(video_file):
-                    os.remove(video_file)
-                for thumb in thumbnails:
-                    if os.path.exists(thumb):
-                        os.remove(thumb)
+                position = self.download_pool.admit(user_id)
+            except UserLimitError:
+                await update.message.reply_text(
+                    f" You already have {self.download_pool.per_user} downloads in progress. "
+                    "Please wait for them to finish."
+                )
+                ERRORS.inc(error_class='user_limit')
+                return None
+            except QueueFullError:
+                await update.message.reply_text(" The bot is busy right now. Please try again in a minute.")
+                ERRORS.inc(error_class='queue_full')
+                return None
+            admitted_user = user_id
+            
+            try:
+                workdir = await asyncio.to_thread(self.scratch.acquire)
+            except DiskBudgetError as e:
+                logger.warning(f"Rejecting {url}: {e}")
+                ERRORS.inc(error_class='disk_budget')
+                await update.message.reply_text(" The bot is busy right now. Please try again in a minute.")
+                return None
+            REQUESTS.inc(source='audio')
+            
+            if position:
+                processing_msg = await update.message.reply_text(f"⏳ You're #{position} in line. Your audio will start shortly...")
+            else:
+                processing_msg = await update.message.reply_text("⏳ Extracting the audio... This may take a moment.")
+            
+            try:
+                with STAGE_SECONDS.time(stage='download'):
+                    result = await self.download_pool.run(self.in_scratch, self.download_audio, url, workdir, user_id)
+            except DiskBudgetError as e:
+                logger.warning(f"Rejecting {url}: {e}")
+                ERRORS.inc(error_class='disk_budget')
+                await processing_msg.edit_text(" The bot is busy right now. Please try again in a minute.")
+                return None
+            except TranscodeError as e:
+                logger.error(f"Could not extract the audio of {url}: {e}")
+                ERRORS.inc(error_class='audio')
+                await processing_msg.edit_text(" Could not extract the audio of this reel.")
+                return None
+            except RateLimitedError as e:
+                ERRORS.inc(error_class='rate_limited')
+                await processing_msg.edit_text(
+                    f" Instagram is limiting our requests right now. Please try again in {max(1, round(e.retry_after / 60))} min.\n\n"
+                    "Uploading your own cookies with /cookies avoids the shared limit."
+                )
+                return None
+            
+            if not result:
+                await processing_msg.edit_text(" Failed to download. The reel might be private or the link is invalid.")
+                return None
+            if not result['audio_file']:
+                await processing_msg.edit_text(" This reel has no audio.")
+                return None
+            
+            with STAGE_SECONDS.time(stage='audio_upload'):
+                audio_msg = await self.upload_audio(update.message.reply_audio, result, self.uploader.deadline_from_now())
+            self.mark_job_sent(f"audio:{url}")
+            await processing_msg.delete()
+            
+            media = audio_msg.audio or audio_msg.document
+            if not media:
+                return None
+            self.reel_cache.put_audio(result['shortcode'], result, media.file_id)
+            return dict(result, audio_file_id=media.file_id)
+            
+        except UploadDeadlineError as e:
+            logger.error(f"Giving up on uploading the audio of {url}: {e}")
+            ERRORS.inc(error_class='upload_deadline')
+            try:
+                await update.message.reply_text(" Telegram is taking too long to accept the upload. Please try again later.")
+            except Exception:
+                pass
+            return None
+        
+        except Exception as e:
+            logger.error(f"Error processing audio: {str(e)}")
+            ERRORS.inc(error_class='pipeline')
+            if current_job.get() is not None:
+                raise  # Retried by the job queue
+            try:
+                await update.message.reply_text(" Error: Something went wrong. Please try again or check if the reel is public.")
+            except Exception:
+                pass
+            return None
+        
+        finally:
+            if admitted_user is not None:
+                self.download_pool.release(admitted_user)
+            # Removes the source and the extracted audio with the rest of the job's files
+            self.scratch.release(workdir)
+            if admitted_user is not None:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='total')
+    
+    async def send_carousel(self, update: Update, processing_msg, result, url):
+        """Send a downloaded carousel as albums, then its videos' thumbnails, and cache it"""
+        items = result['items']
+        with STAGE_SECONDS.time(stage='info_message'):
+            await processing_msg.edit_text(
+                self.format_info_message(result, f"⬇️ Sending {len(items)} items..."), parse_mode='Markdown'
+            )
+        
+        upload_deadline = self.uploader.deadline_from_now()
+        with STAGE_SECONDS.time(stage='video_upload'):
+            file_ids = await self.upload_carousel(update.message, result, upload_deadline)
+        self.mark_job_sent(url)
+        
+        # Photos need no thumbnails; streamed videos got theirs on the way in, the rest are rendered concurrently
+        videos = [item for item in items if item['type'] == 'video']
+        pending = [item for item in videos if item['thumbnails'] is None]
+        if pending:
+            with STAGE_SECONDS.time(stage='thumbnails'):
+                generated = await asyncio.gather(*(
+                    self.generate_thumbnails(item['video_file'], item['id'], item.get('duration')) for item in pending
+                ))
+            for item, thumbnails in zip(pending, generated):
+                item['thumbnails'] = thumbnails
+        # One album's worth, shared out between the videos
+        per_video = max(1, ALBUM_SIZE // len(videos)) if videos else 0
+        thumbnails = [thumb for item in videos for thumb in item['thumbnails'][:per_video]][:ALBUM_SIZE]
+        
+        thumbnail_file_ids = []
+        if thumbnails:
+            with STAGE_SECONDS.time(stage='thumbnail_upload'):
+                photo_msgs = await self.send_thumbnails(update, thumbnails, upload_deadline)
+            BYTES_UPLOADED.inc(sum(len(thumb) for thumb in thumbnails), kind='thumbnail')
+            thumbnail_file_ids = [msg.photo[-1].file_id for msg in photo_msgs if msg.photo]
+        
+        await update.message.reply_text("Done! Enjoy your post! ")
+        
+        if not all(file_ids):
+            return None
+        entry = self.carousel_entry(result, file_ids, thumbnail_file_ids)
+        self.reel_cache.put(result['shortcode'], entry, entry['video_file_id'], thumbnail_file_ids)
+        return entry
+    
+    async def process_batch(self, update: Update, links, user_id):
+        """Download several reels with bounded parallelism and send them as albums
+
+        Downloads run ahead of uploads: while one album is being sent, the next
+        reels keep downloading. Progress goes into a single status message
+        instead of per-reel info, thumbnail and "Done" messages.
+        """
+        total = len(links)
+        progress = {'sent': 0, 'failed': []}
+        status_msg = await update.message.reply_text(f"📦 Downloading {total} reels...")
+        last_edit = time.monotonic()
+        slots = asyncio.Semaphore(self.batch_parallelism)
+        
+        async def report(final=False):
+            nonlocal last_edit
+            if not final and time.monotonic() - last_edit < BATCH_STATUS_INTERVAL:
+                return
+            last_edit = time.monotonic()
+            failed = progress['failed']
+            if final:
+                text = f"✅ Done! Sent {progress['sent']}/{total} reels."
+                if failed:
+                    text += "\n\nCould not download:\n" + "\n".join(failed[:10])
+            else:
+                text = f"📦 Sent {progress['sent']}/{total} reels" + (f", {len(failed)} failed" if failed else "") + "..."
+            try:
+                await status_msg.edit_text(text, disable_web_page_preview=True)
             except Exception as e:
-                logger.error(f"Cleanup error: {str(e)}")
+                logger.error(f"Could not update batch status: {e}")
+        
+        started = set()
+        
+        async def fetch(index, link):
+            if link.shortcode:
+                entry = self.reel_cache.get(link.shortcode, needs='video_file_id')
+                if entry:
+                    self.note_prefetch_hit(entry, link.shortcode)
+                if entry and entry['video_file_id']:
+                    REQUESTS.inc(source='cache')
+                    return entry
+            
+            async with slots:
+                started.add(index)
+                # The batch shares the user's per-user limit with their other requests
+                while True:
+                    try:
+                        self.download_pool.admit(user_id)
+                        break
+                    except UserLimitError:
+                        await asyncio.sleep(1)
+                    except QueueFullError:
+                        ERRORS.inc(error_class='queue_full')
+                        return None
+                workdir = None
+                try:
+                    workdir = await asyncio.to_thread(self.scratch.acquire)
+                    REQUESTS.inc(source='download')
+                    with STAGE_SECONDS.time(stage='download'):
+                        result = await self.download_pool.run(self.in_scratch, self.download_reel, link.url, workdir,
+                                                              user_id, False)
+                except DiskBudgetError as e:
+                    logger.warning(f"Rejecting {link.url}: {e}")
+                    ERRORS.inc(error_class='disk_budget')
+                    return None
+                except RateLimitedError:
+                    ERRORS.inc(error_class='rate_limited')
+                    result = None
+                except TranscodeError as e:
+                    logger.error(f"Could not fit {link.url} under the upload limit: {e}")
+                    result = None
+                except asyncio.CancelledError:
+                    self.scratch.release(workdir)
+                    raise
+                except Exception as e:
+                    # One broken reel fails on its own instead of taking the rest of the batch down
+                    logger.error(f"Error downloading {link.url}: {e}")
+                    ERRORS.inc(error_class='pipeline')
+                    result = None
+                finally:
+                    self.download_pool.release(user_id)
+                
+                # The directory lives until the reel is sent and discard_download() releases it
+                if result is None:
+                    self.scratch.release(workdir)
+                return result
+        
+        tasks = [asyncio.create_task(fetch(i, link)) for i, link in enumerate(links)]
+        released = set()  # Indexes of the downloads already discarded
+        try:
+            index = 0
+            while index < total:
+                # Wait for the next reel in order plus those already downloading, so they share an album;
+                # freed slots start the following downloads while the album uploads
+                group = [(index, await tasks[index])]
+                downloading = set(started)
+                index += 1
+                while index < total and len(group) < ALBUM_SIZE and (tasks[index].done() or index in downloading):
+                    group.append((index, await tasks[index]))
+                    index += 1
+                
+                for i, result in group:
+                    if result is None:
+                        progress['failed'].append(links[i].url)
+                ready = [(i, result) for i, result in group if result is not None]
+                if ready:
+                    try:
+                        await self.send_batch_album(update, [result for _, result in ready])
+                        progress['sent'] += len(ready)
+                        for i, _ in ready:
+                            self.mark_job_sent(links[i].url)
+                    except Exception as e:
+                        logger.error(f"Error sending batch album: {e}")
+                        ERRORS.inc(error_class='pipeline')
+                        progress['failed'].extend(links[i].url for i, _ in ready)
+                    finally:
+                        for i, result in ready:
+                            self.discard_download(result)
+                            released.add(i)
+                await report()
+        finally:
+            # Cancelled midway: stop pending downloads and drop finished ones that weren't sent
+            for i, task in enumerate(tasks):
+                if not task.done():
+                    task.cancel()
+                elif i not in released and not task.cancelled() and task.exception() is None and task.result():
+                    self.discard_download(task.result())
+        
+        await report(final=True)
+    
+    async def send_batch_album(self, update: Update, results):
+        """Send downloaded or cached reels as one album and cache the new file_ids"""
+        # Carousels bring their own albums
+        for result in [result for result in results if result.get('items')]:
+            file_ids = await self.upload_carousel(update.message, result)
+            if not result.get('video_file_id') and all(file_ids):
+                entry = self.carousel_entry(result, file_ids, [])
+                self.reel_cache.put(result['shortcode'], entry, entry['video_file_id'])
+        results = [result for result in results if not result.get('items')]
+        if not results:
+            return
+        
+        with ExitStack() as stack:
+            media = []
+            for result in results:
+                if result.get('video_file_id'):
+                    video = result['video_file_id']
+                else:
+                    video = self.video_input(result, f"{result['shortcode']}.{result.get('ext') or 'mp4'}",
+                                             stack, attach=len(results) > 1)
+                media.append(InputMediaVideo(
+                    media=video,
+                    caption=self.format_video_caption(result),
+                    parse_mode='Markdown',
+                    supports_streaming=True
+                ))
+            uploaded = sum(upload_size(item.media) for item in media)
+            
+            with STAGE_SECONDS.time(stage='video_upload'):
+                if len(media) == 1:
+                    messages = [await self.uploader.send(lambda: update.message.reply_video(
+                        video=media[0].media, caption=media[0].caption, parse_mode='Markdown', supports_streaming=True
+                    ), kind='album')]
+                else:
+                    messages = await self.uploader.send(lambda: update.message.reply_media_group(media=media),
+                                                        kind='album')
+        BYTES_UPLOADED.inc(uploaded, kind='video')
+        
+        for result, message in zip(results, messages):
+            if result.get('video_file_id'):
+                continue
+            sent = message.video or message.animation or message.document
+            if sent:
+                self.reel_cache.put(result['shortcode'], result, sent.file_id)
+    
+    def discard_download(self, result):
+        """Close the buffer or delete the file behind a download_reel result"""
+        try:
+            if result.get('video') is not None:
+                result['video'].close()
+            if result.get('video_file') and os.path.exists(result['video_file']):
+                os.remove(result['video_file'])
+        except Exception as e:
+            logger.error(f"Cleanup error: {str(e)}")
+        for item in result.get('items') or ():
+            close_item(item)
+        self.scratch.release(result.get('workdir'))
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
@@ -523,6 +2327,10 @@ Use `/cookies` to setup authentication and avoid rate limits!
 **Example:**
 `/reel https://www.instagram.com/reel/ABC123xyz/`
 
+**Several reels at once:**
+Put multiple links in one `/reel` command, or just paste them as a message.
+They are sent back as albums (videos only, up to 20 links per message).
+
 **For Unlimited Downloads:**
 Instagram rate-limits downloads. To avoid this:
 • Use `/cookies` command
@@ -532,13 +2340,16 @@ Instagram rate-limits downloads. To avoid this:
 **Commands:**
 • `/start` - Welcome message
 • `/reel [url]` - Download reel/post
+• `/info [url]` - Just the username, likes and caption, no video
+• `/audio [url]` - Just the soundtrack, as an M4A
+• `/follow [username]` - Prefetch new reels from an account; `/unfollow` to stop
 • `/cookies` - Setup authentication
 • `/cookiestatus` - Check cookie status
 • `/help` - This help message
 
 **Supported formats:**
 • /reel/xxxxx/
-• /p/xxxxx/
+• /p/xxxxx/ - posts with several photos and videos arrive as albums
 • Short links (instagr.am)
 
 **Note:** Public reels work best. Private content requires cookies.
@@ -565,22 +2376,43 @@ Instagram rate-limits downloads. To avoid this:
         try:
             logger.info("Starting Instagram Reel Downloader Bot...")
             
-            # Check FFmpeg availability
-            if self.check_ffmpeg_installed():
-                logger.info("FFmpeg found - thumbnails will be available")
-            else:
-                logger.warning("FFmpeg not found - thumbnails will be disabled")
-            
-            # Clean up old cookies on startup
-            self.cleanup_old_cookies()
-            
-            app = Application.builder().token(self.bot_token).build()
+            # Handlers must run concurrently, otherwise a slow /reel still blocks other users
+            builder = Application.builder()
+            if self.configure_bot_api():
+                builder = (
+                    builder.base_url(f"{self.bot_api_base_url}/bot")
+                    .base_file_url(f"{self.bot_api_base_url}/file/bot")
+                    .local_mode(True)
+                )
+            app = (
+                builder
+                .token(self.bot_token)
+                .request(self.make_request())
+                # Long polling keeps its own connection, so it never waits behind uploads
+                .get_updates_request(make_bot_request(1, connect_timeout=30, read_timeout=30, write_timeout=30))
+                .concurrent_updates(True)
+                .post_init(self.post_init)
+                .post_shutdown(self.post_shutdown)
+                .build()
+            )
             
             # Add error handler
             app.add_error_handler(self.error_handler)
             
             app.add_handler(CommandHandler("start", self.start_command))
-            app.add_handler(CommandHandler("reel", self.reel_command))
+            if self.work_queue:
+                logger.info(f"Sharded mode: handing /reel to {self.worker_processes} worker processes")
+                app.add_handler(CommandHandler("reel", self.enqueue_command))
+                app.add_handler(CommandHandler("audio", self.enqueue_command))
+            else:
+                app.add_handler(CommandHandler("reel", self.reel_command))
+                app.add_handler(CommandHandler("audio", self.audio_command))
+            # Metadata lookups are cheap enough to answer here, even in sharded mode
+            app.add_handler(CommandHandler("info", self.info_command))
+            # `@bot <link>` in any chat
+            app.add_handler(InlineQueryHandler(self.inline_query))
+            app.add_handler(CommandHandler("follow", self.follow_command))
+            app.add_handler(CommandHandler("unfollow", self.unfollow_command))
             app.add_handler(CommandHandler("cookies", self.cookies_command))
             app.add_handler(CommandHandler("cookiestatus", self.cookie_status_command))
             app.add_handler(CommandHandler("help", self.help_command))
@@ -588,6 +2420,11 @@ Instagram rate-limits downloads. To avoid this:
             # Handle document uploads (cookies.txt files)
             app.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
             
+            # Plain messages with Instagram links work like /reel
+            app.add_handler(MessageHandler(
+                filters.TEXT & ~filters.COMMAND, self.enqueue_command if self.work_queue else self.text_message
+            ))
+            
             logger.info("Bot is running and ready to download Instagram reels!")
             
             # Check if we're on Render (webhook mode) or local (polling mode)
@@ -606,6 +2443,10 @@ Instagram rate-limits downloads. To avoid this:
                 # Webhook mode for production (Render)
                 logger.info("🌐 Running in webhook mode for production")
                 
+                if self.fast_start:
+                    asyncio.run(self.serve_webhook(app, int(port), f"{webhook_url}/webhook"))
+                    return
+                
                 # Use telegram-bot's native webhook server - NO FLASK!
                 app.run_webhook(
                     listen="0.0.0.0",
@@ -623,15 +2464,64 @@ Instagram rate-limits downloads. To avoid this:
                 app.run_polling(
                     allowed_updates=Update.ALL_TYPES,
                     drop_pending_updates=True,  # Clear any pending updates
-                    timeout=30,
-                    read_timeout=30,
-                    write_timeout=30,
-                    connect_timeout=30
+                    timeout=30
                 )
             
         except Exception as e:
             logger.error(f"Failed to start bot: {e}")
             raise
+    
+    async def serve_webhook(self, app, port, webhook_url):
+        """Webhook mode for scale-to-zero hosts: bind the port first, then initialise the bot
+        
+        run_webhook only listens after getMe, post_init and setWebhook, and
+        drops pending updates - including the one that woke the service.
+        Here updates are acknowledged and queued from the first moment and
+        handled once the application has started; the webhook is only
+        registered again if it points elsewhere, keeping pending updates.
+        """
+        # PTB's own webhook server; python-telegram-bot is pinned, so its internal module is stable
+        from telegram.ext._utils.webhookhandler import WebhookAppClass, WebhookServer
+        
+        server = WebhookServer("0.0.0.0", port, WebhookAppClass("/webhook", app.bot, app.update_queue, None), None)
+        await server.serve_forever()
+        logger.info(f"🌐 Listening for updates on port {port}")
+        
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            await app.initialize()
+            await self.post_init(app)
+            await app.start()
+            self.background_tasks.append(asyncio.create_task(self.register_webhook(app.bot, webhook_url)))
+            await stop.wait()
+        finally:
+            await server.shutdown()
+            if app.running:
+                await app.stop()
+            await app.shutdown()
+            await self.post_shutdown(app)
+    
+    async def register_webhook(self, bot, webhook_url):
+        """Point Telegram at webhook_url unless it already does"""
+        try:
+            info = await bot.get_webhook_info()
+            if info.url != webhook_url:
+                await bot.set_webhook(webhook_url, allowed_updates=Update.ALL_TYPES)
+                logger.info(f"Webhook set to {webhook_url}")
+        except Exception as e:
+            logger.error(f"Could not register webhook: {e}")
+
+
+def run_worker_process(bot_token, worker_name, metrics_port=0):
+    """Entry point of a worker process in sharded mode"""
+    bot = InstaReelBot(bot_token)
+    try:
+        asyncio.run(bot.work(worker_name, metrics_port))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
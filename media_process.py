@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+import subprocess
+import time
+
+from metrics import FFMPEG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class MediaProcessRunner:
+    """Runs ffmpeg/ffprobe as asyncio subprocesses, so they never block the event loop
+
+    At most ``max_processes`` children (one per CPU core by default) run at
+    once; the rest wait their turn. A child that outlives its timeout, or
+    whose caller is cancelled, is killed and reaped before the error
+    propagates, so abandoned jobs don't leave encoders burning CPU.
+    """
+
+    def __init__(self, max_processes=None):
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self._slots = asyncio.Semaphore(self.max_processes)
+        self.running = 0
+        self.waiting = 0
+
+    async def run(self, args, input=None, timeout=None, operation=None):
+        """Run a command to completion and return a subprocess.CompletedProcess with bytes output
+
+        Raises subprocess.TimeoutExpired after ``timeout`` seconds and
+        FileNotFoundError if the executable is missing, like subprocess.run.
+        """
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            self.running += 1
+            try:
+                # communicate() reads stdout and stderr together, so a chatty child can't fill a pipe and stall
+                stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout)
+            except asyncio.TimeoutError:
+                await self.kill(process)
+                raise subprocess.TimeoutExpired(args, timeout)
+            except asyncio.CancelledError:
+                await self.kill(process)
+                raise
+            finally:
+                self.running -= 1
+        finally:
+            self._slots.release()
+            if operation:
+                FFMPEG_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    @staticmethod
+    async def kill(process):
+        if process.returncode is not None:
+            return
+        try:
+            process.kill()
+        except ProcessLookupError:
+            return  # Exited in the meantime
+        # Reap it even if our caller is being cancelled, or it lingers as a zombie
+        await asyncio.shield(process.wait())
+        logger.info(f"Killed child process {process.pid}")
@@ -0,0 +1,77 @@
+import logging
+import os
+import tempfile
+
+import httpx
+from telegram import InputFile
+
+from metrics import BYTES_DOWNLOADED, MEDIA_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def can_stream(info):
+    """True when yt-dlp resolved a single progressive HTTP(S) file we can fetch ourselves"""
+    return bool(
+        info.get('url')
+        and not info.get('requested_formats')
+        and info.get('protocol', 'https') in ('http', 'https')
+    )
+
+
+def stream_media(url, headers=None, max_memory=20 * 1024 * 1024, chunk_size=256 * 1024,
+                 spool_dir=None, tee=None, timeout=30, path=None):
+    """Download a media URL in chunks into a spooled buffer
+
+    The buffer stays in memory up to ``max_memory`` bytes and only spills to a
+    temporary file in ``spool_dir`` above that. With ``path`` the media is
+    written to that file instead, for consumers that need it by name. Every
+    chunk is also handed to ``tee`` (anything with a write() method) while it
+    streams in. The returned buffer is rewound and owned by the caller, who
+    must close() it.
+    """
+    if path:
+        spool = open(path, 'w+b')
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=max_memory, dir=spool_dir)
+    try:
+        with httpx.stream('GET', url, headers=headers, timeout=timeout, follow_redirects=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes(chunk_size):
+                spool.write(chunk)
+                if tee is not None:
+                    tee.write(chunk)
+
+        size = spool.tell()
+        spool.seek(0)
+        BYTES_DOWNLOADED.inc(size)
+        MEDIA_SIZE.observe(size)
+        logger.info(f"Streamed {size / 1024 / 1024:.1f} MB ({'on disk' if getattr(spool, '_rolled', True) else 'in memory'})")
+        return spool
+    except Exception:
+        spool.close()
+        raise
+
+
+def upload_file(handle, filename, attach=False):
+    """A named InputFile that streams ``handle`` to the Bot API instead of reading it into memory
+
+    PTB can't name a SpooledTemporaryFile, so the filename is explicit. Spools
+    hand over the BytesIO or file inside them: httpx asks uploads for a
+    fileno(), which would roll an in-memory spool over to disk. httpx rewinds
+    the handle before sending, so a retry sends the whole file again.
+    """
+    return InputFile(getattr(handle, '_file', handle), filename=filename, attach=attach, read_file_handle=False)
+
+
+def upload_size(media):
+    """Bytes an upload sends: the length of an InputFile's content, 0 for file_ids and local paths"""
+    content = getattr(media, 'input_file_content', None)
+    if content is None:
+        return 0
+    if isinstance(content, bytes):
+        return len(content)
+    position = content.tell()
+    size = content.seek(0, os.SEEK_END)
+    content.seek(position)
+    return size
@@ -0,0 +1,216 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+BYTES_BUCKETS = tuple(2 ** n for n in range(16, 31, 2))  # 64 KiB .. 1 GiB
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Optional callback returning {label values tuple: value}, evaluated at scrape time,
+        # for values that already live elsewhere (cache counters, queue depths)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _current(self):
+        if self.function is None:
+            return self._values
+        try:
+            return self.function()
+        except Exception as e:
+            logger.error(f"Error collecting {self.name}: {e}")
+            return {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._current().items()]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._current().items()]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of a block (works around awaits too)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        # Re-registering replaces the metric, so a new bot instance can rebind callbacks
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), function=None):
+        return self._register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Reel pipeline
+STAGE_SECONDS = REGISTRY.histogram(
+    'reel_stage_seconds', 'Latency of each reel pipeline stage', ['stage'])
+REQUESTS = REGISTRY.counter(
+    'reel_requests', 'Reel requests by how they were served', ['source'])
+ERRORS = REGISTRY.counter(
+    'reel_errors', 'Reel pipeline errors by class', ['error_class'])
+BYTES_DOWNLOADED = REGISTRY.counter(
+    'reel_downloaded_bytes', 'Media bytes downloaded from Instagram')
+BYTES_UPLOADED = REGISTRY.counter(
+    'reel_uploaded_bytes', 'Media bytes uploaded to Telegram', ['kind'])
+MEDIA_SIZE = REGISTRY.histogram(
+    'reel_media_bytes', 'Size of downloaded media files', buckets=BYTES_BUCKETS)
+FORMAT_DECISIONS = REGISTRY.counter(
+    'reel_format_decisions', 'How the downloaded format was chosen', ['outcome'])
+FORMAT_BYTES_SAVED = REGISTRY.counter(
+    'reel_format_saved_bytes', "Estimated bytes avoided by picking a smaller format than yt-dlp's best")
+UPLOAD_ATTEMPTS = REGISTRY.counter(
+    'telegram_upload_attempts', 'Bot API media upload attempts by outcome', ['kind', 'outcome'])
+UPLOAD_SECONDS = REGISTRY.histogram(
+    'telegram_upload_seconds', 'Duration of successful Bot API media uploads', ['kind'])
+FFMPEG_SECONDS = REGISTRY.histogram(
+    'ffmpeg_seconds', 'Wall-clock time spent in ffmpeg/ffprobe', ['operation'])
+
+
+class MetricsServer:
+    """Serves /metrics and /healthz on a small tornado app next to the bot's own listener"""
+
+    def __init__(self, registry=REGISTRY, port=9090, address='0.0.0.0'):
+        self.registry = registry
+        self.port = port
+        self.address = address
+        self._server = None
+
+    def start(self):
+        """Start listening on the running event loop"""
+        import tornado.web
+
+        registry = self.registry
+
+        class MetricsHandler(tornado.web.RequestHandler):
+            def get(self):
+                self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.write(registry.render())
+
+        class HealthHandler(tornado.web.RequestHandler):
+            def get(self):
+                self.write('ok\n')
+
+        # Scrapes and health probes would flood the access log
+        app = tornado.web.Application(
+            [(r'/metrics', MetricsHandler), (r'/healthz', HealthHandler)], log_function=lambda handler: None
+        )
+        self._server = app.listen(self.port, address=self.address)
+        logger.info(f"Metrics available on http://{self.address}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
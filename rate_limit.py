@@ -0,0 +1,175 @@
+import logging
+import random
+import threading
+import time
+
+from extractor_pool import ANONYMOUS
+
+logger = logging.getLogger(__name__)
+
+# Error classes for yt-dlp extraction failures
+RATE_LIMITED = 'rate_limited'
+LOGIN_REQUIRED = 'login_required'
+NOT_FOUND = 'not_found'
+OTHER = 'other'
+
+# Checked in order: yt-dlp answers private posts with "rate-limit reached or login required", a login wall
+ERROR_MARKERS = (
+    (RATE_LIMITED, ('429', 'too many requests', 'please wait a few minutes')),
+    (LOGIN_REQUIRED, ('login required', 'logged-in', 'log in', 'login_required', 'cookies', '401')),
+    (RATE_LIMITED, ('rate-limit', 'rate limit')),
+    (NOT_FOUND, ('404', 'not found', 'does not exist', 'unavailable', 'not available', 'removed')),
+)
+
+
+class RateLimitedError(Exception):
+    """Raised when no extraction identity may talk to Instagram right now"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Instagram rate limit, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def classify_error(error):
+    """Map a yt-dlp exception to one of the error classes above"""
+    message = str(error).lower()
+    for error_class, markers in ERROR_MARKERS:
+        if any(marker in message for marker in markers):
+            return error_class
+    return OTHER
+
+
+class _Identity:
+    def __init__(self, burst):
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.backoff_until = 0.0
+        self.failures = 0  # Consecutive throttling failures, drives the backoff exponent
+        self.requests = 0
+        self.errors = {}
+        self.login_walls = {}  # Recently walled URL -> when
+
+
+class RateLimiter:
+    """Token bucket plus exponential backoff per extraction identity
+
+    An identity is the anonymous profile or a user's cookie profile. Each one
+    gets ``rate_per_minute`` requests with bursts of up to ``burst``. Throttling
+    responses (429, or anonymous login walls on ``login_wall_threshold``
+    distinct URLs within ``login_wall_window`` seconds) put the identity into
+    backoff for base * 2^failures seconds with jitter, capped at
+    ``max_backoff``; any success resets it. A single login wall is just a
+    private post and fails only its own request.
+    """
+
+    def __init__(self, rate_per_minute=30, burst=10, base_backoff=30, max_backoff=900,
+                 login_wall_threshold=3, login_wall_window=300):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.login_wall_threshold = max(1, login_wall_threshold)
+        self.login_wall_window = login_wall_window
+        self._identities = {}
+        self._lock = threading.Lock()
+
+    def _get(self, identity):
+        state = self._identities.get(identity)
+        if state is None:
+            state = self._identities[identity] = _Identity(self.burst)
+        now = time.monotonic()
+        state.tokens = min(self.burst, state.tokens + (now - state.refilled_at) * self.rate)
+        state.refilled_at = now
+        return state
+
+    def wait_time(self, identity):
+        """Seconds until the identity may make its next request (0 = now)"""
+        with self._lock:
+            state = self._get(identity)
+            backoff = max(0.0, state.backoff_until - time.monotonic())
+            refill = 0.0 if state.tokens >= 1 else (1 - state.tokens) / self.rate
+            return max(backoff, refill)
+
+    def headroom(self, identity):
+        """Tokens the identity has right now (0 while backing off), for work that must leave room for users"""
+        with self._lock:
+            state = self._get(identity)
+            if state.backoff_until > time.monotonic():
+                return 0.0
+            return state.tokens
+
+    def select(self, preferred, fallbacks=()):
+        """Pick the identity to use: the preferred one, or a healthy fallback if it is throttled"""
+        wait = self.wait_time(preferred)
+        if wait == 0:
+            return preferred, 0.0
+
+        for identity in fallbacks:
+            if identity != preferred and self.wait_time(identity) == 0:
+                logger.info(f"Spilling {preferred} traffic over to {identity}")
+                return identity, 0.0
+        return preferred, wait
+
+    def acquire(self, identity, max_wait=0, reserve=0):
+        """Take a token, sleeping up to max_wait seconds; raises RateLimitedError otherwise
+
+        Background work passes a ``reserve``: it only gets a token if that many
+        are left for users afterwards, checked and taken under one lock.
+        """
+        wait = self.wait_time(identity)
+        if wait > max_wait:
+            raise RateLimitedError(wait)
+        if wait:
+            time.sleep(wait)
+
+        with self._lock:
+            state = self._get(identity)
+            if reserve and state.tokens < reserve + 1:
+                raise RateLimitedError((reserve + 1 - state.tokens) / self.rate)
+            state.tokens = max(0.0, state.tokens - 1)
+            state.requests += 1
+
+    def record_success(self, identity):
+        with self._lock:
+            state = self._get(identity)
+            state.failures = 0
+            state.backoff_until = 0.0
+            state.login_walls.clear()
+
+    def record_failure(self, identity, error_class, url=None):
+        """Count a failed extraction of ``url`` and back off if Instagram is throttling this identity"""
+        with self._lock:
+            state = self._get(identity)
+            state.errors[error_class] = state.errors.get(error_class, 0) + 1
+
+            throttled = error_class == RATE_LIMITED
+            if error_class == LOGIN_REQUIRED and identity == ANONYMOUS:
+                # Login walls on many different posts are how Instagram throttles logged-out traffic
+                now = time.monotonic()
+                state.login_walls = {key: at for key, at in state.login_walls.items()
+                                     if now - at < self.login_wall_window}
+                state.login_walls[url if url is not None else object()] = now
+                throttled = len(state.login_walls) >= self.login_wall_threshold
+            if not throttled:
+                return
+
+            delay = min(self.max_backoff, self.base_backoff * 2 ** state.failures)
+            delay *= random.uniform(0.5, 1.5)
+            state.failures += 1
+            state.backoff_until = time.monotonic() + delay
+            logger.warning(f"{identity} throttled by Instagram ({error_class}), backing off for {delay:.0f}s")
+
+    def snapshot(self):
+        """Current limiter state per identity, for metrics"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                identity: {
+                    'tokens': round(min(self.burst, state.tokens + (now - state.refilled_at) * self.rate), 2),
+                    'backoff_seconds': round(max(0.0, state.backoff_until - now), 1),
+                    'consecutive_failures': state.failures,
+                    'requests': state.requests,
+                    'errors': dict(state.errors),
+                }
+                for identity, state in self._identities.items()
+            }
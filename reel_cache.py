@@ -0,0 +1,199 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# download_reel/process_reel result fields that are not stored as metadata
+TRANSIENT_FIELDS = ('video_file', 'video', 'thumbnails', 'video_file_id', 'thumbnail_file_ids', 'workdir',
+                    'audio_file', 'audio_file_id')
+
+
+class ReelCache:
+    """Persistent reel cache keyed by Instagram shortcode
+
+    Stores the metadata returned by download_reel together with the Telegram
+    file_ids of the uploaded video, thumbnails and audio, so repeat requests can be
+    answered without downloading, running ffmpeg or re-uploading anything.
+    Entries expire after ``ttl`` seconds and the least recently used ones are
+    evicted once the cache holds more than ``max_entries`` reels.
+    """
+
+    def __init__(self, path, ttl=7 * 86400, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS reels (
+                shortcode TEXT PRIMARY KEY,
+                metadata TEXT NOT NULL,
+                video_file_id TEXT,
+                thumbnail_file_ids TEXT NOT NULL DEFAULT '[]',
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS reels_last_access ON reels (last_access)')
+        # Caches created before /audio lack the column
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(reels)')]
+        if 'audio_file_id' not in columns:
+            try:
+                self._conn.execute('ALTER TABLE reels ADD COLUMN audio_file_id TEXT')
+            except sqlite3.OperationalError as e:
+                # Worker processes start together; only the first one gets to add the column
+                if 'duplicate column' not in str(e):
+                    raise
+        self._conn.commit()
+
+    def get(self, shortcode, needs=None):
+        """Return the cached entry for a shortcode, or None on a miss
+
+        ``needs`` names the field the caller serves from (e.g. 'video_file_id').
+        Entries without it, like the metadata cached by /info, are still
+        returned but count as a miss.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT metadata, video_file_id, thumbnail_file_ids, audio_file_id, created_at FROM reels '
+                'WHERE shortcode = ?',
+                (shortcode,)
+            ).fetchone()
+
+            if row and now - row[4] > self.ttl:
+                self._conn.execute('DELETE FROM reels WHERE shortcode = ?', (shortcode,))
+                self._conn.commit()
+                row = None
+
+            if not row:
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE reels SET last_access = ? WHERE shortcode = ?', (now, shortcode))
+            self._conn.commit()
+
+        return self._counted(row, needs)
+
+    def peek(self, shortcode, needs=None):
+        """Read-only get() for latency-critical paths: no expiry cleanup or last_access write"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT metadata, video_file_id, thumbnail_file_ids, audio_file_id FROM reels '
+                'WHERE shortcode = ? AND created_at >= ?',
+                (shortcode, time.time() - self.ttl)
+            ).fetchone()
+            if not row:
+                self.misses += 1
+                return None
+
+        return self._counted(row, needs)
+
+    def _counted(self, row, needs):
+        entry = json.loads(row[0])
+        entry['video_file_id'] = row[1]
+        entry['thumbnail_file_ids'] = json.loads(row[2])
+        entry['audio_file_id'] = row[3]
+        with self._lock:
+            if needs is None or entry.get(needs):
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def has(self, shortcode):
+        """Whether anything is cached for the shortcode, without counting a hit or miss"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM reels WHERE shortcode = ? AND created_at >= ?', (shortcode, time.time() - self.ttl)
+            ).fetchone()
+        return row is not None
+
+    def has_video(self, shortcode):
+        """Whether a file_id is cached for the shortcode, without counting a hit or miss"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM reels WHERE shortcode = ? AND video_file_id IS NOT NULL AND created_at >= ?',
+                (shortcode, time.time() - self.ttl)
+            ).fetchone()
+        return row is not None
+
+    def put(self, shortcode, metadata, video_file_id=None, thumbnail_file_ids=None):
+        """Store metadata and Telegram file_ids for a shortcode"""
+        # Local files, buffers and frame bytes are meaningless once the job is cleaned up
+        metadata = {k: v for k, v in metadata.items() if k not in TRANSIENT_FIELDS}
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO reels (shortcode, metadata, video_file_id, thumbnail_file_ids, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(shortcode) DO UPDATE SET
+                    metadata = excluded.metadata,
+                    video_file_id = COALESCE(excluded.video_file_id, reels.video_file_id),
+                    thumbnail_file_ids = CASE WHEN excluded.thumbnail_file_ids != '[]'
+                        THEN excluded.thumbnail_file_ids ELSE reels.thumbnail_file_ids END,
+                    last_access = excluded.last_access,
+                    -- The TTL runs from the latest upload: a fresh file_id restarts it, a metadata refresh doesn't
+                    created_at = CASE WHEN excluded.video_file_id IS NOT NULL
+                        THEN excluded.created_at ELSE reels.created_at END
+                """,
+                (shortcode, json.dumps(metadata), video_file_id, json.dumps(thumbnail_file_ids or []), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def put_audio(self, shortcode, metadata, audio_file_id):
+        """Store the file_id of a reel's soundtrack, keeping what is already cached for the shortcode
+
+        The metadata is only used when the shortcode isn't cached yet: a
+        cached carousel keeps its items.
+        """
+        metadata = {k: v for k, v in metadata.items() if k not in TRANSIENT_FIELDS}
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO reels (shortcode, metadata, audio_file_id, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(shortcode) DO UPDATE SET
+                    audio_file_id = excluded.audio_file_id,
+                    last_access = excluded.last_access
+                """,
+                (shortcode, json.dumps(metadata), audio_file_id, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        self._conn.execute('DELETE FROM reels WHERE created_at < ?', (time.time() - self.ttl,))
+        count = self._conn.execute('SELECT COUNT(*) FROM reels').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM reels WHERE shortcode IN (SELECT shortcode FROM reels ORDER BY last_access LIMIT ?)',
+                (count - self.max_entries,)
+            )
+            logger.info(f"Evicted {count - self.max_entries} reels from cache")
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries"""
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) FROM reels').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
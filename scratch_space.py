@@ -0,0 +1,165 @@
+import itertools
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+JOB_PREFIX = 'job-'
+
+
+class DiskBudgetError(Exception):
+    """Raised when another job could push scratch usage over the budget or fill the volume"""
+
+
+def dir_size(path):
+    """Bytes used by the files under a directory, ignoring files removed while walking"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by someone else
+    return True
+
+
+class ScratchSpace:
+    """Per-job scratch directories under one root, admitted against a disk budget
+
+    Every download gets its own directory, so concurrent jobs never collide on
+    file names and a job's leftovers go away with one rmtree. A job is only
+    admitted if the root's usage plus what running downloads may still write
+    stays within ``budget`` bytes and the volume keeps ``min_free`` bytes free.
+    Space is reserved (reserve()) only while a job's download runs, so jobs
+    waiting for a worker or holding finished media don't count twice.
+    Directory names carry the owning pid, so the janitor (sweep) can tell
+    orphans of crashed jobs and dead processes from live work, including that
+    of other worker processes sharing the root.
+    """
+
+    def __init__(self, root, budget, job_reserve, min_free=0, orphan_age=3600):
+        self.root = root
+        self.budget = budget
+        self.job_reserve = job_reserve
+        self.min_free = min_free
+        self.orphan_age = orphan_age
+        self.rejected = 0
+        self.reclaimed_bytes = 0
+        self._active = set()
+        self._reserved = set()  # Directories of downloads in progress
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def jobs(self):
+        return len(self._active)
+
+    def usage(self):
+        return dir_size(self.root)
+
+    @contextmanager
+    def _admission(self):
+        """Raise DiskBudgetError unless one more reservation fits, else hold the lock while the caller takes it"""
+        with self._lock:
+            reserved = list(self._reserved)
+        # Walk the tree outside the lock so releases and the janitor aren't held up meanwhile
+        used = self.usage()
+        sizes = {path: dir_size(path) for path in reserved}
+        free = shutil.disk_usage(self.root).free
+        with self._lock:
+            # Running downloads may still grow up to their reservation; ones started since the walk count in full
+            outstanding = sum(max(0, self.job_reserve - sizes.get(path, 0)) for path in self._reserved)
+            if used + outstanding + self.job_reserve > self.budget:
+                self.rejected += 1
+                raise DiskBudgetError(f"Scratch space is at {used / 1024 / 1024:.0f} of "
+                                      f"{self.budget / 1024 / 1024:.0f} MB")
+            if free - outstanding - self.job_reserve < self.min_free:
+                self.rejected += 1
+                raise DiskBudgetError(f"Only {free / 1024 / 1024:.0f} MB free on the scratch volume")
+            yield
+
+    def acquire(self):
+        """Create a scratch directory for a new job, or raise DiskBudgetError if its download could not fit"""
+        with self._admission():
+            path = os.path.join(self.root, f"{JOB_PREFIX}{os.getpid()}-{next(self._ids)}")
+            os.makedirs(path)
+            self._active.add(path)
+        return path
+
+    @contextmanager
+    def reserve(self, path):
+        """Set ``job_reserve`` bytes aside for a job while its download runs, or raise DiskBudgetError"""
+        if path is None:
+            yield
+            return
+        with self._admission():
+            self._reserved.add(path)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved.discard(path)
+
+    def release(self, path):
+        """Delete a job's directory and everything left in it"""
+        if path is None:
+            return
+        with self._lock:
+            self._active.discard(path)
+            self._reserved.discard(path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def is_orphan(self, entry):
+        if entry.name.startswith(JOB_PREFIX) and entry.is_dir(follow_symlinks=False):
+            try:
+                pid = int(entry.name[len(JOB_PREFIX):].split('-', 1)[0])
+            except ValueError:
+                pid = None
+            if pid == os.getpid():
+                return entry.path not in self._active
+            if pid is None or not pid_alive(pid):
+                return True
+        # Anything else is a stray from an older layout, or a job of a recycled pid; no job runs this long
+        return self.is_stale(entry)
+
+    def is_stale(self, entry):
+        try:
+            return time.time() - entry.stat(follow_symlinks=False).st_mtime > self.orphan_age
+        except OSError:
+            return False
+
+    def sweep(self):
+        """Remove directories of finished or crashed jobs and stale strays, returning the bytes reclaimed"""
+        reclaimed = 0
+        with self._lock:
+            entries = [entry for entry in os.scandir(self.root) if self.is_orphan(entry)]
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    size = dir_size(entry.path)
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    size = entry.stat(follow_symlinks=False).st_size
+                    os.remove(entry.path)
+            except OSError as e:
+                logger.error(f"Could not remove {entry.path}: {e}")
+                continue
+            reclaimed += size
+            logger.info(f"Reclaimed orphaned scratch {entry.name} ({size / 1024 / 1024:.1f} MB)")
+        self.reclaimed_bytes += reclaimed
+        return reclaimed
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into a single execution
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is running await the same task instead of starting another.
+    Failures propagate to every waiter. A waiter that gets cancelled only stops
+    waiting - the work is cancelled once nobody is waiting for it anymore.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.executions = 0  # Calls that did the work
+        self.coalesced = 0  # Calls that piggybacked on an in-flight execution
+
+    def in_flight(self, key):
+        return key in self._flights
+
+    async def do(self, key, func):
+        """Run the coroutine function once per key and return (result, shared)"""
+        flight = self._flights.get(key)
+        shared = flight is not None and not flight.abandoned
+        if shared:
+            self.coalesced += 1
+            logger.info(f"Coalesced request for {key} ({flight.waiters} already waiting)")
+        else:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.executions += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.abandoned = True
+                flight.task.cancel()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self):
+        return {
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._flights),
+        }
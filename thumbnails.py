@@ -0,0 +1,294 @@
+import asyncio
+import io
+import logging
+import subprocess
+import threading
+import time
+
+from metrics import FFMPEG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Candidate frames are decoded once at this size and the picks encoded from them
+THUMBNAIL_MAX_SIDE = 640
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_COUNT = 5
+MAX_CANDIDATES = 24
+
+# Scene score above which a frame counts as a cut
+SCENE_THRESHOLD = 0.3
+# Frames this close (bits differing out of 64 in the difference hash) are duplicates
+DUPLICATE_DISTANCE = 10
+# Grey-level spread below which a frame is a fade, black or flat colour
+MIN_CONTRAST = 12.0
+
+# Full decodes skip the frames nothing else references (candidates come from the rest) and the
+# deblocking filter, which is invisible once frames are scaled down
+FAST_DECODE_ARGS = ['-skip_frame', 'noref', '-skip_loop_filter', 'all']
+# Reads the packet index only, nothing is decoded
+PROBE_KEYFRAMES_ARGS = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=flags',
+                        '-of', 'csv=p=0']
+
+
+def build_select_expression(duration, max_candidates=MAX_CANDIDATES):
+    """Select keyframes and scene cuts spread over the video, plus a fallback sample every few gaps"""
+    min_gap = max(0.5, (duration or 0) / max_candidates)
+    max_gap = min_gap * 3
+    since = "t-prev_selected_t"
+    return (
+        f"select='gt(isnan(prev_selected_t)"
+        f"+gte({since}\\,{min_gap:.2f})*(eq(pict_type\\,I)+gt(scene\\,{SCENE_THRESHOLD}))"
+        f"+gte({since}\\,{max_gap:.2f})\\,0)'"
+    )
+
+
+def candidate_output_args(duration, max_side=THUMBNAIL_MAX_SIDE, max_candidates=MAX_CANDIDATES):
+    """FFmpeg output options that write the candidate frames to stdout as a PPM stream"""
+    scale = (f"scale='if(gt(iw,ih),min({max_side},iw),-2)':"
+             f"'if(gt(iw,ih),-2,min({max_side},ih))'")
+    return [
+        '-an', '-vf', f"{build_select_expression(duration, max_candidates)},{scale}",
+        '-fps_mode', 'vfr', '-frames:v', str(max_candidates),
+        '-f', 'image2pipe', '-c:v', 'ppm', 'pipe:1'
+    ]
+
+
+def split_ppm_stream(data):
+    """Split concatenated binary PPM images (image2pipe) into HxWx3 uint8 arrays"""
+    import numpy as np  # Imported on first use, not on the bot's startup path
+    frames = []
+    offset = 0
+    while offset < len(data):
+        # Header: P6 <whitespace> width <whitespace> height <whitespace> maxval <single whitespace>
+        fields = []
+        position = offset
+        while len(fields) < 4:
+            while position < len(data) and data[position:position + 1].isspace():
+                position += 1
+            start = position
+            while position < len(data) and not data[position:position + 1].isspace():
+                position += 1
+            if start == position:
+                return frames  # Truncated header
+            fields.append(data[start:position])
+        if fields[0] != b'P6':
+            break
+        width, height = int(fields[1]), int(fields[2])
+        start = position + 1
+        end = start + width * height * 3
+        if end > len(data):
+            break
+        frames.append(np.frombuffer(data, dtype=np.uint8, count=width * height * 3, offset=start).reshape(height, width, 3))
+        offset = end
+    return frames
+
+
+def difference_hashes(gray):
+    """64-bit difference hashes of a stack of greyscale frames (N, H, W), as (N, 64) booleans"""
+    count, height, width = gray.shape
+    rows, cols = height // 8, width // 9
+    # Area-average every frame down to 8x9 in one reshape, no per-frame resizing
+    small = gray[:, :rows * 8, :cols * 9].reshape(count, 8, rows, 9, cols).mean(axis=(2, 4))
+    return (small[:, :, 1:] > small[:, :, :-1]).reshape(count, 64)
+
+
+def pick_thumbnails(frames, count=THUMBNAIL_COUNT):
+    """Choose up to ``count`` informative, mutually distinct frames, spread over the video
+
+    Frames are scored by contrast; fades, black and flat frames are dropped,
+    then the video is split into ``count`` stretches and the best frame of each
+    that is not a near-duplicate of an earlier pick is taken. Remaining slots
+    are filled by score, and if too few frames are distinct, by the frames
+    least similar to the picks so far. Returns indexes into ``frames`` in
+    playback order.
+    """
+    if not frames:
+        return []
+    import numpy as np
+    # Every candidate comes from the same scaler, so the shapes match and the frames stack
+    shape = frames[0].shape
+    indexes = [i for i, frame in enumerate(frames) if frame.shape == shape]
+    stack = np.stack([frames[i] for i in indexes]).astype(np.float32)
+    gray = stack @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    contrast = gray.std(axis=(1, 2))
+    informative = contrast >= MIN_CONTRAST
+    if not informative.any():
+        informative = contrast == contrast.max()
+    hashes = difference_hashes(gray)
+    distances = (hashes[:, None, :] != hashes[None, :, :]).sum(axis=2)
+
+    picked = []
+
+    def distinct(candidate):
+        return all(distances[candidate, other] > DUPLICATE_DISTANCE for other in picked)
+
+    order = np.argsort(-contrast)
+    for stretch in np.array_split(np.arange(len(indexes)), count):
+        for candidate in sorted(stretch, key=lambda i: -contrast[i]):
+            if informative[candidate] and distinct(candidate):
+                picked.append(candidate)
+                break
+    for candidate in order:
+        if len(picked) >= count:
+            break
+        if candidate not in picked and informative[candidate] and distinct(candidate):
+            picked.append(candidate)
+    # Near-duplicates beat too few thumbnails: take the most different of the rest, informative ones first
+    while len(picked) < min(count, len(indexes)):
+        rest = [i for i in order if i not in picked]
+        picked.append(max(rest, key=lambda i: (
+            bool(informative[i]), min((distances[i, other] for other in picked), default=64), contrast[i]
+        )))
+    return sorted(indexes[i] for i in picked)
+
+
+def encode_jpeg(frame, quality=THUMBNAIL_QUALITY):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def candidate_command(video_file, duration, keyframes_only):
+    # -skip_frame nokey stops the decoder from touching anything but keyframes
+    skip = ['-skip_frame', 'nokey'] if keyframes_only else FAST_DECODE_ARGS
+    return ['ffmpeg', '-v', 'error'] + skip + ['-i', video_file] + candidate_output_args(duration)
+
+
+def keyframes_suffice(result, count):
+    """Whether a PROBE_KEYFRAMES_ARGS result lists enough keyframes to pick thumbnails from them alone"""
+    if result.returncode != 0:
+        return False
+    return sum(1 for flags in result.stdout.split() if flags.startswith(b'K')) >= count
+
+
+def candidate_frames(result):
+    if result.returncode != 0:
+        logger.error(f"FFmpeg frame extraction failed: {result.stderr.decode(errors='replace').strip()}")
+        return []
+    return split_ppm_stream(result.stdout)
+
+
+def pick_and_encode(frames, count=THUMBNAIL_COUNT):
+    """Pick the best distinct candidates and encode only those as JPEG"""
+    return [encode_jpeg(frames[i]) for i in pick_thumbnails(frames, count)]
+
+
+def extract_thumbnails(video_file, duration, count=THUMBNAIL_COUNT, timeout=30):
+    """Pick thumbnails from a video file, returned as in-memory JPEG bytes
+
+    The video is decoded once. The packet index is read first: videos with a
+    short GOP have enough keyframes and only those are decoded; the rest
+    decode every frame and add scene cuts and regular samples.
+    """
+    with FFMPEG_SECONDS.time(operation='probe_keyframes'):
+        probe = subprocess.run(PROBE_KEYFRAMES_ARGS + [video_file], capture_output=True, timeout=timeout)
+    keyframes_only = keyframes_suffice(probe, count)
+    with FFMPEG_SECONDS.time(operation='extract_keyframes' if keyframes_only else 'extract_frames'):
+        result = subprocess.run(candidate_command(video_file, duration, keyframes_only),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    return pick_and_encode(candidate_frames(result), count)
+
+
+async def extract_thumbnails_async(runner, video_file, duration, count=THUMBNAIL_COUNT, timeout=30):
+    """extract_thumbnails() on a MediaProcessRunner, with the NumPy/Pillow work off the event loop"""
+    probe = await runner.run(PROBE_KEYFRAMES_ARGS + [video_file], timeout=timeout, operation='probe_keyframes')
+    keyframes_only = keyframes_suffice(probe, count)
+    result = await runner.run(candidate_command(video_file, duration, keyframes_only), timeout=timeout,
+                              operation='extract_keyframes' if keyframes_only else 'extract_frames')
+    return await asyncio.to_thread(pick_and_encode, candidate_frames(result), count)
+
+
+class FrameTee:
+    """Extract thumbnails from a video while it is still being downloaded
+
+    Chunks passed to write() are piped into ffmpeg, so candidate frames are
+    decoded by the time the download finishes. Inputs that cannot be decoded
+    from a pipe (MP4 files with the moov atom at the end) make finish() return
+    None and the caller falls back to extract_thumbnails().
+    """
+
+    def __init__(self, duration, count=THUMBNAIL_COUNT):
+        self.count = count
+        self.closed = False
+        self.started_at = time.perf_counter()
+        self._stdout = []
+        self._stderr = []
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-v', 'error'] + FAST_DECODE_ARGS + ['-i', 'pipe:0'] + candidate_output_args(duration),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        # Drain both pipes so ffmpeg never blocks on a full stdout/stderr buffer
+        self._readers = [
+            threading.Thread(target=self._drain, args=(self.process.stdout, self._stdout), daemon=True),
+            threading.Thread(target=self._drain, args=(self.process.stderr, self._stderr), daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    @staticmethod
+    def _drain(pipe, sink):
+        for chunk in iter(lambda: pipe.read(65536), b''):
+            sink.append(chunk)
+
+    def write(self, chunk):
+        if self.closed:
+            return
+        try:
+            self.process.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            # FFmpeg exits on its own once it has every frame (or gives up)
+            self.closed = True
+
+    def finish(self, timeout=30):
+        """Wait for ffmpeg and return the thumbnails, or None if the stream could not be decoded"""
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+            logger.error("FFmpeg timeout - streamed frame extraction took too long")
+            return None
+        finally:
+            for reader in self._readers:
+                reader.join()
+            FFMPEG_SECONDS.observe(time.perf_counter() - self.started_at, operation='tee_frames')
+
+        data = b''.join(self._stdout)
+        if self.process.returncode != 0 or not data:
+            logger.info(f"Streamed frame extraction failed: {b''.join(self._stderr).decode(errors='replace').strip()}")
+            return None
+        return pick_and_encode(split_ppm_stream(data), self.count)
+
+    def abort(self):
+        """Kill ffmpeg when the download fails midway"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.finish()
+
+
+PROBE_DURATION_ARGS = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                       '-of', 'default=noprint_wrappers=1:nokey=1']
+
+
+def probe_duration(video_file, timeout=10):
+    """Read the container duration with ffprobe, for sources without yt-dlp metadata"""
+    with FFMPEG_SECONDS.time(operation='probe'):
+        result = subprocess.run(PROBE_DURATION_ARGS + [video_file], capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip())
+
+
+async def probe_duration_async(runner, video_file, timeout=10):
+    """probe_duration() on a MediaProcessRunner"""
+    result = await runner.run(PROBE_DURATION_ARGS + [video_file], timeout=timeout, operation='probe')
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.decode().strip())
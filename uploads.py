@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+import re
+import time
+
+import httpx
+from telegram.error import BadRequest, ChatMigrated, Conflict, Forbidden, InvalidToken, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
+
+from metrics import UPLOAD_ATTEMPTS, UPLOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# PTB reports HTTP errors it has no exception for as "<description> (<status>)"
+STATUS_SUFFIX = re.compile(r'\((\d{3})\)$')
+
+# Outcomes of a failed attempt
+RETRY_AFTER = 'retry_after'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+
+class UploadDeadlineError(Exception):
+    """Raised when an upload cannot finish before its job's deadline"""
+
+
+def classify_upload_error(error):
+    """Map a Bot API exception to RETRY_AFTER, TRANSIENT (timeouts, 5xx) or PERMANENT"""
+    if isinstance(error, RetryAfter):
+        return RETRY_AFTER
+    # BadRequest and friends subclass NetworkError, so they are checked first
+    if isinstance(error, (BadRequest, Forbidden, InvalidToken, Conflict, ChatMigrated)):
+        return PERMANENT
+    if isinstance(error, NetworkError):
+        status = STATUS_SUFFIX.search(str(error))
+        if status and int(status.group(1)) < 500:
+            return PERMANENT  # e.g. 413 Request Entity Too Large
+        return TRANSIENT
+    return PERMANENT
+
+
+def make_bot_request(pool_size, connect_timeout=10, read_timeout=60, write_timeout=120):
+    """HTTPX request for the Bot API, with a pool sized to the jobs that upload at once
+
+    Media uploads use ``write_timeout`` too: a 40 MB video needs far longer
+    than PTB's 20 s default on a modest uplink.
+    """
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        write_timeout=write_timeout,
+        media_write_timeout=write_timeout,
+        # Waiting for a free connection is bounded by the job's deadline instead
+        pool_timeout=connect_timeout
+    )
+
+
+def probe_local_bot_api(base_url, token, timeout=5):
+    """True if a telegram-bot-api server at base_url answers getMe for this bot
+
+    Runs before the Application is built, so a missing or misconfigured
+    server falls back to the public Bot API instead of failing every call.
+    """
+    try:
+        response = httpx.get(f"{base_url.rstrip('/')}/bot{token}/getMe", timeout=timeout)
+        payload = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning(f"Local Bot API server at {base_url} did not answer getMe: {e}")
+        return False
+    if not payload.get('ok'):
+        # E.g. the bot is still logged in to the cloud API (it must call logOut there first)
+        logger.warning(f"Local Bot API server at {base_url} refused getMe: {payload.get('description')}")
+        return False
+    return True
+
+
+class Uploader:
+    """Sends media to the Bot API, retrying what is worth retrying within a deadline
+
+    ``send`` callables are invoked once per attempt and must re-send the same
+    media (a rewindable handle, a file_id or a local path), so a retry never
+    goes back to Instagram. RetryAfter waits as long as Telegram asks; timeouts and 5xx
+    back off exponentially with jitter; anything else fails at once.
+    """
+
+    def __init__(self, max_attempts=4, deadline=300, base_delay=1.0, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def deadline_from_now(self):
+        """Deadline (monotonic time) for all the uploads of a job starting now"""
+        return time.monotonic() + self.deadline
+
+    async def send(self, send, kind, deadline=None):
+        """Run ``send()`` until it succeeds, fails permanently or runs out of attempts or time"""
+        deadline = deadline or self.deadline_from_now()
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                UPLOAD_ATTEMPTS.inc(kind=kind, outcome='deadline')
+                raise UploadDeadlineError(f"{kind} upload ran out of time after {attempt - 1} attempts")
+
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(send(), remaining)
+            except asyncio.TimeoutError:
+                UPLOAD_ATTEMPTS.inc(kind=kind, outcome='deadline')
+                raise UploadDeadlineError(f"{kind} upload did not finish before the deadline")
+            except Exception as e:
+                outcome = classify_upload_error(e)
+                if outcome == RETRY_AFTER:
+                    delay = float(e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds')
+                                  else e.retry_after)
+                else:
+                    delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                if outcome == PERMANENT or attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+                    UPLOAD_ATTEMPTS.inc(kind=kind, outcome='failed')
+                    raise
+                UPLOAD_ATTEMPTS.inc(kind=kind, outcome=outcome)
+                logger.warning(f"{kind} upload attempt {attempt} failed ({outcome}: {e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            UPLOAD_ATTEMPTS.inc(kind=kind, outcome='success')
+            UPLOAD_SECONDS.observe(time.perf_counter() - started, kind=kind)
+            return result
@@ -0,0 +1,154 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    """Durable SQLite job queue shared between the update process and worker processes
+
+    Jobs are keyed by Telegram update_id, so an update that is delivered twice
+    is only enqueued once. Workers claim jobs with a lease; a job whose worker
+    dies before acking it becomes claimable again once the lease runs out
+    (at-least-once delivery), up to ``max_attempts`` times. Handlers record
+    what they already delivered with ``mark_sent`` so that a retry doesn't
+    send it twice.
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                update_id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL NOT NULL DEFAULT 0,
+                worker TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sent (
+                update_id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (update_id, key)
+            )
+        """)
+
+    def enqueue(self, update_id, kind, payload):
+        """Add a job; returns False if this update was already enqueued"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO jobs (update_id, kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (update_id, kind, json.dumps(payload), now, now)
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, worker):
+        """Lease the oldest runnable job to a worker, returning (update_id, kind, payload) or None"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT update_id, kind, payload FROM jobs
+                    WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?))
+                      AND attempts < ?
+                    ORDER BY created_at LIMIT 1
+                    """,
+                    (now, self.max_attempts)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        """
+                        UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                            lease_until = ?, worker = ?, updated_at = ?
+                        WHERE update_id = ?
+                        """,
+                        (now + self.lease_seconds, worker, now, row[0])
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        if not row:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def ack(self, update_id):
+        """Mark a job as done so it is never handed out again"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', updated_at = ? WHERE update_id = ?",
+                (time.time(), update_id)
+            )
+
+    def fail(self, update_id, error):
+        """Put a job back in the queue, or park it as failed once it ran out of attempts
+
+        Returns whether the job will be retried.
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                    error = ?, lease_until = 0, updated_at = ?
+                WHERE update_id = ?
+                """,
+                (self.max_attempts, str(error), time.time(), update_id)
+            )
+            row = self._conn.execute('SELECT status FROM jobs WHERE update_id = ?', (update_id,)).fetchone()
+        return bool(row) and row[0] == 'queued'
+
+    def mark_sent(self, update_id, key):
+        """Record that a job delivered ``key`` (e.g. a reel URL) to the user"""
+        with self._lock:
+            self._conn.execute('INSERT OR IGNORE INTO sent (update_id, key) VALUES (?, ?)', (update_id, key))
+
+    def was_sent(self, update_id, key):
+        """Whether an earlier attempt at a job already delivered ``key``"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM sent WHERE update_id = ? AND key = ?', (update_id, key)
+            ).fetchone() is not None
+
+    def depth(self):
+        """Number of jobs waiting for a worker"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def purge(self, older_than=86400):
+        """Forget finished jobs; their update ids are long past Telegram's redelivery window"""
+        cutoff = time.time() - older_than
+        with self._lock:
+            # Jobs whose last lease expired with no attempts left count as finished too
+            cursor = self._conn.execute(
+                """
+                DELETE FROM jobs WHERE updated_at < ? AND (
+                    status IN ('done', 'failed') OR (status = 'running' AND lease_until < ?)
+                )
+                """,
+                (cutoff, cutoff)
+            )
+            self._conn.execute('DELETE FROM sent WHERE update_id NOT IN (SELECT update_id FROM jobs)')
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()